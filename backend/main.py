@@ -1,17 +1,26 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, WebSocket, WebSocketDisconnect, Form, Form
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect, Request, Response
+from typing import Optional
 from fastapi.middleware.cors import CORSMiddleware
 import os
-import tempfile
 import logging
+import orjson
 from dotenv import load_dotenv
 
+# Load environment variables before importing the services:
+# their module-level singletons and settings read os.environ when imported
+load_dotenv()
+
 from services.transcription import TranscriptionService
 from services.analysis import AnalysisService
 from services.progress_manager import progress_manager
-from models.schemas import AnalysisResponse
-
-# Load environment variables
-load_dotenv()
+from services.upload import receive_multipart_upload, get_content_length, UploadTooLargeError, UploadFormError
+from services.job_manager import JobManager, JobQueueFullError
+from services.http_clients import http_clients
+from services.asr_backends import get_asr_backend
+from services.audio_workers import audio_workers
+from services.json_response import json_response_encoder
+from services.metrics import metrics_registry, stage_timer, jobs_in_flight
+from models.schemas import AnalysisResponse, SessionResponse, JobSubmitResponse, JobStatusResponse
 
 # Configure logging
 logging.basicConfig(
@@ -33,8 +42,28 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Session-Id"],
 )
 
+# Upload size limit (1GB)
+MAX_UPLOAD_SIZE = 1024 * 1024 * 1024
+
+# Accepted audio content types
+ALLOWED_CONTENT_TYPES = ["audio/mpeg", "audio/wav", "audio/mp4", "audio/m4a"]
+
+# Analysis response modes (compact omits the duplicated transcription.full_text)
+RESPONSE_MODES = ["full", "compact"]
+
+def upload_form_openapi(*fields: str) -> dict:
+    """
+    本文を自前で受信するアップロードAPIのリクエスト定義（OpenAPI用のmultipart/form-dataの項目）
+    アップロード中の進捗に使うため、テキストの項目はaudio_fileより前に送る
+    """
+    properties = {name: {"type": "string"} for name in fields}
+    properties["audio_file"] = {"type": "string", "format": "binary"}
+    schema = {"type": "object", "required": ["audio_file"], "properties": properties}
+    return {"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": schema}}}}
+
 # Initialize services
 transcription_service = TranscriptionService()
 analysis_service = AnalysisService()
@@ -47,11 +76,42 @@ async def root():
 async def health_check():
     return {"status": "healthy"}
 
+@app.get("/metrics")
+async def metrics():
+    """
+    処理段ごとの所要時間・実行中のジョブ数・キューの長さ・リトライ数・上流への送信バイト数（Prometheusのテキスト形式）
+    """
+    return Response(content=metrics_registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.post("/sessions", response_model=SessionResponse)
+async def create_session():
+    """
+    進捗配信用のセッションIDを発行する
+    発行したIDで /ws/{session_id} に接続し、同じIDを /analyze に渡す
+    """
+    session_id = await progress_manager.create_session()
+    return SessionResponse(session_id=session_id, websocket_url=f"/ws/{session_id}")
+
+async def resolve_session_id(session_id: Optional[str]) -> str:
+    """
+    リクエストのセッションIDを決める
+    POST /sessions で発行したID以外（未指定・"default"・クライアントが決めたID）は受け付けず、
+    他の利用者の進捗を受け取れないようにサーバー側で新しいIDを発行する
+    """
+    if session_id and await progress_manager.has_session(session_id):
+        return session_id
+    if session_id and session_id != "default":
+        logger.warning(f"Unknown session id from client, issuing a new one: {session_id}")
+    return await progress_manager.create_session()
+
 @app.websocket("/ws/{session_id}")
 async def websocket_endpoint(websocket: WebSocket, session_id: str):
-    print(f"🔌 [WEBSOCKET] 接続要求: {session_id}")
+    if not await progress_manager.has_session(session_id):
+        # 発行していないIDへの接続は拒否する（他の利用者のIDを推測しても進捗は受け取れない）
+        logger.warning(f"Rejected websocket for unknown session: {session_id}")
+        await websocket.close(code=1008)
+        return
     await websocket.accept()
-    print(f"✅ [WEBSOCKET] 接続確立: {session_id}")
     await progress_manager.add_connection(session_id, websocket)
 
     try:
@@ -59,49 +119,39 @@ async def websocket_endpoint(websocket: WebSocket, session_id: str):
             # Keep connection alive
             await websocket.receive_text()
     except WebSocketDisconnect:
-        print(f"🔌 [WEBSOCKET] 切断: {session_id}")
         await progress_manager.remove_connection(session_id, websocket)
 
-@app.post("/debug_transcription")
-async def debug_transcription(audio_file: UploadFile = File(...), session_id: str = Form("default")):
+@app.post("/debug_transcription", openapi_extra=upload_form_openapi("session_id", "asr_backend"))
+async def debug_transcription(request: Request):
     """
     デバッグ用: 文字起こしのみを実行（分析なし）
+    フォーム項目（audio_file, session_id, asr_backend）は /analyze と同じ
     """
-    logger.info(f"DEBUG: Received file: {audio_file.filename}, type: {audio_file.content_type}")
-
-    # 進捗開始
-    print(f"🚀 [PROGRESS] 5% - ファイルアップロード完了 (ファイル: {audio_file.filename})")
-    await progress_manager.update_progress(session_id, "upload", 5, "ファイルアップロード完了")
-
-    # ファイル検証（簡略化）
-    content = await audio_file.read()
-    logger.info(f"DEBUG: File size: {len(content)} bytes")
-
-    await progress_manager.update_progress(session_id, "validation", 10, "ファイル検証完了")
+    # ファイル検証（簡略化）: 形式は確認せず、ストリーミングでディスクへ書き出す
+    upload, session_id = await receive_audio_upload(request, default_suffix=".wav", check_content_type=False)
+    temp_file_path, file_size, source_hash = upload.path, upload.size, upload.sha256
+    asr_backend = upload.fields.get("asr_backend")
+    logger.info(f"DEBUG: Received file: {upload.filename}, type: {upload.content_type}")
+    logger.info(f"DEBUG: File size: {file_size} bytes")
 
     try:
-        # 一時ファイルに保存
-        file_extension = ".wav"
-        if audio_file.filename:
-            file_extension = os.path.splitext(audio_file.filename)[1] or ".wav"
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as temp_file:
-            temp_file.write(content)
-            temp_file_path = temp_file.name
-
         try:
             logger.info("DEBUG: Starting transcription...")
             # 文字起こしのみ実行
-            transcription_result = await transcription_service.transcribe(temp_file_path, session_id)
+            transcription_result = await transcription_service.transcribe(
+                temp_file_path, session_id, source_hash=source_hash, asr_backend=asr_backend
+            )
             logger.info("DEBUG: Transcription completed")
 
             await progress_manager.update_progress(session_id, "completed", 100, "文字起こし完了！")
 
             return {
                 "success": True,
+                "session_id": session_id,
                 "transcription": transcription_result.full_text,
                 "segment_count": len(transcription_result.segments),
-                "debug_info": f"Processed {len(transcription_result.segments)} segments"
+                "debug_info": f"Processed {len(transcription_result.segments)} segments",
+                "chunk_report": transcription_result.chunk_report
             }
 
         finally:
@@ -117,94 +167,296 @@ async def debug_transcription(audio_file: UploadFile = File(...), session_id: st
             detail=f"Transcription failed: {str(e)}"
         )
 
-@app.post("/analyze")
-async def analyze_audio(audio_file: UploadFile = File(...), session_id: str = Form("default")):
+def validate_asr_backend(asr_backend: Optional[str]):
     """
-    音声ファイルを受け取り、文字起こしと分析を実行する
+    リクエストで指定された音声認識エンジンが使えるか確認する（使えなければ400）
     """
-    print(f"📥 [REQUEST] リクエスト受信: {audio_file.filename} (セッション: {session_id})")
-    logger.info(f"Received file: {audio_file.filename}, type: {audio_file.content_type}")
-
-    # 進捗開始
-    await progress_manager.update_progress(session_id, "upload", 5, "ファイルアップロード完了")
+    try:
+        get_asr_backend(asr_backend)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    # Validate file type
-    allowed_types = ["audio/mpeg", "audio/wav", "audio/mp4", "audio/m4a"]
-    if audio_file.content_type not in allowed_types:
-        logger.error(f"Unsupported file type: {audio_file.content_type}")
-        await progress_manager.update_progress(session_id, "error", 0, f"未対応のファイル形式: {audio_file.content_type}")
+def validate_response_mode(response_mode: str):
+    """
+    レスポンス形式（full / compact）を確認する（不正なら400）
+    """
+    if response_mode not in RESPONSE_MODES:
         raise HTTPException(
             status_code=400,
-            detail=f"Unsupported file type: {audio_file.content_type}"
+            detail=f"Unknown response_mode: {response_mode} (available: {', '.join(RESPONSE_MODES)})"
+        )
+
+async def render_analysis_response(request: Request, result: AnalysisResponse, response_mode: str = "full"):
+    """
+    分析結果をレスポンス形式に合わせて出力する（orjson＋Accept-Encodingに応じた圧縮）
+    compactではfull_transcriptionと同じ内容のtranscription.full_textを省き、全文を1回だけ送る
+    """
+    exclude = {"transcription": {"full_text"}} if response_mode == "compact" else None
+    return await json_response_encoder.respond(request, result, exclude=exclude)
+
+def validate_upload_fields(fields: dict):
+    """
+    アップロードと一緒に送られたフォーム項目（asr_backend / response_mode）を確認する（不正なら400）
+    """
+    validate_asr_backend(fields.get("asr_backend"))
+    validate_response_mode(fields.get("response_mode", "full"))
+
+async def receive_audio_upload(request: Request, session_id: Optional[str] = None, default_suffix: str = ".mp3",
+                               check_content_type: bool = True):
+    """
+    multipart/form-dataの本文を受信しながら形式を検証し、audio_fileをストリーミングで一時ファイルへ書き出す
+    Content-Lengthが上限を超えるリクエストは本文を読む前に、受信中に上限を超えたらその時点で拒否する
+    session_idを渡さなければ、audio_fileより前に送られたフォーム項目のsession_idから決める
+    戻り値: (StreamedUpload, セッションID)
+    """
+    expected_size = get_content_length(request)
+    resolved = {"session_id": session_id, "fields": None}
+
+    async def start_upload(fields: dict, filename: str, content_type: str):
+        # ファイルの本文を受け取る前に、セッションIDとフォーム項目・形式を確認する
+        resolved["fields"] = fields
+        if resolved["session_id"] is None:
+            resolved["session_id"] = await resolve_session_id(fields.get("session_id"))
+        current_session_id = resolved["session_id"]
+        logger.info(f"Receiving file: {filename}, type: {content_type} (session {current_session_id})")
+        validate_upload_fields(fields)
+
+        # Validate file type
+        if check_content_type and content_type not in ALLOWED_CONTENT_TYPES:
+            logger.error(f"Unsupported file type: {content_type}")
+            await progress_manager.update_progress(current_session_id, "error", 0, f"未対応のファイル形式: {content_type}")
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported file type: {content_type}"
+            )
+
+        # 進捗開始
+        await progress_manager.update_progress(current_session_id, "upload", 5, "ファイル受信中...")
+
+    async def report_upload(bytes_written: int):
+        # 書き出し済みのバイト数で5%〜10%を進める（Content-Lengthが不明なら5%のまま）
+        ratio = min(1.0, bytes_written / expected_size) if expected_size else 0.0
+        total_text = f"/{expected_size/1024/1024:.0f}" if expected_size else ""
+        await progress_manager.update_progress(
+            resolved["session_id"], "upload", 5 + int(ratio * 5),
+            f"ファイル受信中... ({bytes_written/1024/1024:.0f}{total_text}MB)",
+            details={"bytes_written": bytes_written, "bytes_total": expected_size}
+        )
+
+    async def report_error(message: str):
+        if resolved["session_id"] is not None:
+            await progress_manager.update_progress(resolved["session_id"], "error", 0, message)
+
+    # Stream the request body to disk while enforcing the size limit (1GB)
+    try:
+        upload = await receive_multipart_upload(
+            request, "audio_file", MAX_UPLOAD_SIZE, default_suffix=default_suffix,
+            on_file_start=start_upload, on_progress=report_upload
         )
-    
-    # Validate file size (1GB limit)
-    max_size = 1024 * 1024 * 1024  # 1GB
-    print(f"📖 [REQUEST] ファイル読み込み中...")
-    content = await audio_file.read()
-    print(f"✅ [REQUEST] ファイル読み込み完了: {len(content)} bytes ({len(content)/1024/1024:.1f}MB)")
-    logger.info(f"File size: {len(content)} bytes")
-
-    if len(content) > max_size:
-        logger.error(f"File size exceeds limit: {len(content)} bytes")
-        await progress_manager.update_progress(session_id, "error", 0, "ファイルサイズが1GB制限を超えています")
+    except UploadTooLargeError:
+        logger.error(f"File size exceeds limit: {MAX_UPLOAD_SIZE} bytes")
+        await report_error("ファイルサイズが1GB制限を超えています")
         raise HTTPException(
             status_code=400,
             detail="File size exceeds 1GB limit"
         )
+    except UploadFormError as e:
+        logger.error(f"Invalid upload: {e}")
+        await report_error(f"アップロードエラー: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # audio_fileより後に送られたフォーム項目も確認する（セッションIDには使えない）
+    if session_id is None and "session_id" in upload.fields and "session_id" not in resolved["fields"]:
+        logger.warning("session_id was sent after audio_file and was ignored")
+    try:
+        validate_upload_fields(upload.fields)
+    except HTTPException:
+        os.unlink(upload.path)
+        raise
+
+    current_session_id = resolved["session_id"]
+    logger.info(f"File size: {upload.size} bytes")
+
+    await progress_manager.update_progress(current_session_id, "validation", 10, "ファイル検証完了")
 
-    print(f"🔍 [PROGRESS] 10% - ファイル検証完了 (サイズ: {len(content)/1024/1024:.1f}MB)")
-    await progress_manager.update_progress(session_id, "validation", 10, "ファイル検証完了")
-    
+    return upload, current_session_id
+
+async def run_analysis_pipeline(temp_file_path: str, session_id: str, source_hash: str = None,
+                                asr_backend: str = None) -> AnalysisResponse:
+    """
+    文字起こし→分析のパイプライン（/analyze とジョブワーカーで共通）
+    """
+    jobs_in_flight.inc()
     try:
-        # Save uploaded file temporarily with correct extension
-        file_extension = ".mp3"  # Default to mp3
-        if audio_file.filename:
-            file_extension = os.path.splitext(audio_file.filename)[1] or ".mp3"
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as temp_file:
-            temp_file.write(content)
-            temp_file_path = temp_file.name
-        
-        try:
-            print(f"🎤 [PROGRESS] 15% - 音声の文字起こしを開始...")
-            await progress_manager.update_progress(session_id, "transcription", 15, "音声の文字起こしを開始...")
-            logger.info("Starting transcription...")
-            # Step 1: Transcribe audio to text
-            transcription_result = await transcription_service.transcribe(temp_file_path, session_id)
-            print(f"✅ [PROGRESS] 78% - 音声認識完了 (セグメント数: {len(transcription_result.segments)})")
-            logger.info("Transcription completed")
-
-            print(f"🤖 [PROGRESS] 80% - AI分析を開始...")
-            await progress_manager.update_progress(session_id, "analysis", 80, "AI分析を開始...")
-            logger.info("Starting analysis...")
-            # Step 2: Analyze transcription with Groq API
-            analysis_result = await analysis_service.analyze(transcription_result)
-            print(f"🎉 [PROGRESS] 100% - 分析完了！")
-            logger.info("Analysis completed")
-
-            await progress_manager.update_progress(session_id, "completed", 100, "分析完了！")
-
-            return AnalysisResponse(
-                success=True,
-                analysis=analysis_result,
-                transcription=transcription_result,
-                full_transcription=transcription_result.full_text
-            )
-            
-        finally:
-            # Clean up temporary file
-            if os.path.exists(temp_file_path):
-                os.unlink(temp_file_path)
-                
+        with stage_timer("pipeline"):
+            return await _run_analysis_pipeline(temp_file_path, session_id, source_hash, asr_backend)
+    finally:
+        jobs_in_flight.dec()
+
+async def _run_analysis_pipeline(temp_file_path: str, session_id: str, source_hash: str = None,
+                                 asr_backend: str = None) -> AnalysisResponse:
+    try:
+        await progress_manager.update_progress(session_id, "transcription", 15, "音声の文字起こしを開始...")
+        logger.info("Starting transcription...")
+        # Step 1: Transcribe audio to text
+        transcription_result = await transcription_service.transcribe(
+            temp_file_path, session_id, source_hash=source_hash, asr_backend=asr_backend
+        )
+        logger.info(f"Transcription completed: {len(transcription_result.segments)} segments")
+
+        await progress_manager.update_progress(session_id, "analysis", 80, "AI分析を開始...")
+        logger.info("Starting analysis...")
+        # Step 2: Analyze transcription with Groq API
+        analysis_result = await analysis_service.analyze(transcription_result, session_id)
+        logger.info("Analysis completed")
+
+        await progress_manager.update_progress(session_id, "completed", 100, "分析完了！")
+
+        # サービス側で組み立てた検証済みの値なので、再検証せずにモデルを作る
+        return AnalysisResponse.model_construct(
+            success=True,
+            analysis=analysis_result,
+            transcription=transcription_result,
+            full_transcription=transcription_result.full_text
+        )
+
     except Exception as e:
         logger.error(f"Analysis failed: {str(e)}", exc_info=True)
         await progress_manager.update_progress(session_id, "error", 0, f"分析エラー: {str(e)}")
+        raise
+
+# Background job queue for the asynchronous job API
+job_manager = JobManager(run_analysis_pipeline)
+
+@app.on_event("startup")
+async def on_startup():
+    # Shared pooled HTTP clients for Groq / OpenAI, then the job workers
+    await http_clients.startup()
+    await progress_manager.start()
+    # ジョブの状態と結果は進捗と同じ配信バス（PROGRESS_BUS=redisなら全プロセス）で共有する
+    await job_manager.start(progress_manager.bus)
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await job_manager.stop()
+    await progress_manager.stop()
+    await http_clients.shutdown()
+    audio_workers.shutdown()
+
+@app.post("/analyze", openapi_extra=upload_form_openapi("session_id", "asr_backend", "response_mode"))
+async def analyze_audio(request: Request):
+    """
+    音声ファイル（multipart/form-dataのaudio_file）を受け取り、文字起こしと分析を実行する
+    本文はFastAPIのフォーム解析を通さず、受信しながら一時ファイルへ書き出す
+    進捗を受け取る場合は POST /sessions で発行したIDをsession_idに渡す（audio_fileより前に送る）
+    asr_backendで音声認識エンジン（openai / local）を指定できる
+    response_mode=compactで重複する全文（transcription.full_text）を省く
+    """
+    upload, session_id = await receive_audio_upload(request)
+    temp_file_path, source_hash = upload.path, upload.sha256
+    asr_backend = upload.fields.get("asr_backend")
+    response_mode = upload.fields.get("response_mode", "full")
+
+    try:
+        result = await run_analysis_pipeline(temp_file_path, session_id, source_hash, asr_backend=asr_backend)
+        response = await render_analysis_response(request, result, response_mode)
+        # 実際に使ったセッションID（サーバー側で発行し直した場合にクライアントが知れるように）
+        response.headers["X-Session-Id"] = session_id
+        return response
+
+    except Exception as e:
         raise HTTPException(
             status_code=500,
             detail=f"Analysis failed: {str(e)}"
         )
 
+    finally:
+        # Clean up temporary file
+        if os.path.exists(temp_file_path):
+            os.unlink(temp_file_path)
+
+async def build_job_status(job) -> JobStatusResponse:
+    """
+    ジョブの状態と最新の進捗をまとめる（別のプロセスで実行中のジョブは配信バスに保存された進捗）
+    """
+    progress = progress_manager.get_progress(job.job_id)
+    if progress is None:
+        frame = await progress_manager.bus.get_state(job.job_id)
+        progress = orjson.loads(frame) if frame is not None else {}
+    return JobStatusResponse(
+        job_id=job.job_id,
+        status=job.status,
+        stage=progress.get("stage"),
+        progress=progress.get("progress"),
+        message=progress.get("message"),
+        details=progress.get("details"),
+        error=job.error,
+        created_at=job.created_at,
+        updated_at=job.updated_at
+    )
+
+@app.post("/jobs", status_code=202, response_model=JobSubmitResponse,
+          openapi_extra=upload_form_openapi("asr_backend"))
+async def submit_job(request: Request):
+    """
+    音声ファイル（multipart/form-dataのaudio_file）を受け取り、分析ジョブをキューに登録してすぐに返す
+    進捗は /ws/{job_id} 、結果は /jobs/{job_id}/result で取得する
+    """
+    # ジョブIDを先にセッションIDとして発行し、アップロード中の進捗も同じIDで配信する
+    job_id = await progress_manager.create_session()
+    upload, _ = await receive_audio_upload(request, job_id)
+    temp_file_path, source_hash = upload.path, upload.sha256
+    asr_backend = upload.fields.get("asr_backend")
+    logger.info(f"Job upload: {upload.filename}, type: {upload.content_type}")
+
+    try:
+        job = await job_manager.submit(
+            temp_file_path, source_hash, upload.filename, job_id=job_id, asr_backend=asr_backend
+        )
+    except JobQueueFullError as e:
+        os.unlink(temp_file_path)
+        raise HTTPException(status_code=503, detail=str(e))
+
+    await progress_manager.update_progress(job.job_id, "queued", 10, "ジョブを受け付けました")
+
+    return JobSubmitResponse(
+        job_id=job.job_id,
+        status=job.status,
+        status_url=f"/jobs/{job.job_id}",
+        result_url=f"/jobs/{job.job_id}/result",
+        websocket_url=f"/ws/{job.job_id}"
+    )
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job_status(job_id: str):
+    """
+    ジョブの状態を返す
+    """
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return await build_job_status(job)
+
+@app.get("/jobs/{job_id}/result")
+async def get_job_result(job_id: str, request: Request, response: Response, response_mode: str = "full"):
+    """
+    完了したジョブの分析結果を返す（未完了なら202で状態を返す）
+    response_mode=compactで重複する全文（transcription.full_text）を省く
+    """
+    validate_response_mode(response_mode)
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    if job.status == "failed":
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {job.error}")
+
+    if job.status != "completed":
+        response.status_code = 202
+        return await build_job_status(job)
+
+    return await render_analysis_response(request, job.result, response_mode)
+
 if __name__ == "__main__":
     import uvicorn
     import sys
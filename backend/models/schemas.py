@@ -1,18 +1,81 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from functools import cached_property
+from pydantic import BaseModel, ConfigDict, WithJsonSchema, computed_field, field_serializer, field_validator
+from typing import Annotated, Dict, List, Optional, Union
+from models.transcript_store import SegmentStore
 
-class TranscriptionSegment(BaseModel):
-    start: float
-    end: float
-    text: str
+# SegmentStoreの入出力の形（OpenAPI・response_model用）: [{"start", "end", "text"}, ...]
+SEGMENT_LIST_JSON_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "title": "TranscriptionSegment",
+        "properties": {
+            "start": {"type": "number", "title": "Start"},
+            "end": {"type": "number", "title": "End"},
+            "text": {"type": "string", "title": "Text"},
+        },
+        "required": ["start", "end", "text"],
+    },
+}
+
+class ChunkReport(BaseModel):
+    total: int
+    reused: List[int] = []      # 区間キャッシュから再利用した区間
+    recomputed: List[int] = []  # 今回文字起こしした区間
+    failed: List[int] = []      # 失敗した区間（再実行で再処理される）
+    pipeline: Dict[str, Dict[str, Union[int, float]]] = {}  # 段ごとの同時実行数・キュー長・待ち時間の統計（チューニング用）
 
 class TranscriptionResult(BaseModel):
-    segments: List[TranscriptionSegment]
-    full_text: str
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    # 列指向で保持し、レスポンスでは [{"start", "end", "text"}] として出力する
+    segments: Annotated[SegmentStore, WithJsonSchema(SEGMENT_LIST_JSON_SCHEMA)]
+    chunk_report: Optional[ChunkReport] = None  # 分割処理時のみ
+
+    @field_validator("segments", mode="before")
+    @classmethod
+    def _to_segment_store(cls, value):
+        if isinstance(value, SegmentStore):
+            return value
+        return SegmentStore.from_segments(value)
+
+    @field_serializer("segments")
+    def _serialize_segments(self, segments: SegmentStore):
+        return segments.to_list()
+
+    @computed_field
+    @cached_property
+    def full_text(self) -> str:
+        """
+        タイムスタンプ付きの全文（初回参照時に組み立てる）
+        """
+        return self.segments.render_full_text()
 
 class AnalysisResponse(BaseModel):
     success: bool
     analysis: str
     transcription: Optional[TranscriptionResult] = None
-    full_transcription: str = ""  # 全文の文字起こし
+    full_transcription: str = ""  # 全文の文字起こし（response_mode=compactではtranscription.full_textを省く）
+    error: Optional[str] = None
+
+class SessionResponse(BaseModel):
+    session_id: str
+    websocket_url: str  # 進捗WebSocket
+
+class JobSubmitResponse(BaseModel):
+    job_id: str
+    status: str
+    status_url: str
+    result_url: str
+    websocket_url: str  # 進捗WebSocket（セッションID = job_id）
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    status: str  # queued / running / completed / failed
+    stage: Optional[str] = None
+    progress: Optional[int] = None
+    message: Optional[str] = None
+    details: Optional[dict] = None  # 実測の進捗（処理済みの音声秒数・処理速度・残り時間など）
     error: Optional[str] = None
+    created_at: float
+    updated_at: float
@@ -0,0 +1,115 @@
+from typing import NamedTuple
+import numpy as np
+
+# 文字起こしができなかった場合の全文
+EMPTY_TRANSCRIPT_TEXT = "【00:00:00】音声の文字起こしができませんでした"
+
+
+class Segment(NamedTuple):
+    """
+    SegmentStoreから取り出した1発話（start・end・textの属性で読める）
+    """
+    start: float
+    end: float
+    text: str
+
+
+def format_timestamp(seconds: float) -> str:
+    """
+    秒数をHH:MM:SS形式に変換
+    """
+    hours = int(seconds // 3600)
+    minutes = int((seconds % 3600) // 60)
+    seconds = int(seconds % 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+class SegmentStore:
+    """
+    発話列を列指向で保持する（開始・終了時刻のfloat配列＋全発話を連結した1本の文字列とオフセット）
+    発話ごとのオブジェクトや文字列を持たないため、数時間分の文字起こしでもメモリが小さい
+    """
+
+    __slots__ = ("starts", "ends", "offsets", "text")
+
+    def __init__(self, starts: np.ndarray, ends: np.ndarray, offsets: np.ndarray, text: str):
+        self.starts = starts
+        self.ends = ends
+        self.offsets = offsets  # i番目の発話は text[offsets[i]:offsets[i+1]]
+        self.text = text
+
+    @classmethod
+    def from_segments(cls, segments) -> "SegmentStore":
+        """
+        発話の辞書（{"start", "end", "text"}）または属性を持つオブジェクトの列から作る
+        """
+        starts, ends, texts = [], [], []
+        for segment in segments:
+            if isinstance(segment, dict):
+                starts.append(segment["start"])
+                ends.append(segment["end"])
+                texts.append(segment["text"])
+            else:
+                starts.append(segment.start)
+                ends.append(segment.end)
+                texts.append(segment.text)
+        return cls.from_columns(starts, ends, texts)
+
+    @classmethod
+    def from_columns(cls, starts, ends, texts) -> "SegmentStore":
+        lengths = np.fromiter((len(t) for t in texts), dtype=np.int64, count=len(texts))
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return cls(
+            np.asarray(starts, dtype=np.float64),
+            np.asarray(ends, dtype=np.float64),
+            offsets,
+            "".join(texts)
+        )
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def __bool__(self) -> bool:
+        return len(self.starts) > 0
+
+    def text_at(self, index: int) -> str:
+        return self.text[self.offsets[index]:self.offsets[index + 1]]
+
+    def __getitem__(self, index: int) -> Segment:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("segment index out of range")
+        return Segment(float(self.starts[index]), float(self.ends[index]), self.text_at(index))
+
+    def __iter__(self):
+        offsets = self.offsets.tolist()
+        for index, (start, end) in enumerate(zip(self.starts.tolist(), self.ends.tolist())):
+            yield Segment(start, end, self.text[offsets[index]:offsets[index + 1]])
+
+    def to_list(self) -> list:
+        """
+        APIレスポンス・キャッシュ用の [{"start", "end", "text"}, ...]
+        """
+        offsets = self.offsets.tolist()
+        text = self.text
+        return [
+            {"start": start, "end": end, "text": text[offsets[index]:offsets[index + 1]]}
+            for index, (start, end) in enumerate(zip(self.starts.tolist(), self.ends.tolist()))
+        ]
+
+    def render_full_text(self) -> str:
+        """
+        タイムスタンプ付きの全文（1発話1行）
+        """
+        if not self:
+            return EMPTY_TRANSCRIPT_TEXT
+        return "\n".join(f"【{format_timestamp(segment.start)}】{segment.text}" for segment in self)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        保持しているデータのおおよそのバイト数
+        """
+        return self.starts.nbytes + self.ends.nbytes + self.offsets.nbytes + len(self.text.encode("utf-8"))
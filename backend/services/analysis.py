@@ -1,61 +1,314 @@
 import os
+import json
+import time
+import asyncio
 import httpx
+from services.http_clients import http_clients
+from services.rate_limiter import groq_rate_limiter, retry_with_backoff, is_retryable_error
+from services.metrics import stage_timer, upstream_requests, upstream_bytes_sent
 from models.schemas import TranscriptionResult
 
+# 循環インポートを避けるため、必要時にインポート
+def get_progress_manager():
+    from services.progress_manager import progress_manager
+    return progress_manager
+
 class AnalysisService:
     def __init__(self):
         self.groq_api_key = os.getenv("GROQ_API_KEY")
         self.groq_api_url = os.getenv("GROQ_API_URL", "https://api.groq.com/openai/v1/chat/completions")
+        self.model = "meta-llama/llama-4-scout-17b-16e-instruct"
+        # 分析モード: auto（長さで判定）/ single（一括）/ map_reduce（分割）
+        self.analysis_mode = os.getenv("ANALYSIS_MODE", "auto").lower()
+        # 一括分析できる文字起こしの推定トークン数の上限
+        self.single_pass_token_limit = int(os.getenv("ANALYSIS_SINGLE_PASS_TOKEN_LIMIT", "20000"))
+        # 分割分析の1区間あたりのトークン予算
+        self.chunk_token_budget = int(os.getenv("ANALYSIS_CHUNK_TOKEN_BUDGET", "8000"))
+        # 1トークンあたりの文字数（トークン数の見積もり用）
+        self.chars_per_token = float(os.getenv("ANALYSIS_CHARS_PER_TOKEN", "1.0"))
+        # 分割分析で同時に送るリクエスト数
+        self.max_concurrency = max(1, int(os.getenv("ANALYSIS_MAX_CONCURRENCY", "3")))
+        # 最終レポートの生成をストリーミングで進捗WebSocketへ中継するか
+        self.stream_enabled = os.getenv("ANALYSIS_STREAM", "true").lower() == "true"
+        # 差分をまとめて送る間隔（秒）
+        self.stream_flush_interval = float(os.getenv("ANALYSIS_STREAM_FLUSH_INTERVAL", "0.1"))
     
-    async def analyze(self, transcription: TranscriptionResult) -> str:
+    async def analyze(self, transcription: TranscriptionResult, session_id: str = None) -> str:
         """
         Groq APIを使用してN1分析を実行する
+        長い文字起こしは区間ごとに抽出（map）してから最終レポートにまとめる（reduce）
+        session_idを指定すると最終レポートの生成中テキストを進捗WebSocketへ逐次送信する
         """
         print(f"🔍 [ANALYSIS] 分析開始 - 文字数: {len(transcription.full_text)}")
 
         if not self.groq_api_key:
             raise Exception("GROQ_API_KEY environment variable is not set")
-        
-        # 分析プロンプトを構築
-        print(f"📝 [ANALYSIS] プロンプト構築中...")
-        prompt = self._build_analysis_prompt(transcription.full_text)
-        
+
         try:
-            print(f"🌐 [ANALYSIS] Groq APIにリクエスト送信中...")
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    self.groq_api_url,
-                    headers={
-                        "Authorization": f"Bearer {self.groq_api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json={
-                        "messages": [
-                            {
-                                "role": "user",
-                                "content": prompt
-                            }
-                        ],
-                        "model": "meta-llama/llama-4-scout-17b-16e-instruct",
-                        "stream": False,
-                        "temperature": 0.1
-                    },
-                    timeout=300.0  # 5分のタイムアウト
-                )
+            on_delta = self._make_delta_sender(session_id)
 
-                if response.status_code != 200:
-                    print(f"❌ [ANALYSIS] Groq APIエラー: {response.status_code}")
-                    raise Exception(f"Groq API error: {response.status_code} - {response.text}")
+            if self._should_map_reduce(transcription.full_text):
+                return await self._analyze_map_reduce(transcription.full_text, on_delta)
 
-                result = response.json()
-                analysis_text = result["choices"][0]["message"]["content"]
+            # 分析プロンプトを構築
+            print(f"📝 [ANALYSIS] プロンプト構築中...")
+            with stage_timer("prompt_build"):
+                prompt = self._build_analysis_prompt(transcription.full_text)
+
+            analysis_text = await self._call_groq(prompt, on_delta)
+            print(f"✅ [ANALYSIS] 分析完了 - 結果文字数: {len(analysis_text)}")
+            return analysis_text
 
-                print(f"✅ [ANALYSIS] 分析完了 - 結果文字数: {len(analysis_text)}")
-                return analysis_text
-                
         except Exception as e:
             raise Exception(f"Analysis failed: {str(e)}")
-    
+
+    def _should_map_reduce(self, transcription_text: str) -> bool:
+        """
+        分析モードを決める（auto: 推定トークン数が上限を超えたら分割）
+        """
+        if self.analysis_mode == "map_reduce":
+            return True
+        if self.analysis_mode == "single":
+            return False
+        return self._estimate_tokens(transcription_text) > self.single_pass_token_limit
+
+    def _estimate_tokens(self, text: str) -> int:
+        """
+        文字数からトークン数を見積もる（日本語は概ね1文字1トークン前後）
+        """
+        return int(len(text) / self.chars_per_token)
+
+    def _split_transcript(self, transcription_text: str) -> list:
+        """
+        文字起こしを発話（行）の境界でトークン予算内の区間に分割する
+        """
+        chunks = []
+        current_lines = []
+        current_tokens = 0
+
+        for line in transcription_text.split("\n"):
+            line_tokens = self._estimate_tokens(line) + 1
+            if current_lines and current_tokens + line_tokens > self.chunk_token_budget:
+                chunks.append("\n".join(current_lines))
+                current_lines = []
+                current_tokens = 0
+            current_lines.append(line)
+            current_tokens += line_tokens
+
+        if current_lines:
+            chunks.append("\n".join(current_lines))
+
+        return chunks
+
+    def _make_delta_sender(self, session_id: str):
+        """
+        生成中テキストの差分を進捗WebSocketへ送るコールバックを作る（無効ならNone）
+        """
+        if not self.stream_enabled or not session_id:
+            return None
+
+        progress_manager = get_progress_manager()
+
+        async def send_delta(delta: str):
+            await progress_manager.send_analysis_delta(session_id, delta)
+
+        return send_delta
+
+    async def _analyze_map_reduce(self, transcription_text: str, on_delta=None) -> str:
+        """
+        区間ごとの抽出を並列実行し、抽出結果から最終レポートを生成する
+        """
+        with stage_timer("prompt_build"):
+            chunks = self._split_transcript(transcription_text)
+        print(f"🧩 [ANALYSIS] 分割分析モード: {len(chunks)}区間 (同時実行数: {self.max_concurrency})")
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        async def extract(index: int, chunk_text: str) -> str:
+            async with semaphore:
+                print(f"🔎 [ANALYSIS] 区間 {index+1}/{len(chunks)} 抽出中...")
+                with stage_timer("prompt_build"):
+                    prompt = self._build_extraction_prompt(chunk_text, index, len(chunks))
+                notes = await self._call_groq(prompt)
+                print(f"✅ [ANALYSIS] 区間 {index+1}/{len(chunks)} 抽出完了 - {len(notes)}文字")
+                return notes
+
+        findings = await asyncio.gather(*(extract(i, chunk) for i, chunk in enumerate(chunks)))
+
+        notes_text = "\n\n".join(
+            f"### 区間{i+1}/{len(chunks)}の抽出メモ\n{notes}" for i, notes in enumerate(findings)
+        )
+
+        print(f"📝 [ANALYSIS] 最終レポート生成中... (抽出メモ: {len(notes_text)}文字)")
+        with stage_timer("prompt_build"):
+            prompt = self._build_reduce_prompt(notes_text)
+        analysis_text = await self._call_groq(prompt, on_delta)
+        print(f"✅ [ANALYSIS] 分析完了 - 結果文字数: {len(analysis_text)}")
+        return analysis_text
+
+    async def _call_groq(self, prompt: str, on_delta=None) -> str:
+        """
+        Groq APIにプロンプトを送信して応答テキストを返す
+        on_deltaを指定するとストリーミングで受信し、差分を逐次コールバックに渡す
+        全ジョブ共通のレート制限を守り、一時的な失敗はバックオフしてリトライする
+        所要時間（groq_call）はレート制限の待ちとリトライを含む
+        """
+        print(f"🌐 [ANALYSIS] Groq APIにリクエスト送信中...")
+        headers = {
+            "Authorization": f"Bearer {self.groq_api_key}",
+            "Content-Type": "application/json"
+        }
+        payload = {
+            "messages": [
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            "model": self.model,
+            "stream": on_delta is not None,
+            "temperature": 0.1
+        }
+
+        # 差分を1つでも送った後は、リトライすると同じ文章が重複して届くため再試行しない
+        streamed = {"started": False}
+
+        async def forward_delta(delta: str):
+            streamed["started"] = True
+            await on_delta(delta)
+
+        # 送信するリクエストボディのバイト数（httpxと同じJSONエンコード）
+        payload_bytes = len(json.dumps(payload).encode("utf-8"))
+
+        async def request():
+            upstream_requests.labels("groq").inc()
+            upstream_bytes_sent.labels("groq").inc(payload_bytes)
+            return await self._send_groq_request(headers, payload, forward_delta if on_delta else None)
+
+        # 全ジョブ共通のレート制限枠を取り、429・5xx・タイムアウトは指数バックオフでリトライ
+        with stage_timer("groq_call"):
+            return await retry_with_backoff(
+                request,
+                groq_rate_limiter,
+                "Groq API",
+                units=self._estimate_tokens(prompt),
+                is_retryable=lambda e: not streamed["started"] and is_retryable_error(e)
+            )
+
+    async def _send_groq_request(self, headers: dict, payload: dict, on_delta=None) -> str:
+        """
+        Groq APIへ1回リクエストを送る（失敗時はステータスとヘッダーを持つ例外を投げる）
+        """
+        # アプリ共有のコネクションプールを使う（接続・TLSハンドシェイクを使い回す）
+        client = http_clients.http
+        if on_delta is None:
+            response = await client.post(
+                self.groq_api_url,
+                headers=headers,
+                json=payload,
+                timeout=300.0  # 5分のタイムアウト
+            )
+
+            if response.status_code != 200:
+                print(f"❌ [ANALYSIS] Groq APIエラー: {response.status_code}")
+                raise httpx.HTTPStatusError(
+                    f"Groq API error: {response.status_code} - {response.text}",
+                    request=response.request,
+                    response=response
+                )
+
+            result = response.json()
+            return result["choices"][0]["message"]["content"]
+
+        async with client.stream(
+            "POST",
+            self.groq_api_url,
+            headers=headers,
+            json=payload,
+            timeout=300.0  # 5分のタイムアウト（受信間隔ごと）
+        ) as response:
+            if response.status_code != 200:
+                body = await response.aread()
+                print(f"❌ [ANALYSIS] Groq APIエラー: {response.status_code}")
+                raise httpx.HTTPStatusError(
+                    f"Groq API error: {response.status_code} - {body.decode(errors='ignore')}",
+                    request=response.request,
+                    response=response
+                )
+
+            return await self._consume_stream(response, on_delta)
+
+    async def _consume_stream(self, response, on_delta) -> str:
+        """
+        Server-Sent Eventsの差分を組み立て、一定間隔でまとめてコールバックに渡す
+        """
+        parts = []
+        pending = []
+        last_flush = time.monotonic()
+
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                break
+
+            chunk = json.loads(data)
+            choices = chunk.get("choices") or []
+            if not choices:
+                continue
+            content = (choices[0].get("delta") or {}).get("content")
+            if not content:
+                continue
+
+            parts.append(content)
+            pending.append(content)
+            if time.monotonic() - last_flush >= self.stream_flush_interval:
+                await on_delta("".join(pending))
+                pending.clear()
+                last_flush = time.monotonic()
+
+        if pending:
+            await on_delta("".join(pending))
+
+        return "".join(parts)
+
+    def _build_extraction_prompt(self, chunk_text: str, index: int, total: int) -> str:
+        """
+        分割分析（map）用: 区間内の事実をタイムスタンプ付きで抽出するプロンプト
+        """
+        return f"""## ロール
+あなたは顧客定性調査・広告設計の専門家です。
+以下は長いインタビュー書き起こしの一部（区間{index+1}/{total}）です。
+後で全区間の抽出メモをまとめて最終レポートを作成するため、この区間に含まれる情報だけを漏れなく抽出してください。
+
+## 抽出する観点
+- プロフィール（年齢・住まい・職業・家族構成・家計・住居・買い物傾向・SNS・趣味・利用開始時期・MBTI など）
+- 購入前（場面・感情・購入理由・試行錯誤した他の手段・試さなかった施策・理想の条件）
+- 印象（第一印象・詳細を知っての印象・購入直前の決め手）
+- 購入後（ビフォー→アフター・使い方・他商品との違い・推薦）
+- 購入商品情報（商品名・カテゴリー・価格・販路）
+- 既存認知の候補（購入前から持っていた認識）と新認知の候補（購入の決め手になった新しい理解）: 内容・シーン・感情
+
+## ルール
+- 各項目には根拠となる発言のタイムスタンプを【HH:MM:SS】の形式で、書き起こしに記載されたとおりに必ず付けてください
+- この区間に該当する情報がない観点は「該当なし」と書いてください
+- 推測で情報を補わないでください
+
+## 書き起こし（区間{index+1}/{total}）
+""" + chunk_text
+
+    def _build_reduce_prompt(self, notes_text: str) -> str:
+        """
+        分割分析（reduce）用: 区間ごとの抽出メモから最終レポートを作るプロンプト
+        """
+        return self._build_analysis_prompt(
+            "※インタビューが長いため、以下は書き起こしを区間ごとに整理した抽出メモです。"
+            "これをインタビュー全文として扱い、重複は統合してください。"
+            "タイムスタンプ【HH:MM:SS】はメモに記載されたものをそのまま引用してください。\n\n"
+            + notes_text
+        )
+
     def _build_analysis_prompt(self, transcription_text: str) -> str:
         """
         顧客定性調査・広告設計に特化した分析プロンプトを構築する
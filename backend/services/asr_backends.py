@@ -0,0 +1,241 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import importlib.util
+from services.http_clients import http_clients
+from services.rate_limiter import openai_rate_limiter, retry_with_backoff
+from services.audio_encoder import EncodedAudio, WHISPER_MAX_UPLOAD_SIZE
+from services.metrics import upstream_requests, upstream_bytes_sent
+
+logger = logging.getLogger(__name__)
+
+
+class ASRBackend:
+    """
+    音声認識エンジンの共通インターフェース
+    transcribeはEncodedAudio（メモリ上のbytesまたはファイル）を受け取り、
+    {"text", "duration", "segments": [{"start", "end", "text"}]} の辞書を返す
+    """
+
+    name = None
+
+    # このサイズ以下のファイルは分割せずに1回で認識する（0なら常に分割）
+    max_single_file_size = 0
+
+    # 分割区間のエンコード形式（Noneなら設定値 TRANSCRIPTION_SEGMENT_FORMAT）
+    segment_format = None
+
+    def cache_params(self) -> dict:
+        """
+        認識結果に影響するエンジン側のパラメータ（キャッシュキーの一部）
+        """
+        raise NotImplementedError
+
+    async def transcribe(self, audio: EncodedAudio, label: str, timeout: float, audio_seconds: float = 0.0) -> dict:
+        raise NotImplementedError
+
+
+class OpenAIWhisperBackend(ASRBackend):
+    """
+    OpenAI Whisper API（whisper-1）による音声認識
+    """
+
+    name = "openai"
+    max_single_file_size = WHISPER_MAX_UPLOAD_SIZE
+
+    def __init__(self):
+        self.model = "whisper-1"
+        # サービス全体（全ジョブ合計）で同時に実行するWhisper API呼び出し数の上限
+        self.semaphore = asyncio.Semaphore(max(1, int(os.getenv("WHISPER_MAX_CONCURRENCY", "4"))))
+
+    @property
+    def client(self):
+        """
+        アプリ共有のコネクションプールを使う非同期OpenAIクライアント
+        """
+        return http_clients.openai
+
+    def cache_params(self) -> dict:
+        return {"model": self.model, "response_format": "verbose_json"}
+
+    async def transcribe(self, audio: EncodedAudio, label: str, timeout: float, audio_seconds: float = 0.0) -> dict:
+        """
+        Whisper APIを呼び出す（タイムアウト・レート制限・リトライ付き）
+        メモリ上の音声はそのまま、ファイルはパスで渡してSDK側でスレッド経由で読み込ませる
+        """
+        async def request():
+            async with self.semaphore:
+                print(f"🔄 [TRANSCRIPTION] {label} API呼び出し開始")
+                upstream_requests.labels("openai").inc()
+                upstream_bytes_sent.labels("openai").inc(audio.size)
+                # タイムアウト付きでAPI呼び出し
+                return await asyncio.wait_for(
+                    self.client.audio.transcriptions.create(
+                        model=self.model,
+                        file=audio.upload_file(),
+                        response_format="verbose_json"
+                    ),
+                    timeout=timeout
+                )
+
+        try:
+            # 全ジョブ共通のレート制限枠を取り、429・5xx・タイムアウトは指数バックオフでリトライ
+            transcript = await retry_with_backoff(
+                request, openai_rate_limiter, f"Whisper API ({label})", units=audio_seconds
+            )
+        except asyncio.TimeoutError:
+            print(f"⏰ [TRANSCRIPTION] API呼び出しタイムアウト ({label})")
+            raise Exception(f"OpenAI API timeout ({label})")
+        except Exception as e:
+            print(f"❌ [TRANSCRIPTION] API呼び出しエラー: {e} ({label})")
+            raise
+
+        print(f"✅ [TRANSCRIPTION] {label} API呼び出し成功")
+        return self._transcript_to_dict(transcript)
+
+    def _transcript_to_dict(self, transcript) -> dict:
+        """
+        Whisper APIのレスポンスをキャッシュ可能な辞書に正規化する
+        """
+        segments = []
+
+        if hasattr(transcript, 'segments') and transcript.segments:
+            for segment in transcript.segments:
+                if isinstance(segment, dict):
+                    start = segment.get('start', 0)
+                    end = segment.get('end', 0)
+                    text = segment.get('text', '').strip()
+                else:
+                    start = getattr(segment, 'start', 0)
+                    end = getattr(segment, 'end', 0)
+                    text = getattr(segment, 'text', '').strip()
+
+                segments.append({"start": start, "end": end, "text": text})
+
+        return {
+            "text": getattr(transcript, 'text', None) or "",
+            "duration": getattr(transcript, 'duration', None) or 0.0,
+            "segments": segments
+        }
+
+
+class LocalWhisperBackend(ASRBackend):
+    """
+    faster-whisper（CTranslate2・int8量子化）によるCPU上のローカル音声認識
+    複数のワーカーで区間を並列に認識し、CPUコアを分け合う
+    """
+
+    name = "local"
+    # 長さに関わらず区間に分割し、区間単位で全コアに振り分ける
+    max_single_file_size = 0
+    # アップロードがないため圧縮せず、区間はPCMのWAV（モノラル・16kHz）で渡す（非可逆の再エンコードをしない）
+    segment_format = "wav"
+
+    def __init__(self):
+        if importlib.util.find_spec("faster_whisper") is None:
+            raise ValueError("Local ASR backend requires faster-whisper (pip install faster-whisper)")
+
+        self.model_size = os.getenv("LOCAL_ASR_MODEL", "small")
+        self.compute_type = os.getenv("LOCAL_ASR_COMPUTE_TYPE", "int8")
+        self.language = os.getenv("LOCAL_ASR_LANGUAGE", "ja") or None
+        self.beam_size = int(os.getenv("LOCAL_ASR_BEAM_SIZE", "5"))
+
+        # 同時に認識する区間数と、1区間あたりのスレッド数（合わせてCPUコア数になるように）
+        cpu_count = os.cpu_count() or 1
+        self.num_workers = max(1, int(os.getenv("LOCAL_ASR_WORKERS", str(max(1, cpu_count // 4)))))
+        self.cpu_threads = max(1, cpu_count // self.num_workers)
+        self.semaphore = asyncio.Semaphore(self.num_workers)
+
+        self._model = None
+        self._model_lock = threading.Lock()
+
+    def cache_params(self) -> dict:
+        return {
+            "backend": self.name,
+            "model": self.model_size,
+            "compute_type": self.compute_type,
+            "language": self.language,
+            "beam_size": self.beam_size,
+        }
+
+    def _load_model(self):
+        """
+        モデルを初回利用時に読み込む（全ワーカーで1つを共有する）
+        """
+        with self._model_lock:
+            if self._model is None:
+                from faster_whisper import WhisperModel
+
+                logger.info(
+                    f"Loading local ASR model: {self.model_size} ({self.compute_type}, "
+                    f"{self.num_workers} workers x {self.cpu_threads} threads)"
+                )
+                self._model = WhisperModel(
+                    self.model_size,
+                    device="cpu",
+                    compute_type=self.compute_type,
+                    cpu_threads=self.cpu_threads,
+                    num_workers=self.num_workers
+                )
+            return self._model
+
+    def _transcribe_sync(self, audio: EncodedAudio, deadline: float) -> dict:
+        model = self._load_model()
+        segments, info = model.transcribe(audio.open(), language=self.language, beam_size=self.beam_size)
+
+        # segmentsは遅延評価のジェネレーターなので、ここで最後まで認識させる
+        # 実行中のスレッドは止められないため、打ち切り時刻は発話を1つ認識するごとに確認する
+        raw_texts = []
+        result_segments = []
+        for segment in segments:
+            if time.monotonic() > deadline:
+                raise asyncio.TimeoutError()
+            raw_texts.append(segment.text)
+            result_segments.append({"start": segment.start, "end": segment.end, "text": segment.text.strip()})
+
+        return {
+            "text": "".join(raw_texts).strip(),
+            "duration": info.duration,
+            "segments": result_segments
+        }
+
+    async def transcribe(self, audio: EncodedAudio, label: str, timeout: float, audio_seconds: float = 0.0) -> dict:
+        """
+        ワーカースレッドで認識する（CPU処理のためリトライは行わない）
+        timeoutはワーカーの空きを待った後の認識時間の上限（CPUでの認識時間は音声の長さに比例するため、
+        音声秒数の2倍よりは短くしない）
+        """
+        async with self.semaphore:
+            print(f"🖥️ [TRANSCRIPTION] {label} ローカル認識開始 ({self.model_size}/{self.compute_type})")
+            deadline = time.monotonic() + max(timeout, audio_seconds * 2)
+            try:
+                transcript = await asyncio.to_thread(self._transcribe_sync, audio, deadline)
+            except asyncio.TimeoutError:
+                print(f"⏰ [TRANSCRIPTION] ローカル認識タイムアウト ({label})")
+                raise Exception(f"Local ASR timeout ({label})")
+        print(f"✅ [TRANSCRIPTION] {label} ローカル認識完了")
+        return transcript
+
+
+ASR_BACKENDS = {
+    OpenAIWhisperBackend.name: OpenAIWhisperBackend,
+    LocalWhisperBackend.name: LocalWhisperBackend,
+}
+
+_backend_instances = {}
+
+
+def get_asr_backend(name: str = None) -> ASRBackend:
+    """
+    名前から音声認識エンジンを返す（未指定ならASR_BACKENDの設定値）
+    エンジンはプロセス内で1つずつ生成して使い回す
+    """
+    name = (name or os.getenv("ASR_BACKEND", "openai")).lower()
+    if name not in ASR_BACKENDS:
+        raise ValueError(f"Unknown ASR backend: {name} (available: {', '.join(ASR_BACKENDS)})")
+
+    if name not in _backend_instances:
+        _backend_instances[name] = ASR_BACKENDS[name]()
+    return _backend_instances[name]
@@ -0,0 +1,160 @@
+import io
+import os
+import pathlib
+import logging
+import tempfile
+import subprocess
+from pydub import AudioSegment
+
+logger = logging.getLogger(__name__)
+
+# Whisper APIのアップロード上限
+WHISPER_MAX_UPLOAD_SIZE = 25 * 1024 * 1024  # 25MB
+
+# 出力形式ごとのffmpeg設定（Whisper APIが受け付ける形式のみ）
+SEGMENT_FORMATS = {
+    "mp3": {"format": "mp3", "codec": None, "suffix": ".mp3"},
+    "ogg": {"format": "ogg", "codec": "libopus", "suffix": ".ogg"},
+    "wav": {"format": "wav", "codec": None, "suffix": ".wav"},
+}
+
+
+class EncodedAudio:
+    """
+    エンコード済みの音声
+    通常はメモリ上のbytesで持ち、上限を超えたものだけ一時ファイルに書き出す
+    """
+
+    def __init__(self, filename: str, data: bytes = None, path: str = None, temporary: bool = False):
+        self.filename = filename    # 拡張子で形式を判定させるためのファイル名
+        self.data = data
+        self.path = path
+        self.temporary = temporary  # closeで削除する一時ファイルか
+
+    @classmethod
+    def from_path(cls, path: str) -> "EncodedAudio":
+        """
+        既存の音声ファイルをそのまま渡す（closeしても削除しない）
+        """
+        return cls(os.path.basename(path), path=path)
+
+    @property
+    def size(self) -> int:
+        if self.data is not None:
+            return len(self.data)
+        return os.path.getsize(self.path)
+
+    def upload_file(self):
+        """
+        OpenAI SDKに渡すファイル（メモリ上なら (ファイル名, bytes)、ファイルならパス）
+        """
+        if self.data is not None:
+            return (self.filename, self.data)
+        return pathlib.Path(self.path)
+
+    def open(self):
+        """
+        ファイルとして読める形で返す（メモリ上ならBytesIO、ファイルならパス）
+        """
+        if self.data is not None:
+            return io.BytesIO(self.data)
+        return self.path
+
+    def close(self):
+        self.data = None
+        if self.temporary and self.path and os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class SegmentEncoder:
+    """
+    分割区間を音声認識向けに圧縮エンコードする
+    モノラル化・認識器のネイティブサンプルレートへのリサンプル後、音声向けビットレートで圧縮する
+    """
+
+    def __init__(self, segment_format: str = None):
+        self.sample_rate = int(os.getenv("TRANSCRIPTION_SAMPLE_RATE", "16000"))
+        # segment_formatを指定すると設定値（TRANSCRIPTION_SEGMENT_FORMAT）より優先する
+        self.segment_format = (segment_format or os.getenv("TRANSCRIPTION_SEGMENT_FORMAT", "mp3")).lower()
+        self.bitrate_kbps = int(os.getenv("TRANSCRIPTION_SEGMENT_BITRATE_KBPS", "48"))
+        self.target_bytes = int(os.getenv("TRANSCRIPTION_CHUNK_TARGET_BYTES", str(20 * 1024 * 1024)))
+        self.max_chunk_seconds = int(os.getenv("TRANSCRIPTION_MAX_CHUNK_SECONDS", "600"))
+        # これを超えるエンコード結果だけ一時ファイルに書き出す（それ以下はメモリ上で受け渡す）
+        self.spool_max_bytes = int(os.getenv("TRANSCRIPTION_SPOOL_MAX_BYTES", str(8 * 1024 * 1024)))
+
+        if self.segment_format not in SEGMENT_FORMATS:
+            raise Exception(f"Unsupported segment format: {self.segment_format}")
+
+    @property
+    def file_suffix(self) -> str:
+        return SEGMENT_FORMATS[self.segment_format]["suffix"]
+
+    def bytes_per_second(self) -> float:
+        """
+        エンコード後の1秒あたりのバイト数（見積もり）
+        """
+        if self.segment_format == "wav":
+            return self.sample_rate * 2  # 16bitモノラル
+        return self.bitrate_kbps * 1000 / 8
+
+    def chunk_duration_ms(self, max_extension_ms: int = 0) -> int:
+        """
+        目標バイト数に収まる区間の目標長（ミリ秒）を計算する
+        コンテナのオーバーヘッドとVBRの揺れを見込んで1割の余裕を取る
+        max_extension_msは切れ目を無音位置へ寄せる・前後にパディングを付けることで
+        区間が目標長から伸びうる最大の長さ（ミリ秒）で、その分を予算から差し引く
+        """
+        budget_seconds = self.target_bytes * 0.9 / self.bytes_per_second()
+        chunk_seconds = min(budget_seconds, self.max_chunk_seconds)
+        chunk_ms = int(chunk_seconds * 1000) - max_extension_ms
+        return max(chunk_ms, 30 * 1000)
+
+    def encode(self, segment: AudioSegment, filename: str) -> EncodedAudio:
+        """
+        区間をモノラル・指定サンプルレートで圧縮する
+        結果は通常メモリ上に保持し、spool_max_bytesを超えた場合のみ一時ファイルに書き出す
+        """
+        data = self.encode_bytes(segment)
+        if len(data) <= self.spool_max_bytes:
+            return EncodedAudio(filename, data=data)
+
+        fd, path = tempfile.mkstemp(suffix=f"_{filename}")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        logger.info(f"Spooled {filename} to disk ({len(data)} bytes)")
+        return EncodedAudio(filename, path=path, temporary=True)
+
+    def encode_bytes(self, segment: AudioSegment) -> bytes:
+        """
+        区間を圧縮してbytesで返す（ディスクを経由しない）
+        """
+        settings = SEGMENT_FORMATS[self.segment_format]
+
+        if self.segment_format == "wav":
+            segment = segment.set_channels(1).set_frame_rate(self.sample_rate).set_sample_width(2)
+            buffer = io.BytesIO()
+            segment.export(buffer, format="wav")
+            return buffer.getvalue()
+
+        # PCMを標準入力からffmpegに渡し、ダウンミックス・リサンプル・圧縮した結果を標準出力で受け取る
+        if segment.sample_width != 2:
+            segment = segment.set_sample_width(2)
+        command = [
+            AudioSegment.converter,
+            "-v", "error",
+            "-f", "s16le",
+            "-ar", str(segment.frame_rate),
+            "-ac", str(segment.channels),
+            "-i", "pipe:0",
+            "-ac", "1",
+            "-ar", str(self.sample_rate),
+            "-b:a", f"{self.bitrate_kbps}k",
+        ]
+        if settings["codec"]:
+            command += ["-acodec", settings["codec"]]
+        command += ["-f", settings["format"], "pipe:1"]
+
+        process = subprocess.run(command, input=segment.raw_data, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if process.returncode != 0:
+            raise Exception(f"Encoding segment failed: {process.stderr.decode(errors='ignore')}")
+        return process.stdout
@@ -0,0 +1,109 @@
+import wave
+import logging
+import subprocess
+from pydub import AudioSegment
+from pydub.utils import mediainfo_json
+
+logger = logging.getLogger(__name__)
+
+
+class AudioSplitter:
+    """
+    音声ファイル全体をデコードせずに、必要な区間だけを読み出す分割器
+    PCM WAVはフレームオフセットで直接読み、それ以外はffmpegの時間シークで読む
+    """
+
+    def __init__(self, audio_file_path: str):
+        self.audio_file_path = audio_file_path
+        self.is_wav = False
+        self._probe()
+
+    def _probe(self):
+        """
+        ヘッダーのみを読んで長さ・サンプルレート・チャンネル数を取得
+        """
+        try:
+            with wave.open(self.audio_file_path, "rb") as wav_file:
+                self.frame_rate = wav_file.getframerate()
+                self.channels = wav_file.getnchannels()
+                self.sample_width = wav_file.getsampwidth()
+                self.duration_ms = int(wav_file.getnframes() * 1000 / self.frame_rate)
+                self.is_wav = True
+                return
+        except (wave.Error, EOFError):
+            # 非PCMのWAVや圧縮形式はffprobeで調べる
+            pass
+
+        info = mediainfo_json(self.audio_file_path)
+        audio_streams = [s for s in info.get("streams", []) if s.get("codec_type") == "audio"]
+        if not audio_streams:
+            raise Exception(f"No audio stream found in {self.audio_file_path}")
+
+        stream = audio_streams[0]
+        duration = stream.get("duration") or info.get("format", {}).get("duration")
+        if duration is None:
+            raise Exception(f"Could not determine duration of {self.audio_file_path}")
+
+        self.frame_rate = int(stream.get("sample_rate", 44100))
+        self.channels = int(stream.get("channels", 1))
+        self.sample_width = 2  # s16leでデコードする
+        self.duration_ms = int(float(duration) * 1000)
+
+    def read_window(self, start_ms: int, end_ms: int) -> AudioSegment:
+        """
+        start_ms〜end_msの区間だけを読み出してAudioSegmentにする
+        """
+        end_ms = min(end_ms, self.duration_ms)
+        if end_ms <= start_ms:
+            return AudioSegment.empty()
+
+        if self.is_wav:
+            return self._read_wav_window(start_ms, end_ms)
+        return self._read_compressed_window(start_ms, end_ms)
+
+    def _read_wav_window(self, start_ms: int, end_ms: int) -> AudioSegment:
+        """
+        WAVはフレーム位置へ直接シークして必要なフレームだけ読む
+        """
+        with wave.open(self.audio_file_path, "rb") as wav_file:
+            start_frame = int(start_ms * self.frame_rate / 1000)
+            end_frame = min(int(end_ms * self.frame_rate / 1000), wav_file.getnframes())
+            wav_file.setpos(start_frame)
+            data = wav_file.readframes(end_frame - start_frame)
+
+        return AudioSegment(
+            data=data,
+            sample_width=self.sample_width,
+            frame_rate=self.frame_rate,
+            channels=self.channels
+        )
+
+    def _read_compressed_window(self, start_ms: int, end_ms: int) -> AudioSegment:
+        """
+        圧縮形式は入力側シーク（-ss を -i の前に置く）で区間だけをPCMにデコードする
+        """
+        command = [
+            AudioSegment.converter,
+            "-v", "error",
+            "-ss", f"{start_ms / 1000:.3f}",
+            "-t", f"{(end_ms - start_ms) / 1000:.3f}",
+            "-i", self.audio_file_path,
+            "-vn",
+            "-acodec", "pcm_s16le",
+            "-f", "s16le",
+            "-ac", str(self.channels),
+            "-ar", str(self.frame_rate),
+            "-"
+        ]
+        process = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        if process.returncode != 0:
+            raise Exception(
+                f"Decoding window {start_ms}-{end_ms}ms failed: {process.stderr.decode(errors='ignore')}"
+            )
+
+        return AudioSegment(
+            data=process.stdout,
+            sample_width=self.sample_width,
+            frame_rate=self.frame_rate,
+            channels=self.channels
+        )
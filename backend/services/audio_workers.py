@@ -0,0 +1,75 @@
+import os
+import time
+import asyncio
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from services.audio_splitter import AudioSplitter
+
+logger = logging.getLogger(__name__)
+
+
+def plan_chunk_windows(audio_file_path: str, planner, segment_duration: int):
+    """
+    無音位置で分割点を決める（ワーカープロセスで実行）
+    """
+    return planner.plan(AudioSplitter(audio_file_path), segment_duration)
+
+
+def encode_chunk_window(audio_file_path: str, window, encoder, filename: str):
+    """
+    1区間だけをデコードして圧縮し、(EncodedAudio, 区間の長さ（秒）, {"decode": 秒, "encode": 秒}) を返す
+    （ワーカープロセスで実行、所要時間は親プロセスでメトリクスに記録する）
+    元の音声データはプロセス間で受け渡さず、圧縮後のbytesだけを返す
+    """
+    started_at = time.perf_counter()
+    segment = AudioSplitter(audio_file_path).read_window(window.start_ms, window.end_ms)
+    decoded_at = time.perf_counter()
+    audio = encoder.encode(segment, filename)
+    timings = {"decode": decoded_at - started_at, "encode": time.perf_counter() - decoded_at}
+    return audio, len(segment) / 1000.0, timings
+
+
+class AudioWorkerPool:
+    """
+    音声のデコード・分割・エンコードを実行するプロセスプール
+    ffmpeg呼び出しやnumpy計算をイベントループとGILの外で並列に処理する
+    AUDIO_WORKERS=0ならプロセスを使わずスレッドで実行する
+    """
+
+    def __init__(self):
+        default_workers = max(1, (os.cpu_count() or 2) // 2)
+        self.num_workers = max(0, int(os.getenv("AUDIO_WORKERS", str(default_workers))))
+        self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None and self.num_workers > 0:
+            # スレッドを持つ親プロセスをforkしないよう、spawnで起動する
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.num_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            logger.info(f"Audio worker pool started: {self.num_workers} processes")
+        return self._executor
+
+    async def run(self, func, *args):
+        """
+        関数をワーカープロセスで実行し、結果を待つ（イベントループは止めない）
+        """
+        executor = self._get_executor()
+        if executor is None:
+            return await asyncio.to_thread(func, *args)
+        return await asyncio.get_running_loop().run_in_executor(executor, func, *args)
+
+    def shutdown(self):
+        """
+        ワーカープロセスを停止（アプリ終了時に呼ぶ）
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            logger.info("Audio worker pool stopped")
+
+
+# グローバルインスタンス
+audio_workers = AudioWorkerPool()
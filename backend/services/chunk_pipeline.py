@@ -0,0 +1,149 @@
+import time
+import asyncio
+import logging
+from services.metrics import pipeline_queued, pipeline_active, pipeline_queue_wait, pipeline_busy
+
+logger = logging.getLogger(__name__)
+
+# ワーカーに終了を伝える目印
+_STAGE_END = object()
+
+
+class PipelineStage:
+    """
+    パイプラインの1段（入力キュー・同時実行数・処理関数）
+    handlerは次の段へ渡す値を返す（Noneならその区間はここで打ち切る）
+    キュー長・処理中件数・待ち時間・処理時間は/metricsにも段の名前ごとに出す
+    """
+
+    def __init__(self, name: str, handler, concurrency: int, queue_size: int):
+        self.name = name
+        self.handler = handler
+        self.concurrency = max(1, concurrency)
+        self.queue_size = max(1, queue_size)
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.queued = 0  # キュー内の区間数（終了の目印は数えない）
+        self.active = 0
+        self.processed = 0
+        self.failed = 0
+        self.max_queued = 0
+        self.wait_seconds = 0.0  # キューで待った時間の合計
+        self.busy_seconds = 0.0  # handlerの実行時間の合計
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "queued": self.queued,
+            "active": self.active,
+            "max_queued": self.max_queued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "wait_seconds": round(self.wait_seconds, 3),
+            "busy_seconds": round(self.busy_seconds, 3),
+        }
+
+
+class ChunkPipeline:
+    """
+    区間を複数の段（エンコード→文字起こし等）に流す非同期パイプライン
+    段の間は上限付きキューでつなぎ、後段が詰まれば前段が待つ（背圧）
+    処理中の区間数（メモリ・一時ファイル）は各段の同時実行数＋キュー長に収まる
+    """
+
+    def __init__(self, stages, on_error=None):
+        self.stages = stages
+        self.on_error = on_error
+
+    def snapshot(self) -> dict:
+        """
+        段ごとのキュー長・処理中件数（チューニング用）
+        """
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def describe(self) -> str:
+        return " | ".join(
+            f"{stage.name}: 待ち{stage.queued}/{stage.queue_size} 処理中{stage.active}/{stage.concurrency}"
+            for stage in self.stages
+        )
+
+    async def run(self, items) -> list:
+        """
+        全区間を流し、最後の段の結果（Noneを除く）を返す
+        """
+        results = []
+        tasks = [asyncio.create_task(self._feed(items))]
+        for index, stage in enumerate(self.stages):
+            next_stage = self.stages[index + 1] if index + 1 < len(self.stages) else None
+            tasks.append(asyncio.create_task(self._run_stage(stage, next_stage, results)))
+
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            # 途中で止まった場合に、キューに残った区間をメトリクスから外す
+            for stage in self.stages:
+                pipeline_queued.labels(stage.name).dec(stage.queued)
+                stage.queued = 0
+        return results
+
+    async def _feed(self, items):
+        first = self.stages[0]
+        for item in items:
+            await self._put(first, item)
+        for _ in range(first.concurrency):
+            await first.queue.put(_STAGE_END)
+
+    async def _put(self, stage: PipelineStage, item):
+        # キューで待った時間を測るため、積んだ時刻と一緒に渡す
+        await stage.queue.put((item, time.perf_counter()))
+        stage.queued += 1
+        stage.max_queued = max(stage.max_queued, stage.queued)
+        pipeline_queued.labels(stage.name).inc()
+
+    async def _run_stage(self, stage: PipelineStage, next_stage, results: list):
+        await asyncio.gather(*(self._worker(stage, next_stage, results) for _ in range(stage.concurrency)))
+
+        # この段の全ワーカーが終わったら次の段に終了を伝える
+        if next_stage is not None:
+            for _ in range(next_stage.concurrency):
+                await next_stage.queue.put(_STAGE_END)
+
+    async def _worker(self, stage: PipelineStage, next_stage, results: list):
+        while True:
+            entry = await stage.queue.get()
+            if entry is _STAGE_END:
+                return
+
+            item, enqueued_at = entry
+            started_at = time.perf_counter()
+            stage.wait_seconds += started_at - enqueued_at
+            pipeline_queue_wait.labels(stage.name).observe(started_at - enqueued_at)
+            stage.queued -= 1
+            stage.active += 1
+            pipeline_queued.labels(stage.name).dec()
+            pipeline_active.labels(stage.name).inc()
+            try:
+                output = await stage.handler(item)
+            except Exception as e:
+                stage.failed += 1
+                output = None
+                if self.on_error is None:
+                    raise
+                await self.on_error(stage.name, item, e)
+            finally:
+                busy = time.perf_counter() - started_at
+                stage.busy_seconds += busy
+                stage.active -= 1
+                pipeline_busy.labels(stage.name).observe(busy)
+                pipeline_active.labels(stage.name).dec()
+            stage.processed += 1
+
+            if output is None:
+                continue
+            if next_stage is None:
+                results.append(output)
+                logger.info(f"Pipeline: {self.describe()}")
+            else:
+                await self._put(next_stage, output)
@@ -0,0 +1,115 @@
+import os
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkWindow:
+    """
+    分割計画の1区間
+    cut_start_ms〜cut_end_msがこの区間の担当範囲（無音位置で決めた切れ目）
+    start_ms〜end_msは前後にパディングを付けた実際の読み出し範囲
+    """
+
+    def __init__(self, index: int, cut_start_ms: int, cut_end_ms: int, start_ms: int, end_ms: int):
+        self.index = index
+        self.cut_start_ms = cut_start_ms
+        self.cut_end_ms = cut_end_ms
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+
+    def __repr__(self):
+        return f"ChunkWindow(index={self.index}, cut={self.cut_start_ms}-{self.cut_end_ms}ms)"
+
+
+class ChunkBoundaryPlanner:
+    """
+    目標の切れ目付近で最も静かな位置（話の区切り）を探して分割点を決める
+    切れ目の前後だけを読み、RMSエネルギーをnumpyでまとめて計算する
+    """
+
+    def __init__(self):
+        self.tolerance_ms = int(float(os.getenv("TRANSCRIPTION_CUT_TOLERANCE_SECONDS", "15")) * 1000)
+        self.padding_ms = int(os.getenv("TRANSCRIPTION_CHUNK_PADDING_MS", "500"))
+        # 最後の区間の最小長（ごく短い区間でAPI呼び出しを1回増やさない。探索幅を超えない範囲で守る）
+        self.min_chunk_ms = min(
+            self.tolerance_ms, int(float(os.getenv("TRANSCRIPTION_MIN_CHUNK_SECONDS", "10")) * 1000)
+        )
+        self.frame_ms = 20           # RMSを計算するフレーム長
+        self.smoothing_ms = 300      # 単発の無音フレームではなく「間」を探すための平滑化幅
+
+    @property
+    def max_extension_ms(self) -> int:
+        """
+        区間長が目標からはみ出しうる最大量（区間長の予算計算用）
+        """
+        return self.tolerance_ms + 2 * self.padding_ms
+
+    def plan(self, splitter, segment_duration: int):
+        """
+        分割点を決めてChunkWindowのリストを返す
+        """
+        duration_ms = splitter.duration_ms
+        cuts = [0]
+
+        while cuts[-1] + segment_duration + self.tolerance_ms < duration_ms:
+            target = cuts[-1] + segment_duration
+            search_start = target - self.tolerance_ms
+            # 残りが最小長より短くならないよう、探索範囲の後ろを切り詰める（より前の間で切る）
+            search_end = min(target + self.tolerance_ms, duration_ms - self.min_chunk_ms)
+            window = splitter.read_window(search_start, search_end)
+            cut = search_start + self.find_quietest_offset_ms(window)
+            cuts.append(cut)
+            logger.info(f"Chunk boundary near {target/1000:.1f}s placed at {cut/1000:.2f}s")
+
+        cuts.append(duration_ms)
+
+        return [
+            ChunkWindow(
+                index=i,
+                cut_start_ms=cuts[i],
+                cut_end_ms=cuts[i + 1],
+                start_ms=max(0, cuts[i] - self.padding_ms),
+                end_ms=min(duration_ms, cuts[i + 1] + self.padding_ms)
+            )
+            for i in range(len(cuts) - 1)
+        ]
+
+    def find_quietest_offset_ms(self, segment) -> int:
+        """
+        区間内で最もエネルギーが低い位置（ミリ秒オフセット）を返す
+        同程度に静かな候補が複数あれば中央（目標位置）に近い方を選ぶ
+        """
+        samples = self._to_mono_samples(segment)
+        frame_length = max(1, int(segment.frame_rate * self.frame_ms / 1000))
+        num_frames = len(samples) // frame_length
+        if num_frames == 0:
+            return len(segment) // 2
+
+        frames = samples[:num_frames * frame_length].reshape(num_frames, frame_length)
+        rms = np.sqrt(np.mean(frames * frames, axis=1))
+
+        kernel_size = max(1, self.smoothing_ms // self.frame_ms)
+        smoothed = np.convolve(rms, np.ones(kernel_size) / kernel_size, mode="same")
+
+        # 中央から離れるほど僅かに不利にする（エネルギー幅の5%まで）
+        distance = np.abs(np.arange(num_frames) - num_frames / 2) / (num_frames / 2)
+        energy_range = float(smoothed.max() - smoothed.min()) or 1.0
+        score = smoothed + distance * energy_range * 0.05
+
+        best_frame = int(np.argmin(score))
+        return best_frame * self.frame_ms + self.frame_ms // 2
+
+    def _to_mono_samples(self, segment) -> np.ndarray:
+        """
+        AudioSegmentをモノラルのfloat配列に変換
+        """
+        if segment.sample_width not in (2, 4):
+            segment = segment.set_sample_width(2)
+        dtype = np.int16 if segment.sample_width == 2 else np.int32
+        samples = np.frombuffer(segment.raw_data, dtype=dtype).astype(np.float32)
+        if segment.channels > 1:
+            samples = samples[:len(samples) - len(samples) % segment.channels]
+            samples = samples.reshape(-1, segment.channels).mean(axis=1)
+        return samples
@@ -0,0 +1,87 @@
+import os
+import logging
+import importlib.util
+import httpx
+from openai import AsyncOpenAI
+
+logger = logging.getLogger(__name__)
+
+
+class HttpClients:
+    """
+    アプリ全体で共有するHTTPクライアント（Groq / OpenAI）
+    keep-aliveとコネクションプールで同時リクエスト間の接続を使い回す
+    FastAPIの起動・終了時にstartup / shutdownを呼ぶ
+    """
+
+    def __init__(self):
+        self.max_connections = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+        self.max_keepalive_connections = int(os.getenv("HTTP_MAX_KEEPALIVE_CONNECTIONS", "20"))
+        self.keepalive_expiry = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "30"))
+        # HTTP/2はh2パッケージがある場合のみ有効化する
+        self.http2 = (
+            os.getenv("HTTP2_ENABLED", "true").lower() == "true"
+            and importlib.util.find_spec("h2") is not None
+        )
+        self._http_client = None
+        self._openai_client = None
+
+    async def startup(self):
+        """
+        共有クライアントを生成（アプリ起動時）
+        """
+        self._create_http_client()
+        logger.info(
+            f"HTTP clients started: max_connections={self.max_connections}, "
+            f"keepalive={self.max_keepalive_connections}, http2={self.http2}"
+        )
+
+    async def shutdown(self):
+        """
+        接続を閉じる（アプリ終了時）
+        """
+        if self._http_client is not None:
+            await self._http_client.aclose()
+        self._http_client = None
+        self._openai_client = None
+        logger.info("HTTP clients closed")
+
+    def _create_http_client(self):
+        if self._http_client is not None:
+            return
+
+        self._http_client = httpx.AsyncClient(
+            http2=self.http2,
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry
+            ),
+            timeout=httpx.Timeout(300.0, connect=10.0)
+        )
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        """
+        Groq API等に使う共有httpxクライアント（未起動なら生成する）
+        """
+        self._create_http_client()
+        return self._http_client
+
+    @property
+    def openai(self) -> AsyncOpenAI:
+        """
+        共有コネクションプールを使うOpenAIクライアント（未起動なら生成する）
+        """
+        if self._openai_client is None:
+            # OpenAI SDKも同じコネクションプールを使う（リトライは呼び出し側で行う）
+            self._openai_client = AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                http_client=self.http,
+                max_retries=0
+            )
+        return self._openai_client
+
+
+# グローバルインスタンス
+http_clients = HttpClients()
@@ -0,0 +1,200 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+import orjson
+from typing import Optional
+from models.schemas import AnalysisResponse
+from services.metrics import job_queue_depth, jobs_total
+
+logger = logging.getLogger(__name__)
+
+
+class JobQueueFullError(Exception):
+    """ジョブキューが満杯で受け付けられない場合の例外"""
+    pass
+
+
+class Job:
+    """
+    文字起こし→分析パイプラインの1ジョブ
+    job_idは進捗WebSocketのセッションIDとしても使う
+    """
+
+    def __init__(self, audio_file_path: str, source_hash: str, filename: str = None, job_id: str = None,
+                 asr_backend: str = None):
+        self.job_id = job_id or uuid.uuid4().hex
+        self.audio_file_path = audio_file_path
+        self.source_hash = source_hash
+        self.filename = filename
+        self.asr_backend = asr_backend  # 音声認識エンジン（Noneなら設定値）
+        self.status = "queued"  # queued / running / completed / failed
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+
+    def set_status(self, status: str):
+        self.status = status
+        self.updated_at = time.time()
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("completed", "failed")
+
+    def to_record(self) -> str:
+        """
+        他のプロセスから読めるジョブの状態と結果（JSON）
+        """
+        return orjson.dumps({
+            "job_id": self.job_id,
+            "filename": self.filename,
+            "status": self.status,
+            "result": self.result.model_dump() if self.result is not None else None,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at
+        }).decode()
+
+    @classmethod
+    def from_record(cls, record: str) -> "Job":
+        """
+        to_recordの内容から作る（音声ファイルは持たない読み取り専用のジョブ）
+        """
+        data = orjson.loads(record)
+        job = cls(None, None, data["filename"], data["job_id"])
+        job.status = data["status"]
+        job.error = data["error"]
+        job.created_at = data["created_at"]
+        job.updated_at = data["updated_at"]
+        if data["result"] is not None:
+            job.result = AnalysisResponse.model_validate(data["result"])
+        return job
+
+
+class JobManager:
+    """
+    ジョブを上限付きキューに積み、バックグラウンドのワーカーで順に実行する
+    pipelineは (音声ファイルパス, セッションID, 音声ハッシュ, asr_backend=エンジン名) を受け取り結果を返すコルーチン関数
+    ジョブの状態と結果は保存先（進捗の配信バス）にも書き、別のプロセスに来た状態・結果の問い合わせにも答えられるようにする
+    ジョブは音声ファイルを受け取ったプロセスで実行する（一時ファイルはそのプロセスのディスクにある）
+    """
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.num_workers = max(1, int(os.getenv("JOB_WORKERS", "2")))
+        self.max_queue_size = max(1, int(os.getenv("JOB_QUEUE_SIZE", "16")))
+        self.result_ttl = float(os.getenv("JOB_RESULT_TTL_SECONDS", "3600"))
+        self.jobs = {}
+        self.queue = None
+        self.workers = []
+        self.store = None
+
+    async def start(self, store=None):
+        """
+        ワーカーを起動（アプリ起動時に呼ぶ）
+        storeにはジョブの状態を他のプロセスと共有する保存先（save_job / load_jobを持つ進捗の配信バス）を渡す
+        """
+        self.store = store
+        self.queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self.workers = [asyncio.create_task(self._worker(i)) for i in range(self.num_workers)]
+        logger.info(f"Job manager started: {self.num_workers} workers, queue size {self.max_queue_size}")
+
+    async def stop(self):
+        """
+        ワーカーを停止し、未処理ジョブの一時ファイルを削除（アプリ終了時に呼ぶ）
+        """
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+        for job in self.jobs.values():
+            if not job.is_finished:
+                self._remove_file(job)
+                job.error = "Job cancelled"
+                job.set_status("failed")
+                await self._save(job)
+        logger.info("Job manager stopped")
+
+    async def submit(self, audio_file_path: str, source_hash: str, filename: str = None, job_id: str = None,
+               asr_backend: str = None) -> Job:
+        """
+        ジョブをキューに積んで即座に返す
+        """
+        self._purge_expired()
+
+        job = Job(audio_file_path, source_hash, filename, job_id, asr_backend)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            raise JobQueueFullError(f"Job queue is full ({self.max_queue_size} jobs)")
+
+        self.jobs[job.job_id] = job
+        job_queue_depth.set(self.queue.qsize())
+        logger.info(f"Job submitted: {job.job_id} ({filename}), queue depth: {self.queue.qsize()}")
+        await self._save(job)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Job]:
+        """
+        ジョブを返す（このプロセスで受け付けていなければ保存先から読む）
+        """
+        job = self.jobs.get(job_id)
+        if job is not None or self.store is None:
+            return job
+        record = await self.store.load_job(job_id)
+        if record is None:
+            return None
+        return await asyncio.to_thread(Job.from_record, record)
+
+    async def _save(self, job: Job):
+        if self.store is None:
+            return
+        # 結果は大きくなりうるため、JSONへの変換はスレッドで行う
+        record = await asyncio.to_thread(job.to_record)
+        await self.store.save_job(job.job_id, record, self.result_ttl)
+
+    async def _worker(self, worker_index: int):
+        while True:
+            job = await self.queue.get()
+            job_queue_depth.set(self.queue.qsize())
+            try:
+                job.set_status("running")
+                await self._save(job)
+                logger.info(f"Job started: {job.job_id} (worker {worker_index})")
+                job.result = await self.pipeline(
+                    job.audio_file_path, job.job_id, job.source_hash, asr_backend=job.asr_backend
+                )
+                job.set_status("completed")
+                logger.info(f"Job completed: {job.job_id}")
+            except asyncio.CancelledError:
+                job.error = "Job cancelled"
+                job.set_status("failed")
+                raise
+            except Exception as e:
+                logger.error(f"Job {job.job_id} failed: {e}", exc_info=True)
+                job.error = str(e)
+                job.set_status("failed")
+            finally:
+                jobs_total.labels(job.status).inc()
+                self._remove_file(job)
+                self.queue.task_done()
+                await self._save(job)
+
+    def _purge_expired(self):
+        """
+        保持期間を過ぎた完了ジョブを削除
+        """
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self.jobs.items()
+            if job.is_finished and now - job.updated_at > self.result_ttl
+        ]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    def _remove_file(self, job: Job):
+        if job.audio_file_path and os.path.exists(job.audio_file_path):
+            os.unlink(job.audio_file_path)
@@ -0,0 +1,78 @@
+import os
+import gzip
+import asyncio
+import logging
+import importlib.util
+import orjson
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+
+class JSONResponseEncoder:
+    """
+    大きな分析結果をorjsonで直接JSONにし、クライアントが対応していればBrotli/gzipで圧縮して返す
+    エンコードと圧縮はワーカースレッドで行い、イベントループを止めない
+    Brotliはbrotliパッケージがある場合のみ使う（pip install brotli）
+    """
+
+    def __init__(self):
+        self.compression_enabled = os.getenv("RESPONSE_COMPRESSION", "true").lower() == "true"
+        # これより小さいレスポンスは圧縮しない
+        self.min_compress_bytes = int(os.getenv("RESPONSE_COMPRESSION_MIN_BYTES", "1024"))
+        self.gzip_level = int(os.getenv("RESPONSE_GZIP_LEVEL", "4"))
+        self.brotli_quality = int(os.getenv("RESPONSE_BROTLI_QUALITY", "5"))
+        self.brotli_available = importlib.util.find_spec("brotli") is not None
+
+    def choose_encoding(self, accept_encoding: str):
+        """
+        Accept-Encodingから使う圧縮方式を選ぶ（br > gzip、q=0は除外、RESPONSE_COMPRESSION=falseなら圧縮しない）
+        """
+        if not self.compression_enabled:
+            return None
+
+        accepted = set()
+        for item in accept_encoding.lower().split(","):
+            name, _, params = item.strip().partition(";")
+            if params.strip().replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+                continue
+            accepted.add(name.strip())
+
+        if self.brotli_available and "br" in accepted:
+            return "br"
+        if "gzip" in accepted or "*" in accepted:
+            return "gzip"
+        return None
+
+    def encode(self, content, encoding: str = None, exclude=None):
+        """
+        内容をJSONにし、必要なら圧縮する
+        pydanticモデルは検証済みとしてmodel_dumpの結果をそのままorjsonに渡す（jsonable_encoderを通さない）
+        戻り値: (本文のbytes, 実際に使った圧縮方式)
+        """
+        if isinstance(content, BaseModel):
+            content = content.model_dump(exclude=exclude)
+        body = orjson.dumps(content)
+        if encoding is None or len(body) < self.min_compress_bytes:
+            return body, None
+        if encoding == "br":
+            import brotli
+            return brotli.compress(body, quality=self.brotli_quality), encoding
+        return gzip.compress(body, compresslevel=self.gzip_level), encoding
+
+    async def respond(self, request: Request, content, status_code: int = 200, exclude=None) -> Response:
+        """
+        内容（pydanticモデル / dict / list）からレスポンスを作る
+        """
+        encoding = self.choose_encoding(request.headers.get("accept-encoding", ""))
+        body, used_encoding = await asyncio.to_thread(self.encode, content, encoding, exclude)
+
+        headers = {"Vary": "Accept-Encoding"}
+        if used_encoding is not None:
+            headers["Content-Encoding"] = used_encoding
+        return Response(content=body, status_code=status_code, media_type="application/json", headers=headers)
+
+
+# グローバルインスタンス
+json_response_encoder = JSONResponseEncoder()
@@ -0,0 +1,256 @@
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 処理段の所要時間のバケット（秒、数ミリ秒のプロンプト構築から数分の音声認識まで）
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    """
+    ラベルの値ごとに値を持つメトリクスの共通部分
+    """
+
+    type_name = None
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values) -> "_Child":
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+        return _Child(self, tuple(str(v) for v in values))
+
+    def _new_value(self):
+        return 0.0
+
+    def _update(self, key: Tuple[str, ...], func):
+        with self._lock:
+            value = self._values.get(key)
+            if value is None:
+                value = self._new_value()
+            self._values[key] = func(value)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.type_name}"]
+        with self._lock:
+            items = sorted(self._values.items())
+            if not items and not self.labelnames:
+                items = [((), self._new_value())]
+            for key, value in items:
+                lines.extend(self._render_value(key, value))
+        return lines
+
+    def _render_value(self, key, value) -> list:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class _Child:
+    """
+    ラベルの値を決めたメトリクス（labels()の戻り値）
+    """
+
+    __slots__ = ("metric", "key")
+
+    def __init__(self, metric: _Metric, key: Tuple[str, ...]):
+        self.metric = metric
+        self.key = key
+
+    def inc(self, amount: float = 1.0):
+        self.metric._update(self.key, lambda value: value + amount)
+
+    def dec(self, amount: float = 1.0):
+        self.metric._update(self.key, lambda value: value - amount)
+
+    def set(self, value: float):
+        self.metric._update(self.key, lambda _: float(value))
+
+    def observe(self, value: float):
+        self.metric._observe(self.key, value)
+
+
+class Counter(_Metric):
+    """単調増加する回数・量"""
+
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    """現在の値（実行中のジョブ数・キューの長さなど）"""
+
+    type_name = "gauge"
+
+    def inc(self, amount: float = 1.0):
+        self.labels().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self.labels().dec(amount)
+
+    def set(self, value: float):
+        self.labels().set(value)
+
+
+class Histogram(_Metric):
+    """観測値の分布（累積バケット・合計・件数）"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def _new_value(self):
+        # [バケットごとの件数..., 合計, 件数]
+        return [0] * len(self.buckets) + [0.0, 0]
+
+    def observe(self, value: float):
+        self.labels().observe(value)
+
+    def _observe(self, key: Tuple[str, ...], value: float):
+        def add(counts):
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            counts[-2] += value
+            counts[-1] += 1
+            return counts
+        self._update(key, add)
+
+    def _render_value(self, key, counts) -> list:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, f'le="{_format_value(bound)}"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(counts[-2])}")
+        lines.append(f"{self.name}_count{labels} {counts[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    プロセス内のメトリクスを登録し、Prometheusのテキスト形式（/metrics）で書き出す
+    値はプロセスごと（複数ワーカーではワーカーごとに収集される）
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric already registered: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                  buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# グローバルインスタンス
+metrics_registry = MetricsRegistry()
+
+# パイプラインの処理段ごとの所要時間
+# upload_read / temp_write / split / decode / encode / asr_call / merge / prompt_build / groq_call / pipeline
+stage_duration = metrics_registry.histogram(
+    "n1_stage_duration_seconds", "Duration of pipeline stages in seconds", ("stage",)
+)
+stage_errors = metrics_registry.counter(
+    "n1_stage_errors_total", "Pipeline stages that raised an error", ("stage",)
+)
+jobs_in_flight = metrics_registry.gauge(
+    "n1_jobs_in_flight", "Analysis pipelines currently running (/analyze requests and queued jobs)"
+)
+job_queue_depth = metrics_registry.gauge("n1_job_queue_depth", "Jobs waiting in the queue")
+jobs_total = metrics_registry.counter("n1_jobs_total", "Finished queued jobs by status", ("status",))
+upstream_requests = metrics_registry.counter(
+    "n1_upstream_requests_total", "Requests sent to upstream APIs (each retry attempt counts)", ("service",)
+)
+upstream_retries = metrics_registry.counter(
+    "n1_upstream_retries_total", "Retried upstream API requests", ("service",)
+)
+upstream_bytes_sent = metrics_registry.counter(
+    "n1_upstream_bytes_sent_total", "Request body bytes sent to upstream APIs", ("service",)
+)
+
+# 区間パイプライン（encode / transcribe）の段ごとの状態（同時実行数・キュー長の調整用）
+pipeline_queued = metrics_registry.gauge(
+    "n1_chunk_pipeline_queued", "Chunks waiting in a chunk pipeline stage queue", ("stage",)
+)
+pipeline_active = metrics_registry.gauge(
+    "n1_chunk_pipeline_active", "Chunks being processed by a chunk pipeline stage", ("stage",)
+)
+pipeline_queue_wait = metrics_registry.histogram(
+    "n1_chunk_pipeline_queue_wait_seconds", "Time a chunk waited in a pipeline stage queue", ("stage",)
+)
+pipeline_busy = metrics_registry.histogram(
+    "n1_chunk_pipeline_busy_seconds", "Time a pipeline stage spent processing one chunk", ("stage",)
+)
+
+
+def observe_stage(stage: str, seconds: float):
+    """
+    計測済みの所要時間を記録する（ワーカープロセスで計った時間など）
+    """
+    stage_duration.labels(stage).observe(seconds)
+
+
+@contextmanager
+def stage_timer(stage: str):
+    """
+    with内の所要時間を処理段の時間として記録する（async関数内のawaitを含めてよい）
+    例外が出た場合も時間を記録し、エラー数を数える
+    """
+    started_at = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        stage_errors.labels(stage).inc()
+        raise
+    finally:
+        observe_stage(stage, time.perf_counter() - started_at)
@@ -0,0 +1,264 @@
+import os
+import uuid
+import asyncio
+import importlib.util
+import orjson
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class ProgressBus:
+    """
+    進捗フレームをプロセス間で配る仕組みの共通インターフェース
+    publishしたフレームは、全プロセス（自プロセスを含む）のon_message(session_id, kind, frame, remote)に届く
+    """
+
+    name = None
+
+    async def start(self, on_message):
+        self.on_message = on_message
+
+    async def stop(self):
+        pass
+
+    def publish(self, session_id: str, kind: str, frame: str):
+        """
+        フレームを配る（待たない）
+        """
+        raise NotImplementedError
+
+    async def get_state(self, session_id: str) -> Optional[str]:
+        """
+        他のプロセスで更新されたセッションの最新の進捗フレーム（なければNone）
+        """
+        return None
+
+    async def register_session(self, session_id: str):
+        """
+        発行したセッションIDを他のプロセスにも知らせる（書き終えてから返す）
+        """
+        pass
+
+    async def has_session(self, session_id: str) -> bool:
+        """
+        他のプロセスで発行されたセッションIDか
+        """
+        return False
+
+    async def save_job(self, job_id: str, record: str, ttl: float):
+        """
+        ジョブの状態と結果（JSON）を他のプロセスからも読めるように保存する（ttl秒で消える）
+        """
+        pass
+
+    async def load_job(self, job_id: str) -> Optional[str]:
+        """
+        他のプロセスで受け付けたジョブの状態と結果（なければNone）
+        """
+        return None
+
+
+class InProcessBus(ProgressBus):
+    """
+    同じプロセス内だけで配る（ワーカー1つ・レプリカ1つの構成用）
+    """
+
+    name = "memory"
+
+    def __init__(self):
+        self.on_message = None
+
+    def publish(self, session_id: str, kind: str, frame: str):
+        if self.on_message is not None:
+            self.on_message(session_id, kind, frame)
+
+
+class BrokerBus(ProgressBus):
+    """
+    pub/subブローカー（Redis互換のset/get/exists/publish/pubsub）で全プロセスに配る共通部分
+    自プロセス宛てにはブローカーを経由せずにすぐ届け、ブローカーへの送信は送信タスクがまとめて行う
+    各セッションの最新の進捗はTTL付きでブローカーにも保存し、別プロセスに後から接続したクライアントへ送る
+    """
+
+    def __init__(self, channel: str = "n1:progress", state_ttl: int = 3600, max_pending: int = 1000):
+        self.channel = channel
+        self.state_ttl = state_ttl
+        # ブローカーへの送信待ちの上限（超えたら古いものから捨てる。進捗は最新だけが意味を持つ）
+        self.max_pending = max(1, max_pending)
+
+        self.origin = uuid.uuid4().hex  # 自プロセスが送ったメッセージを見分ける
+        self.on_message = None
+        self._client = None
+        self._pubsub = None
+        self._outbox = None
+        self._tasks = []
+
+    async def _connect(self):
+        """ブローカーのクライアントを作る"""
+        raise NotImplementedError
+
+    async def start(self, on_message):
+        self.on_message = on_message
+        self._client = await self._connect()
+        self._pubsub = self._client.pubsub()
+        await self._pubsub.subscribe(self.channel)
+        self._outbox = asyncio.Queue(maxsize=self.max_pending)
+        self._tasks = [asyncio.create_task(self._publisher()), asyncio.create_task(self._listener())]
+        logger.info(f"Progress bus: {self.name} (channel {self.channel})")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._pubsub is not None:
+            await self._pubsub.unsubscribe(self.channel)
+            await _close(self._pubsub)
+        if self._client is not None:
+            await _close(self._client)
+
+    def _state_key(self, session_id: str) -> str:
+        return f"{self.channel}:state:{session_id}"
+
+    def _session_key(self, session_id: str) -> str:
+        return f"{self.channel}:session:{session_id}"
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self.channel}:job:{job_id}"
+
+    def publish(self, session_id: str, kind: str, frame: str):
+        # 自プロセスの接続にはすぐ届ける
+        if self.on_message is not None:
+            self.on_message(session_id, kind, frame)
+        self._enqueue(session_id, kind, frame)
+
+    async def register_session(self, session_id: str):
+        # 発行直後に別のプロセスへWebSocketが接続しても拒否されないよう、送信待ちの列を通さず書き終えてから返す
+        if self._client is None:
+            return
+        try:
+            await self._client.set(self._session_key(session_id), "1", ex=self.state_ttl)
+        except Exception as e:
+            logger.error(f"Failed to register progress session in {self.name}: {e}")
+
+    def _enqueue(self, session_id: str, kind: str, frame: str):
+        if self._outbox is None:
+            return
+
+        if self._outbox.full():
+            self._outbox.get_nowait()
+            logger.warning("Progress bus outbox full, dropping oldest frame")
+        self._outbox.put_nowait((session_id, kind, frame))
+
+    async def get_state(self, session_id: str) -> Optional[str]:
+        if self._client is None:
+            return None
+        try:
+            state = await self._client.get(self._state_key(session_id))
+        except Exception as e:
+            logger.error(f"Failed to read progress state from {self.name}: {e}")
+            return None
+        return state.decode() if isinstance(state, bytes) else state
+
+    async def has_session(self, session_id: str) -> bool:
+        if self._client is None:
+            return False
+        try:
+            return bool(await self._client.exists(self._session_key(session_id), self._state_key(session_id)))
+        except Exception as e:
+            logger.error(f"Failed to look up progress session in {self.name}: {e}")
+            return False
+
+    async def save_job(self, job_id: str, record: str, ttl: float):
+        # ジョブの状態は捨てられると取得できなくなるため、送信待ちの列を通さず直接書く
+        if self._client is None:
+            return
+        try:
+            await self._client.set(self._job_key(job_id), record, ex=max(1, int(ttl)))
+        except Exception as e:
+            logger.error(f"Failed to save job {job_id} to {self.name}: {e}")
+
+    async def load_job(self, job_id: str) -> Optional[str]:
+        if self._client is None:
+            return None
+        try:
+            record = await self._client.get(self._job_key(job_id))
+        except Exception as e:
+            logger.error(f"Failed to load job {job_id} from {self.name}: {e}")
+            return None
+        return record.decode() if isinstance(record, bytes) else record
+
+    async def _publisher(self):
+        """送信タスク: 送信待ちのフレームをブローカーへ送る（失敗しても進捗の更新側は止めない）"""
+        while True:
+            session_id, kind, frame = await self._outbox.get()
+            message = orjson.dumps({"origin": self.origin, "session_id": session_id, "kind": kind, "frame": frame})
+            try:
+                if kind == "progress":
+                    await self._client.set(self._state_key(session_id), frame, ex=self.state_ttl)
+                await self._client.publish(self.channel, message)
+            except Exception as e:
+                logger.error(f"Failed to publish progress to {self.name}: {e}")
+
+    async def _listener(self):
+        """受信タスク: 他のプロセスが送ったフレームを自プロセスの接続へ届ける"""
+        while True:
+            try:
+                async for message in self._pubsub.listen():
+                    if message.get("type") != "message":
+                        continue
+                    data = orjson.loads(message["data"])
+                    if data["origin"] == self.origin:
+                        continue
+                    self.on_message(data["session_id"], data["kind"], data["frame"], True)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Progress bus listener error: {e}")
+                await asyncio.sleep(1.0)
+
+
+class RedisBus(BrokerBus):
+    """
+    Redisのpub/subで全プロセスに配る（uvicorn --workers N や複数レプリカ用）
+    """
+
+    name = "redis"
+
+    def __init__(self):
+        if importlib.util.find_spec("redis") is None:
+            raise ValueError("Redis progress bus requires redis (pip install redis)")
+
+        super().__init__(
+            channel=os.getenv("PROGRESS_REDIS_CHANNEL", "n1:progress"),
+            state_ttl=int(float(os.getenv("PROGRESS_SESSION_TTL_SECONDS", "3600"))),
+            max_pending=int(os.getenv("PROGRESS_REDIS_MAX_PENDING", "1000"))
+        )
+        self.url = os.getenv("PROGRESS_REDIS_URL", "redis://localhost:6379/0")
+
+    async def _connect(self):
+        import redis.asyncio as redis
+        return redis.from_url(self.url)
+
+
+async def _close(resource):
+    close = getattr(resource, "aclose", None) or resource.close
+    await close()
+
+
+PROGRESS_BUSES = {
+    InProcessBus.name: InProcessBus,
+    RedisBus.name: RedisBus,
+}
+
+
+def create_progress_bus(name: str = None) -> ProgressBus:
+    """
+    名前から進捗の配信方式を作る（未指定ならPROGRESS_BUSの設定値）
+    """
+    name = (name or os.getenv("PROGRESS_BUS", "memory")).lower()
+    if name not in PROGRESS_BUSES:
+        raise ValueError(f"Unknown progress bus: {name} (available: {', '.join(PROGRESS_BUSES)})")
+    return PROGRESS_BUSES[name]()
@@ -1,69 +1,247 @@
+import os
+import time
+import uuid
 import asyncio
-import json
-from typing import Dict, Set
+import orjson
+from collections import deque, OrderedDict
+from typing import Dict, Optional
 import logging
+from services.progress_bus import ProgressBus, InProcessBus, create_progress_bus
 
 logger = logging.getLogger(__name__)
 
+
+class _Subscriber:
+    """
+    WebSocket接続ごとの送信キューと送信タスク
+    進捗フレームは最新のものだけを残し（古い進捗は送らない）、分析テキストの差分は順番どおりすべて送る
+    """
+
+    def __init__(self, websocket):
+        self.websocket = websocket
+        self.frames = deque()  # (種類, エンコード済みJSON)
+        self.ready = asyncio.Event()
+        self.closed = False
+        self.task = None
+
+    def enqueue(self, kind: str, frame: str):
+        if kind == "progress":
+            # まだ送っていない古い進捗は捨てる（最新の1件だけが意味を持つ）
+            self.frames = deque(item for item in self.frames if item[0] != "progress")
+        self.frames.append((kind, frame))
+        self.ready.set()
+
+
 class ProgressManager:
+    """
+    セッションごとの進捗をWebSocketへ配信する
+    update_progressはキューに積むだけで送信を待たない（遅いクライアントで文字起こしが止まらない）
+    送信は接続ごとの送信タスクが行い、詰まった接続は切断する
+    セッションの最新状態は件数上限とTTL付きで保持し、後から接続したクライアントにも最新状態を送る
+    フレームは配信バス（PROGRESS_BUS）経由で配り、ジョブを実行するプロセスとWebSocketを持つプロセスを分けられる
+    """
+
     def __init__(self):
-        self.connections: Dict[str, Set] = {}
-        self.progress_data: Dict[str, dict] = {}
-    
+        self.connections: Dict[str, Dict] = {}
+        # セッションID → 最新の進捗（Noneは作成済みで未更新）。最終更新が古い順に並ぶ
+        self.sessions: "OrderedDict[str, Optional[dict]]" = OrderedDict()
+        self._touched: Dict[str, float] = {}
+        # 保持するセッション数の上限と、更新がないセッションを破棄するまでの時間（秒）
+        self.max_sessions = max(1, int(os.getenv("PROGRESS_MAX_SESSIONS", "10000")))
+        self.session_ttl = float(os.getenv("PROGRESS_SESSION_TTL_SECONDS", "3600"))
+        # 1接続あたりの未送信フレーム数の上限（超えたら遅いクライアントとして切断）
+        self.max_pending_frames = max(1, int(os.getenv("PROGRESS_MAX_PENDING_FRAMES", "256")))
+        # 1フレームの送信にかけられる時間（秒、超えたら切断）
+        self.send_timeout = float(os.getenv("PROGRESS_SEND_TIMEOUT_SECONDS", "10"))
+        # 起動前（スクリプト・テスト）はプロセス内だけで配る
+        self.bus = InProcessBus()
+        self.bus.on_message = self._on_bus_message
+
+    async def start(self, bus: ProgressBus = None):
+        """配信バス（未指定ならPROGRESS_BUSの設定値）に切り替える（アプリ起動時に呼ぶ）"""
+        bus = bus or create_progress_bus()
+        if bus.name == self.bus.name:
+            return
+        await bus.start(self._on_bus_message)
+        self.bus = bus
+        logger.info(f"Progress bus started: {bus.name}")
+
+    async def stop(self):
+        """配信バスを停止（アプリ終了時に呼ぶ）"""
+        bus, self.bus = self.bus, InProcessBus()
+        self.bus.on_message = self._on_bus_message
+        await bus.stop()
+
+    async def create_session(self) -> str:
+        """サーバー側でセッションIDを発行する（推測できないID、他の利用者と衝突しない。他のプロセスに登録してから返す）"""
+        session_id = uuid.uuid4().hex
+        self._touch(session_id)
+        await self.bus.register_session(session_id)
+        return session_id
+
+    async def has_session(self, session_id: str) -> bool:
+        """発行済み（期限内）のセッションIDか（他のプロセスで発行されたものも含む）"""
+        if session_id in self.sessions:
+            return True
+        return await self.bus.has_session(session_id)
+
+    def get_progress(self, session_id: str) -> Optional[dict]:
+        """セッションの最新の進捗（なければNone）"""
+        return self.sessions.get(session_id)
+
+    def _touch(self, session_id: str, progress_info: Optional[dict] = None):
+        """セッションの状態を更新し、期限切れ・上限超過のセッションを古い順に破棄する"""
+        now = time.monotonic()
+        if progress_info is not None:
+            self.sessions[session_id] = progress_info
+        elif session_id not in self.sessions:
+            self.sessions[session_id] = None
+        self.sessions.move_to_end(session_id)
+        self._touched[session_id] = now
+        self._prune(now)
+
+    def _prune(self, now: float):
+        # 接続中のセッションは破棄せず、最後尾に回す（一巡したら止める）
+        for _ in range(len(self.sessions)):
+            oldest = next(iter(self.sessions))
+            expired = now - self._touched[oldest] > self.session_ttl
+            if not expired and len(self.sessions) <= self.max_sessions:
+                break
+            if oldest in self.connections:
+                self.sessions.move_to_end(oldest)
+                self._touched[oldest] = now
+                continue
+            del self.sessions[oldest]
+            del self._touched[oldest]
+            logger.debug(f"Evicted progress session {oldest} ({'expired' if expired else 'over limit'})")
+
     async def add_connection(self, session_id: str, websocket):
-        """WebSocket接続を追加"""
-        if session_id not in self.connections:
-            self.connections[session_id] = set()
-        self.connections[session_id].add(websocket)
-        print(f"🔗 [WEBSOCKET] 接続追加: {session_id} (接続数: {len(self.connections[session_id])})")
-        logger.info(f"Added connection for session {session_id}")
-    
+        """WebSocket接続を追加（最新の進捗があればすぐに送る）"""
+        subscribers = self.connections.setdefault(session_id, {})
+        subscriber = _Subscriber(websocket)
+        subscriber.task = asyncio.create_task(self._writer(session_id, subscriber))
+        subscribers[websocket] = subscriber
+        self._touch(session_id)
+
+        last_progress = self.sessions.get(session_id)
+        if last_progress is not None:
+            subscriber.enqueue("progress", orjson.dumps(last_progress).decode())
+        else:
+            # 別のプロセスで実行中のセッションは、バスに保存された最新状態を送る
+            frame = await self.bus.get_state(session_id)
+            if frame is not None and self.sessions.get(session_id) is None:
+                self._touch(session_id, orjson.loads(frame))
+                subscriber.enqueue("progress", frame)
+        logger.info(f"Added connection for session {session_id} ({len(subscribers)} connections)")
+
     async def remove_connection(self, session_id: str, websocket):
         """WebSocket接続を削除"""
-        if session_id in self.connections:
-            self.connections[session_id].discard(websocket)
-            if not self.connections[session_id]:
-                del self.connections[session_id]
-                if session_id in self.progress_data:
-                    del self.progress_data[session_id]
+        subscriber = self._detach(session_id, websocket)
+        if subscriber is not None and subscriber.task is not asyncio.current_task():
+            subscriber.task.cancel()
         logger.info(f"Removed connection for session {session_id}")
-    
-    async def update_progress(self, session_id: str, stage: str, progress: int, message: str = ""):
-        """進捗を更新してクライアントに送信"""
+
+    def _detach(self, session_id: str, websocket):
+        subscribers = self.connections.get(session_id)
+        if subscribers is None:
+            return None
+        subscriber = subscribers.pop(websocket, None)
+        if subscriber is not None:
+            subscriber.closed = True
+            subscriber.ready.set()
+        if not subscribers:
+            # 進捗の状態はTTLまで残す（再接続したクライアントに最新状態を送るため）
+            del self.connections[session_id]
+        return subscriber
+
+    async def update_progress(self, session_id: str, stage: str, progress: int, message: str = "",
+                              details: Optional[dict] = None):
+        """進捗を更新してクライアントに送信（送信は待たない）
+        detailsには実測値（処理済みの音声秒数・処理速度・残り時間など）を添えられる"""
         progress_info = {
             "stage": stage,
             "progress": progress,
             "message": message,
-            "timestamp": asyncio.get_event_loop().time()
+            "timestamp": time.time()
+        }
+        if details is not None:
+            progress_info["details"] = details
+
+        self._touch(session_id, progress_info)
+
+        # 全プロセスの接続中のクライアントに送信（JSONへのエンコードは1回だけ）
+        self.bus.publish(session_id, "progress", orjson.dumps(progress_info).decode())
+
+        logger.debug(f"Progress updated for {session_id}: {stage} - {progress}% - {message}")
+
+    async def send_analysis_delta(self, session_id: str, delta: str):
+        """生成中の分析テキストの差分をクライアントに送信（進捗状態としては保存しない）"""
+        last_progress = self.sessions.get(session_id) or {}
+        delta_info = {
+            "type": "analysis_delta",
+            "stage": "analysis",
+            "progress": last_progress.get("progress", 80),
+            "message": "AI分析結果を生成中...",
+            "delta": delta,
+            "timestamp": time.time()
         }
-        
-        self.progress_data[session_id] = progress_info
-        
-        # 接続中のクライアントに送信
-        if session_id in self.connections:
-            print(f"📤 [WEBSOCKET] 送信準備: {session_id} (接続数: {len(self.connections[session_id])})")
-            disconnected = set()
-            for websocket in self.connections[session_id]:
+        self.bus.publish(session_id, "delta", orjson.dumps(delta_info).decode())
+
+    def _on_bus_message(self, session_id: str, kind: str, frame: str, remote: bool = False):
+        """バスから届いたフレームを処理する（他のプロセスの進捗は最新状態としても保持する）"""
+        if remote and kind == "progress":
+            self._touch(session_id, orjson.loads(frame))
+        self._broadcast(session_id, kind, frame)
+
+    def _broadcast(self, session_id: str, kind: str, frame: str):
+        """このプロセスで接続中のセッションの全接続の送信キューに積む"""
+        subscribers = self.connections.get(session_id)
+        if not subscribers:
+            return
+
+        for websocket, subscriber in list(subscribers.items()):
+            subscriber.enqueue(kind, frame)
+            if len(subscriber.frames) > self.max_pending_frames:
+                logger.warning(
+                    f"Dropping slow progress subscriber for {session_id}: "
+                    f"{len(subscriber.frames)} frames pending"
+                )
+                self._evict(session_id, subscriber)
+
+    def _evict(self, session_id: str, subscriber: _Subscriber):
+        """詰まった接続を切り離し、送信タスク側で閉じさせる"""
+        self._detach(session_id, subscriber.websocket)
+        subscriber.frames.clear()
+
+    async def _writer(self, session_id: str, subscriber: _Subscriber):
+        """接続ごとの送信タスク: キューのフレームを順に送る"""
+        websocket = subscriber.websocket
+        try:
+            while True:
+                await subscriber.ready.wait()
+                if subscriber.closed:
+                    break
+                if not subscriber.frames:
+                    subscriber.ready.clear()
+                    continue
+
+                _, frame = subscriber.frames.popleft()
                 try:
-                    await websocket.send_text(json.dumps(progress_info))
-                    # WebSocketの送信を強制的にフラッシュ
-                    if hasattr(websocket, 'transport') and hasattr(websocket.transport, 'write'):
-                        try:
-                            await websocket.transport.drain()
-                        except:
-                            pass
-                    # 送信成功をログ出力
-                    print(f"📡 [WEBSOCKET] Sent to client: {progress}% - {stage} - {message}")
+                    await asyncio.wait_for(websocket.send_text(frame), timeout=self.send_timeout)
+                except asyncio.TimeoutError:
+                    logger.warning(f"Progress send timed out for {session_id}, dropping connection")
+                    break
                 except Exception as e:
                     logger.error(f"Failed to send progress to websocket: {e}")
-                    disconnected.add(websocket)
-            
-            # 切断されたWebSocketを削除
-            for ws in disconnected:
-                await self.remove_connection(session_id, ws)
-        
-        logger.info(f"Progress updated for {session_id}: {stage} - {progress}% - {message}")
-        print(f"📊 [PROGRESS] {progress}% - {stage} - {message}")
+                    break
+        finally:
+            self._detach(session_id, websocket)
+
+        # 詰まった・送信に失敗した接続は閉じる（クライアントは再接続で最新の進捗を受け取れる）
+        try:
+            await asyncio.wait_for(websocket.close(code=1013), timeout=self.send_timeout)
+        except Exception:
+            pass
 
 # グローバルインスタンス
 progress_manager = ProgressManager()
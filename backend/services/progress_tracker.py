@@ -0,0 +1,176 @@
+import os
+import time
+from collections import deque
+from typing import Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def format_eta(seconds: Optional[float]) -> str:
+    """
+    残り時間の表示（推定できなければ「計測中」）
+    """
+    if seconds is None:
+        return "残り時間を計測中"
+    seconds = int(round(seconds))
+    if seconds < 60:
+        return f"残り約{seconds}秒"
+    return f"残り約{seconds // 60}分{seconds % 60:02d}秒"
+
+
+class ThroughputMeter:
+    """
+    直近の一定時間に処理した量（音声秒など）から処理速度を求める
+    """
+
+    def __init__(self, window_seconds: float, started_at: float = None):
+        self.window_seconds = window_seconds
+        self.started_at = time.monotonic() if started_at is None else started_at
+        self.samples = deque()  # (完了時刻, 処理量)
+
+    def record(self, units: float, now: float = None):
+        now = time.monotonic() if now is None else now
+        self.samples.append((now, units))
+        self._trim(now)
+
+    def rate(self, now: float = None) -> Optional[float]:
+        """
+        1秒あたりの処理量（まだ完了がなければNone）
+        """
+        now = time.monotonic() if now is None else now
+        self._trim(now)
+        if not self.samples:
+            return None
+        span = now - max(self.started_at, now - self.window_seconds)
+        if span <= 0:
+            return None
+        return sum(units for _, units in self.samples) / span
+
+    def _trim(self, now: float):
+        while self.samples and self.samples[0][0] < now - self.window_seconds:
+            self.samples.popleft()
+
+
+class RecognitionSpeed:
+    """
+    音声認識エンジンごとの1リクエストあたりの速度（音声秒 / 経過秒）の移動平均
+    ジョブ内でまだ完了がない間の残り時間の見積もりに使う
+    """
+
+    def __init__(self):
+        self.smoothing = 0.3
+        self._speeds: Dict[str, float] = {}
+
+    def record(self, backend_name: str, audio_seconds: float, elapsed: float):
+        if audio_seconds <= 0 or elapsed <= 0:
+            return
+        speed = audio_seconds / elapsed
+        previous = self._speeds.get(backend_name)
+        self._speeds[backend_name] = speed if previous is None else (
+            previous + self.smoothing * (speed - previous)
+        )
+
+    def get(self, backend_name: str) -> Optional[float]:
+        return self._speeds.get(backend_name)
+
+
+class TranscriptionProgress:
+    """
+    文字起こしの実測の進捗（完了した区間の音声秒数）と、直近の処理速度から求めた残り時間
+    進捗率は start_percent〜end_percent の範囲で、文字起こし済みの音声秒数の割合に比例する
+    """
+
+    def __init__(self, session_id: str, progress_manager, backend_name: str, total_audio_seconds: float,
+                 total_chunks: int = 1, parallelism: int = 1, start_percent: int = 15, end_percent: int = 78):
+        self.session_id = session_id
+        self.progress_manager = progress_manager
+        self.backend_name = backend_name
+        self.total_audio_seconds = max(total_audio_seconds, 0.001)
+        self.total_chunks = total_chunks
+        self.parallelism = max(1, parallelism)
+        self.start_percent = start_percent
+        self.end_percent = end_percent
+
+        self.done_audio_seconds = 0.0
+        self.done_chunks = 0
+        self.active_chunks = 0
+        self.meter = ThroughputMeter(float(os.getenv("PROGRESS_THROUGHPUT_WINDOW_SECONDS", "60")))
+
+    def percent(self) -> int:
+        ratio = min(1.0, self.done_audio_seconds / self.total_audio_seconds)
+        return self.start_percent + int(ratio * (self.end_percent - self.start_percent))
+
+    def throughput(self) -> Optional[float]:
+        """
+        このジョブの直近の処理速度（音声秒 / 秒）
+        """
+        return self.meter.rate()
+
+    def eta_seconds(self) -> Optional[float]:
+        """
+        残り時間の見積もり（秒）
+        ジョブ内の直近の処理速度を使い、まだ完了がなければエンジンの過去の速度×同時実行数で見積もる
+        """
+        remaining = max(0.0, self.total_audio_seconds - self.done_audio_seconds)
+        rate = self.throughput()
+        if rate is None:
+            speed = recognition_speed.get(self.backend_name)
+            if speed is None:
+                return None
+            rate = speed * min(self.parallelism, max(1, self.total_chunks - self.done_chunks))
+        return remaining / rate if rate > 0 else None
+
+    def details(self) -> dict:
+        throughput = self.throughput()
+        eta = self.eta_seconds()
+        return {
+            "audio_seconds_done": round(self.done_audio_seconds, 1),
+            "audio_seconds_total": round(self.total_audio_seconds, 1),
+            "chunks_done": self.done_chunks,
+            "chunks_total": self.total_chunks,
+            "chunks_active": self.active_chunks,
+            "throughput": round(throughput, 2) if throughput is not None else None,
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+        }
+
+    def skip(self, audio_seconds: float):
+        """
+        キャッシュから再利用した区間（処理速度には含めない）
+        """
+        self.done_audio_seconds += audio_seconds
+        self.done_chunks += 1
+
+    async def report(self, message: str):
+        """
+        現在の進捗を送信する（メッセージに残り時間を添える）
+        """
+        await self.progress_manager.update_progress(
+            self.session_id,
+            "transcribing",
+            self.percent(),
+            f"{message}（{format_eta(self.eta_seconds())}）",
+            details=self.details()
+        )
+
+    async def chunk_started(self, message: str):
+        self.active_chunks += 1
+        await self.report(message)
+
+    async def chunk_finished(self, audio_seconds: float, elapsed: float, message: str):
+        """
+        区間の文字起こしが完了した（処理速度とエンジンの速度の記録を更新する）
+        """
+        self.active_chunks = max(0, self.active_chunks - 1)
+        self.done_audio_seconds += audio_seconds
+        self.done_chunks += 1
+        self.meter.record(audio_seconds)
+        recognition_speed.record(self.backend_name, audio_seconds, elapsed)
+        await self.report(message)
+
+    def chunk_failed(self):
+        self.active_chunks = max(0, self.active_chunks - 1)
+
+
+# グローバルインスタンス（エンジンごとの速度はジョブをまたいで共有する）
+recognition_speed = RecognitionSpeed()
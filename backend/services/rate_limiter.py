@@ -0,0 +1,198 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from email.utils import parsedate_to_datetime
+import httpx
+import openai
+from services.metrics import upstream_retries
+
+logger = logging.getLogger(__name__)
+
+# リトライ設定（指数バックオフ＋ジッター）
+RETRY_MAX_ATTEMPTS = max(1, int(os.getenv("API_RETRY_MAX_ATTEMPTS", "5")))
+RETRY_BASE_DELAY = float(os.getenv("API_RETRY_BASE_DELAY_SECONDS", "2"))
+RETRY_MAX_DELAY = float(os.getenv("API_RETRY_MAX_DELAY_SECONDS", "60"))
+
+# リトライで回復しうるHTTPステータス
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    1分あたりの上限量を平滑に補充するトークンバケット
+    rate_per_minuteが0以下なら無制限
+    """
+
+    def __init__(self, rate_per_minute: float):
+        self.capacity = float(rate_per_minute)
+        self.rate_per_second = self.capacity / 60.0
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.capacity > 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate_per_second)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1.0) -> float:
+        """
+        指定量が補充されるまで待って消費する。待った秒数を返す
+        ロックで待ち行列を作り、先に来た呼び出しから順に通す
+        """
+        if not self.enabled or amount <= 0:
+            return 0.0
+
+        # 1回でバケット容量を超える要求は容量いっぱいとして扱う（永久に待たないように）
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                delay = (amount - self.tokens) / self.rate_per_second
+                await asyncio.sleep(delay)
+                waited += delay
+
+
+class RateLimiter:
+    """
+    上流APIごとのプロセス全体のレート制限（リクエスト数/分と、音声秒数やトークン数/分）
+    429を受けたら全呼び出しをまとめて一時停止させる
+    """
+
+    def __init__(self, name: str, requests_per_minute: float, units_per_minute: float = 0):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute)
+        self.units = TokenBucket(units_per_minute)
+        self.paused_until = 0.0
+
+    async def acquire(self, units: float = 0.0):
+        """
+        1リクエスト分（と指定量のユニット）の枠が空くまで待つ
+        """
+        while True:
+            delay = self.paused_until - time.monotonic()
+            if delay <= 0:
+                break
+            await asyncio.sleep(delay)
+
+        waited = await self.requests.acquire(1)
+        waited += await self.units.acquire(units)
+        if waited >= 1.0:
+            logger.info(f"{self.name} rate limit: waited {waited:.1f}s")
+
+    def pause(self, seconds: float):
+        """
+        上流からレート制限を受けたとき、全呼び出しを指定秒数止める
+        """
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        logger.warning(f"{self.name} rate limited by server, pausing all calls for {seconds:.1f}s")
+
+
+def get_status_code(error: Exception):
+    """
+    例外からHTTPステータスを取り出す（OpenAI SDK / httpx）
+    """
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return status_code
+
+
+def get_retry_after(error: Exception):
+    """
+    レスポンスのRetry-After（秒またはHTTP日付）を秒数で返す（なければNone）
+    """
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+
+    retry_after_ms = headers.get("retry-after-ms")
+    if retry_after_ms:
+        try:
+            return max(0.0, float(retry_after_ms) / 1000.0)
+        except ValueError:
+            pass
+
+    retry_after = headers.get("retry-after")
+    if not retry_after:
+        return None
+    try:
+        return max(0.0, float(retry_after))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    タイムアウト・接続エラー・429・5xxはリトライする。それ以外（400/401等）は即座に失敗させる
+    """
+    if isinstance(error, (asyncio.TimeoutError, httpx.TimeoutException, httpx.TransportError, openai.APIConnectionError)):
+        return True
+    status_code = get_status_code(error)
+    return status_code in RETRYABLE_STATUS_CODES or (status_code is not None and status_code >= 500)
+
+
+def backoff_delay(attempt: int) -> float:
+    """
+    指数バックオフ（上限付き）の後半をランダムにしたジッター付き待ち時間
+    """
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * (2 ** attempt))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+async def retry_with_backoff(request, limiter: RateLimiter, label: str, units: float = 0.0,
+                             max_attempts: int = None, is_retryable=is_retryable_error):
+    """
+    レート制限の枠を取ってからrequest()を実行し、回復しうる失敗は待ってリトライする
+    サーバーがRetry-Afterを返した場合はその時間を優先する
+    """
+    max_attempts = max_attempts or RETRY_MAX_ATTEMPTS
+
+    for attempt in range(max_attempts):
+        await limiter.acquire(units)
+        try:
+            return await request()
+        except Exception as e:
+            if attempt == max_attempts - 1 or not is_retryable(e):
+                raise
+
+            status_code = get_status_code(e)
+            retry_after = get_retry_after(e)
+            delay = backoff_delay(attempt)
+            if retry_after is not None:
+                delay = retry_after + random.uniform(0, 1.0)
+            if status_code == 429:
+                limiter.pause(delay)
+
+            reason = f"HTTP {status_code}" if status_code else type(e).__name__
+            upstream_retries.labels(limiter.name.lower()).inc()
+            logger.warning(f"{label} failed ({reason}), retrying in {delay:.1f}s (attempt {attempt+1}/{max_attempts})")
+            await asyncio.sleep(delay)
+
+
+# プロセス全体で共有するレート制限（全ジョブ・全サービス共通）
+openai_rate_limiter = RateLimiter(
+    "OpenAI",
+    requests_per_minute=float(os.getenv("OPENAI_REQUESTS_PER_MINUTE", "50")),
+    units_per_minute=float(os.getenv("OPENAI_AUDIO_SECONDS_PER_MINUTE", "0"))
+)
+groq_rate_limiter = RateLimiter(
+    "Groq",
+    requests_per_minute=float(os.getenv("GROQ_REQUESTS_PER_MINUTE", "30")),
+    units_per_minute=float(os.getenv("GROQ_TOKENS_PER_MINUTE", "0"))
+)
@@ -0,0 +1,182 @@
+import os
+import re
+import logging
+from difflib import SequenceMatcher
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# 比較時に無視する空白・句読点
+_IGNORED_CHARS = re.compile(r"[\s、。，,．.!！?？・「」『』（）()\-ー…]")
+
+
+class TranscriptMerger:
+    """
+    分割して文字起こしした区間を1本の時系列にマージする
+    各区間の実際の開始時刻（original_start_time）で絶対時刻に直し、
+    隣り合う区間の重なり部分で同じ発話をテキストと時刻の近さで対応付けて、切れ目を1か所に決める
+    対応が見つからない境界は分割計画の切れ目（発話の中央がどちら側か）で振り分ける
+    境界ごとに比較する発話数は定数で抑えるため、全体の計算量は発話数に対して線形
+    """
+
+    def __init__(self):
+        # 同じ発話とみなすテキスト類似度の下限（0〜1）
+        self.min_similarity = float(os.getenv("TRANSCRIPT_MERGE_MIN_SIMILARITY", "0.6"))
+        # 同じ発話とみなす中央時刻のずれの上限（秒）
+        self.max_time_gap = float(os.getenv("TRANSCRIPT_MERGE_MAX_TIME_GAP", "1.5"))
+        # 境界の前後で比較する発話数の上限
+        self.max_candidates = int(os.getenv("TRANSCRIPT_MERGE_MAX_CANDIDATES", "8"))
+        # 途切れた発話を包含関係で照合する最小文字数（短すぎる相づち等は誤照合しやすいため）
+        self.min_containment_chars = 4
+        # 途切れた発話同士をつなぎ合わせるのに必要な重なりの文字数と、端からのずれの許容文字数
+        self.min_stitch_chars = 3
+        self.stitch_slack_chars = 2
+
+    def merge(self, chunks) -> list:
+        """
+        index順の区間情報（_chunk_entryの形式）から、絶対時刻の発話リストを返す
+        戻り値: [{"start", "end", "text"}, ...]
+        """
+        chunks = sorted(chunks, key=lambda c: c['index'])
+        arrays = [self._to_arrays(chunk) for chunk in chunks]
+        keep = [np.ones(len(a["starts"]), dtype=bool) for a in arrays]
+
+        aligned = 0
+        for i in range(len(chunks) - 1):
+            prev, nxt = chunks[i], chunks[i + 1]
+            match = None
+            # 間の区間が失敗で欠けている場合は重なりがないので、切れ目だけで振り分ける
+            if nxt['index'] == prev['index'] + 1:
+                match = self._find_overlap_match(prev, arrays[i], nxt, arrays[i + 1])
+
+            if match is not None:
+                prev_index, next_index, keep_prev, stitched_text = match
+                keep[i][prev_index + 1:] = False
+                keep[i + 1][:next_index] = False
+                if stitched_text is not None:
+                    # 両方の区間で途切れた発話は、重なった文字でつなぎ合わせて1つにする
+                    arrays[i]["texts"][prev_index] = stitched_text
+                    arrays[i]["ends"][prev_index] = arrays[i + 1]["ends"][next_index]
+                    keep[i + 1][next_index] = False
+                # 重複した発話は区間の端から遠い（途切れていない可能性が高い）方を残す
+                elif keep_prev:
+                    keep[i + 1][next_index] = False
+                else:
+                    keep[i][prev_index] = False
+                aligned += 1
+            else:
+                keep[i] &= arrays[i]["midpoints"] < prev['cut_end_time']
+                keep[i + 1] &= arrays[i + 1]["midpoints"] >= nxt['cut_start_time']
+
+        logger.info(f"Merged {len(chunks)} chunks: {aligned} boundaries aligned by text, "
+                    f"{max(0, len(chunks) - 1 - aligned)} by planned cut")
+
+        merged = []
+        for a, mask in zip(arrays, keep):
+            for index in np.flatnonzero(mask):
+                merged.append({
+                    "start": float(a["starts"][index]),
+                    "end": float(a["ends"][index]),
+                    "text": a["texts"][index]
+                })
+        return merged
+
+    def _to_arrays(self, chunk) -> dict:
+        """
+        区間の発話を絶対時刻のnumpy配列にまとめる
+        """
+        segments = chunk['transcript']['segments']
+        offset = chunk['original_start_time']
+        starts = np.fromiter((s['start'] for s in segments), dtype=np.float64, count=len(segments)) + offset
+        ends = np.fromiter((s['end'] for s in segments), dtype=np.float64, count=len(segments)) + offset
+        return {
+            "starts": starts,
+            "ends": ends,
+            "midpoints": (starts + ends) / 2,
+            "texts": [s['text'] for s in segments],
+        }
+
+    def _find_overlap_match(self, prev_chunk, prev, next_chunk, nxt):
+        """
+        重なり部分で同じ発話の組を探す
+        戻り値: (前区間の発話index, 次区間の発話index, 前区間側を残すか, つなぎ合わせたテキスト) または None
+        """
+        overlap_start = next_chunk['original_start_time'] - self.max_time_gap
+        overlap_end = prev_chunk['original_end_time'] + self.max_time_gap
+
+        prev_candidates = np.flatnonzero(prev["ends"] > overlap_start)[-self.max_candidates:]
+        next_candidates = np.flatnonzero(nxt["starts"] < overlap_end)[:self.max_candidates]
+        if len(prev_candidates) == 0 or len(next_candidates) == 0:
+            return None
+
+        # 中央時刻が近い組、または時間が重なる組（長い発話が境界で途切れると中央がずれる）だけをテキストで比較する
+        # 同じ発話（類似度が高い）の組を優先し、なければ前後で途切れた発話をつなぎ合わせる
+        gaps = np.abs(prev["midpoints"][prev_candidates][:, None] - nxt["midpoints"][next_candidates][None, :])
+        overlapping = (
+            (prev["ends"][prev_candidates][:, None] > nxt["starts"][next_candidates][None, :])
+            & (prev["starts"][prev_candidates][:, None] < nxt["ends"][next_candidates][None, :])
+        )
+        best_same = None
+        best_stitch = None
+        for pi, ni in zip(*np.nonzero((gaps <= self.max_time_gap) | overlapping)):
+            prev_index = int(prev_candidates[pi])
+            next_index = int(next_candidates[ni])
+            prev_text = prev["texts"][prev_index]
+            next_text = nxt["texts"][next_index]
+
+            # 時間が重なり、末尾と先頭の文字が重なる組は、途切れた発話同士としてつなぎ合わせる
+            # （つないだ方がどちらよりも長くなる場合のみ。同じ発話の重複なら長さは変わらない）
+            if prev["ends"][prev_index] > nxt["starts"][next_index]:
+                stitch = self._stitch(prev_text, next_text)
+                if stitch is not None and len(stitch[1]) > max(len(prev_text), len(next_text)) + self.stitch_slack_chars:
+                    if best_stitch is None or stitch[0] > best_stitch[0]:
+                        best_stitch = (stitch[0], prev_index, next_index, stitch[1])
+                    continue
+
+            similarity = self._similarity(prev_text, next_text)
+            if similarity >= self.min_similarity:
+                score = similarity - 0.1 * min(1.0, gaps[pi, ni] / self.max_time_gap)
+                if best_same is None or score > best_same[0]:
+                    best_same = (score, prev_index, next_index)
+
+        if best_same is not None:
+            _, prev_index, next_index = best_same
+            prev_margin = prev_chunk['original_end_time'] - prev["ends"][prev_index]
+            next_margin = nxt["starts"][next_index] - next_chunk['original_start_time']
+            return prev_index, next_index, prev_margin >= next_margin, None
+
+        if best_stitch is not None:
+            _, prev_index, next_index, stitched_text = best_stitch
+            return prev_index, next_index, True, stitched_text
+
+        return None
+
+    def _stitch(self, prev_text: str, next_text: str):
+        """
+        前の発話の末尾と次の発話の先頭が重なっていれば、つなぎ合わせたテキストを返す
+        戻り値: (重なった文字数, つなぎ合わせたテキスト) または None
+        """
+        matcher = SequenceMatcher(None, prev_text, next_text, autojunk=False)
+        block = matcher.find_longest_match(0, len(prev_text), 0, len(next_text))
+        if block.size < self.min_stitch_chars:
+            return None
+        # 重なりが前の発話の末尾と次の発話の先頭にあること（数文字の揺れは許容する）
+        if len(prev_text) - (block.a + block.size) > self.stitch_slack_chars or block.b > self.stitch_slack_chars:
+            return None
+        return block.size, prev_text[:block.a + block.size] + next_text[block.b + block.size:]
+
+    def _similarity(self, a: str, b: str) -> float:
+        """
+        テキストの類似度（0〜1）
+        区間の端で途切れた発話も拾えるよう、短い方がもう一方に含まれる割合も考慮する
+        """
+        a = _IGNORED_CHARS.sub("", a)
+        b = _IGNORED_CHARS.sub("", b)
+        if not a or not b:
+            return 0.0
+        matched = sum(block.size for block in SequenceMatcher(None, a, b, autojunk=False).get_matching_blocks())
+        ratio = 2 * matched / (len(a) + len(b))
+        shorter = min(len(a), len(b))
+        if shorter < self.min_containment_chars:
+            return ratio
+        return max(ratio, matched / shorter)
@@ -1,11 +1,19 @@
 import os
-import tempfile
-import math
+import time
 import logging
 import asyncio
-from pydub import AudioSegment
-from openai import OpenAI
-from models.schemas import TranscriptionResult, TranscriptionSegment
+from services.asr_backends import get_asr_backend
+from services.audio_splitter import AudioSplitter
+from services.audio_workers import audio_workers, plan_chunk_windows, encode_chunk_window
+from services.chunk_pipeline import ChunkPipeline, PipelineStage
+from services.audio_encoder import SegmentEncoder, EncodedAudio, WHISPER_MAX_UPLOAD_SIZE
+from services.chunk_planner import ChunkBoundaryPlanner
+from services.transcript_merge import TranscriptMerger
+from services.progress_tracker import TranscriptionProgress
+from services.transcription_cache import TranscriptionCache, hash_file
+from services.metrics import stage_timer, observe_stage
+from models.schemas import TranscriptionResult, ChunkReport
+from models.transcript_store import SegmentStore
 
 logger = logging.getLogger(__name__)
 
@@ -16,128 +24,139 @@ def get_progress_manager():
 
 class TranscriptionService:
     def __init__(self):
-        self.client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        # 大きなファイルの分割処理で同時に投げるセグメント数の上限
+        self.max_concurrency = max(1, int(os.getenv("TRANSCRIPTION_MAX_CONCURRENCY", "4")))
+        # 分割区間のエンコードを同時に進める数（既定はワーカープロセス数）
+        self.encode_concurrency = max(1, int(os.getenv(
+            "TRANSCRIPTION_ENCODE_CONCURRENCY", str(audio_workers.num_workers or 2)
+        )))
+        # エンコード済みで文字起こし待ちの区間を溜めておける数（一時ファイル数の上限に効く）
+        self.pipeline_queue_size = max(1, int(os.getenv("TRANSCRIPTION_PIPELINE_QUEUE_SIZE", "2")))
+        # 分割区間を圧縮してアップロードするエンコーダー（エンジンが形式を指定する場合はその形式のものも持つ）
+        self.segment_encoder = SegmentEncoder()
+        self._segment_encoders = {self.segment_encoder.segment_format: self.segment_encoder}
+        # 無音位置で分割点を決めるプランナー
+        self.boundary_planner = ChunkBoundaryPlanner()
+        # 区間の重なり部分を対応付けて結果をマージするエンジン
+        self.transcript_merger = TranscriptMerger()
+        # 音声ハッシュをキーにした文字起こし結果のキャッシュ
+        self.result_cache = TranscriptionCache(namespace="results")
+        # 区間ごとの文字起こし結果のキャッシュ（失敗したジョブの再開用）
+        self.chunk_cache = TranscriptionCache(namespace="chunks")
     
-    async def transcribe(self, audio_file_path: str, session_id: str = "default") -> TranscriptionResult:
+    async def transcribe(self, audio_file_path: str, session_id: str = "default", source_hash: str = None,
+                         asr_backend: str = None) -> TranscriptionResult:
         """
-        OpenAI Whisper APIを使用して音声ファイルを文字起こしする
+        音声認識エンジン（OpenAI Whisper API / ローカル）で音声ファイルを文字起こしする
+        エンジンはasr_backendで指定（未指定ならASR_BACKENDの設定値）
         大きなファイルは分割して処理する
+        同じ音声・同じパラメータの結果はキャッシュから返す
         """
         try:
+            backend = get_asr_backend(asr_backend)
+
+            # 音声ハッシュ＋パラメータでキャッシュを確認
+            if source_hash is None:
+                source_hash = await asyncio.to_thread(hash_file, audio_file_path)
+            cache_key = self.result_cache.make_key(
+                source_hash, {**self._transcription_params(backend), **self._merge_params()}
+            )
+            cached = await asyncio.to_thread(self.result_cache.get, cache_key)
+            if cached is not None:
+                logger.info(f"Transcription cache hit: {cache_key}")
+                print(f"⚡ [CACHE] 文字起こしキャッシュを使用 ({source_hash[:12]})")
+                await get_progress_manager().update_progress(
+                    session_id, "transcription_complete", 78, "音声認識完了（キャッシュ）"
+                )
+                return TranscriptionResult(**cached)
+
             # ファイルサイズをチェック
             file_size = os.path.getsize(audio_file_path)
-            max_size = 25 * 1024 * 1024  # 25MB
-
-            if file_size <= max_size:
+            if file_size <= backend.max_single_file_size:
                 # 小さなファイルは直接処理
-                return await self._transcribe_single_file(audio_file_path, session_id)
+                result = await self._transcribe_single_file(audio_file_path, session_id, backend)
             else:
-                # 大きなファイルは分割して処理
-                return await self._transcribe_large_file(audio_file_path, session_id)
+                # 大きなファイル（ローカル認識では全ファイル）は分割して処理
+                result = await self._transcribe_large_file(audio_file_path, session_id, source_hash, backend)
+
+            # 全区間が文字起こしできた結果のみキャッシュする
+            if result.segments and not (result.chunk_report and result.chunk_report.failed):
+                await asyncio.to_thread(
+                    self.result_cache.put, cache_key, result.model_dump(exclude={"chunk_report", "full_text"})
+                )
+            return result
         except Exception as e:
             raise Exception(f"Transcription failed: {str(e)}")
 
-    async def _transcribe_single_file(self, audio_file_path: str, session_id: str) -> TranscriptionResult:
+    def _segment_encoder_for(self, backend) -> SegmentEncoder:
         """
-        単一ファイルの文字起こし（疑似進捗付き）
+        エンジンに渡す区間のエンコーダー（ローカル認識はPCMのWAV、それ以外は設定値の形式）
         """
-        progress_manager = get_progress_manager()
+        segment_format = backend.segment_format or self.segment_encoder.segment_format
+        if segment_format not in self._segment_encoders:
+            self._segment_encoders[segment_format] = SegmentEncoder(segment_format)
+        return self._segment_encoders[segment_format]
 
-        # 音声ファイルの長さを取得して推定時間を計算
-        audio = AudioSegment.from_file(audio_file_path)
-        duration_seconds = len(audio) / 1000.0
+    def _transcription_params(self, backend) -> dict:
+        """
+        文字起こし結果に影響するパラメータ（キャッシュキーの一部）
+        """
+        segment_encoder = self._segment_encoder_for(backend)
+        return {
+            **backend.cache_params(),
+            "segment_format": segment_encoder.segment_format,
+            "segment_bitrate_kbps": segment_encoder.bitrate_kbps,
+            "sample_rate": segment_encoder.sample_rate,
+            "chunk_target_bytes": segment_encoder.target_bytes,
+            "max_chunk_seconds": segment_encoder.max_chunk_seconds,
+            "cut_tolerance_ms": self.boundary_planner.tolerance_ms,
+            "chunk_padding_ms": self.boundary_planner.padding_ms,
+        }
+
+    def _merge_params(self) -> dict:
+        """
+        区間のマージ結果に影響するパラメータ（結果キャッシュのキーの一部、区間キャッシュには含めない）
+        """
+        return {
+            "merge_min_similarity": self.transcript_merger.min_similarity,
+            "merge_max_time_gap": self.transcript_merger.max_time_gap,
+            "merge_max_candidates": self.transcript_merger.max_candidates,
+        }
 
-        # 音声の長さに基づいて推定処理時間を計算（RTF=0.07を使用）
-        estimated_time = duration_seconds * 0.07
+    async def _transcribe_single_file(self, audio_file_path: str, session_id: str, backend) -> TranscriptionResult:
+        """
+        単一ファイルの文字起こし
+        進捗は開始と完了の実測のみ（残り時間はエンジンの過去の処理速度から見積もる）
+        """
+        progress_manager = get_progress_manager()
 
-        await progress_manager.update_progress(session_id, "transcribing", 15, f"音声認識を開始（推定時間: {estimated_time:.1f}秒）...")
+        # 音声ファイルの長さを取得（ヘッダーのみ読み、イベントループは止めない）
+        splitter = await asyncio.to_thread(AudioSplitter, audio_file_path)
+        duration_seconds = splitter.duration_ms / 1000.0
 
-        # 疑似進捗を開始
-        progress_task = asyncio.create_task(
-            self._simulate_transcription_progress(session_id, estimated_time, progress_manager)
+        tracker = TranscriptionProgress(
+            session_id, progress_manager, backend.name, duration_seconds, start_percent=15, end_percent=75
         )
+        await tracker.chunk_started(f"音声認識中... (音声時間: {duration_seconds/60:.1f}分)")
 
+        started_at = time.monotonic()
         try:
-            # 実際の音声認識を実行
-            with open(audio_file_path, "rb") as audio_file:
-                transcript = self.client.audio.transcriptions.create(
-                    model="whisper-1",
-                    file=audio_file,
-                    response_format="verbose_json"
+            # 実際の音声認識を実行（タイムアウト・リトライ付き）
+            with stage_timer("asr_call"):
+                transcript = await backend.transcribe(
+                    EncodedAudio.from_path(audio_file_path), "単一ファイル", timeout=600.0,
+                    audio_seconds=duration_seconds
                 )
-        finally:
-            # 疑似進捗を停止
-            progress_task.cancel()
-            try:
-                await progress_task
-            except asyncio.CancelledError:
-                pass
+        except Exception:
+            tracker.chunk_failed()
+            raise
+        await tracker.chunk_finished(duration_seconds, time.monotonic() - started_at, "音声認識完了")
 
         await progress_manager.update_progress(session_id, "transcription_complete", 75, "音声認識完了")
 
         return self._process_transcript(transcript)
 
-    async def _simulate_transcription_progress(self, session_id: str, estimated_time: float, progress_manager):
-        """
-        音声認識中の疑似進捗を表示
-        """
-        try:
-            # 進捗段階を定義（15%から75%まで）
-            progress_stages = [
-                (20, "音声データを解析中..."),
-                (25, "音声パターンを認識中..."),
-                (35, "単語を識別中..."),
-                (45, "文章を構築中..."),
-                (55, "文脈を解析中..."),
-                (65, "最終調整中..."),
-                (70, "音声認識を完了中...")
-            ]
-
-            # 各段階の間隔を計算
-            total_stages = len(progress_stages)
-            interval = estimated_time / total_stages if estimated_time > 0 else 2.0
-
-            # 最小・最大間隔を設定
-            interval = max(1.0, min(interval, 5.0))
-
-            for progress, message in progress_stages:
-                await asyncio.sleep(interval)
-                await progress_manager.update_progress(session_id, "transcribing", progress, message)
-
-        except asyncio.CancelledError:
-            # タスクがキャンセルされた場合（正常終了）
-            pass
-        except Exception as e:
-            logger.error(f"Progress simulation error: {e}")
-
-    async def _simulate_segment_progress(self, session_id: str, start_progress: int, end_progress: int, estimated_time: float, progress_manager, segment_num: int, total_segments: int):
-        """
-        セグメントごとの疑似進捗を表示
-        """
-        try:
-            # 進捗の範囲を計算
-            progress_range = end_progress - start_progress
-            steps = 3  # 各セグメントを3段階で進捗表示
-
-            interval = estimated_time / steps if estimated_time > 0 else 1.0
-            interval = max(0.5, min(interval, 3.0))
-
-            for step in range(1, steps + 1):
-                await asyncio.sleep(interval)
-                current_progress = start_progress + int((step / steps) * progress_range)
-                await progress_manager.update_progress(
-                    session_id,
-                    "transcribing",
-                    current_progress,
-                    f"セグメント {segment_num}/{total_segments} 処理中... (段階{step}/{steps})"
-                )
-
-        except asyncio.CancelledError:
-            pass
-        except Exception as e:
-            logger.error(f"Segment progress simulation error: {e}")
-
-    async def _transcribe_large_file(self, audio_file_path: str, session_id: str) -> TranscriptionResult:
+    async def _transcribe_large_file(self, audio_file_path: str, session_id: str, source_hash: str, backend) -> TranscriptionResult:
         """
         大きなファイルを分割して文字起こし
         """
@@ -147,49 +166,55 @@ class TranscriptionService:
         # 音声ファイル読み込み開始
         await progress_manager.update_progress(session_id, "loading", 12, "音声ファイルを読み込み中...")
 
-        # 音声ファイルを読み込み
-        logger.info(f"Loading audio file: {audio_file_path}")
-        audio = AudioSegment.from_file(audio_file_path)
+        # 音声ファイルのヘッダーのみを読み込み（全体はデコードしない）
+        logger.info(f"Probing audio file: {audio_file_path}")
+        splitter = await asyncio.to_thread(AudioSplitter, audio_file_path)
 
         # 音声ファイルの詳細情報をログ出力
-        actual_duration_ms = len(audio)
+        actual_duration_ms = splitter.duration_ms
         actual_duration_seconds = actual_duration_ms / 1000.0
         actual_duration_minutes = actual_duration_seconds / 60.0
 
-        logger.info(f"Audio file loaded successfully:")
+        logger.info(f"Audio file probed successfully:")
         logger.info(f"  Duration: {actual_duration_ms}ms ({actual_duration_seconds:.1f}s, {actual_duration_minutes:.1f}min)")
-        logger.info(f"  Sample rate: {audio.frame_rate}Hz")
-        logger.info(f"  Channels: {audio.channels}")
-        logger.info(f"  Sample width: {audio.sample_width} bytes")
+        logger.info(f"  Sample rate: {splitter.frame_rate}Hz")
+        logger.info(f"  Channels: {splitter.channels}")
+        logger.info(f"  Sample width: {splitter.sample_width} bytes")
 
         # コンソールにも出力
         print(f"🎵 AUDIO DEBUG INFO:")
         print(f"  Duration: {actual_duration_ms}ms ({actual_duration_seconds:.1f}s, {actual_duration_minutes:.1f}min)")
-        print(f"  Sample rate: {audio.frame_rate}Hz")
-        print(f"  Channels: {audio.channels}")
-        print(f"  Sample width: {audio.sample_width} bytes")
+        print(f"  Sample rate: {splitter.frame_rate}Hz")
+        print(f"  Channels: {splitter.channels}")
+        print(f"  Sample width: {splitter.sample_width} bytes")
 
         await progress_manager.update_progress(session_id, "preparing", 15, f"音声分割の準備中... (音声時間: {actual_duration_minutes:.1f}分)")
 
         print(f"🔧 [SEGMENTATION] 分割準備開始")
 
-        # 分割設定（25MB制限を確実に下回るように調整）
-        segment_duration = 2 * 60 * 1000  # 2分（ミリ秒）
-        overlap_duration = 15 * 1000      # 15秒の重複（ミリ秒）
+        # 分割設定（圧縮後のサイズが目標バイト数に収まる区間長を計算）
+        # 切れ目は無音位置に寄せるため、はみ出し分を予算から差し引く
+        segment_encoder = self._segment_encoder_for(backend)
+        segment_duration = segment_encoder.chunk_duration_ms(self.boundary_planner.max_extension_ms)
 
-        # 分割数を計算
-        total_duration = len(audio)
-        num_segments = math.ceil(total_duration / segment_duration)
+        # 無音位置で分割点を決める（切れ目付近だけを読む）
+        total_duration = splitter.duration_ms
+        with stage_timer("split"):
+            windows = await audio_workers.run(
+                plan_chunk_windows, audio_file_path, self.boundary_planner, segment_duration
+            )
+        num_segments = len(windows)
 
         print(f"📊 [SEGMENTATION] 分割計画:")
         print(f"  総時間: {total_duration}ms ({total_duration/1000/60:.1f}分)")
-        print(f"  セグメント長: {segment_duration}ms ({segment_duration/1000:.0f}秒)")
-        print(f"  重複時間: {overlap_duration}ms ({overlap_duration/1000:.0f}秒)")
+        print(f"  目標セグメント長: {segment_duration}ms ({segment_duration/1000:.0f}秒)")
+        print(f"  切れ目: {[round(w.cut_start_ms / 1000, 2) for w in windows[1:]]}")
+        print(f"  パディング: {self.boundary_planner.padding_ms}ms")
         print(f"  セグメント数: {num_segments}")
 
         logger.info(f"Audio duration: {total_duration/1000:.1f}s ({total_duration/1000/60:.1f} minutes)")
-        logger.info(f"Segment duration: {segment_duration/1000:.1f}s, Overlap: {overlap_duration/1000:.1f}s")
-        logger.info(f"Will create {num_segments} segments")
+        logger.info(f"Target segment duration: {segment_duration/1000:.1f}s, Padding: {self.boundary_planner.padding_ms}ms")
+        logger.info(f"Will create {num_segments} segments: {windows}")
 
         await progress_manager.update_progress(
             session_id,
@@ -198,329 +223,277 @@ class TranscriptionService:
             f"音声を{num_segments}個のセグメントに分割します（総時間: {total_duration/1000/60:.1f}分）"
         )
 
-        # 各セグメントを処理（順番を明確に管理）
+        # 区間ごとのキャッシュを確認（前回までに成功した区間は再利用する）
+        params = self._transcription_params(backend)
+        chunk_keys = {
+            w.index: self.chunk_cache.make_key(source_hash, {**params, "window_ms": [w.start_ms, w.end_ms]})
+            for w in windows
+        }
         transcripts = []
-        temp_files = []
+        reused = []
+        pending_windows = []
+        for window in windows:
+            cached = await asyncio.to_thread(self.chunk_cache.get, chunk_keys[window.index])
+            if cached is not None:
+                transcripts.append(self._chunk_entry(window, cached))
+                reused.append(window.index)
+            else:
+                pending_windows.append(window)
+
+        if reused:
+            print(f"⚡ [CACHE] 区間キャッシュを再利用: {len(reused)}/{num_segments}個")
+            logger.info(f"Reusing cached chunks: {reused}")
+
+        # 区間を「エンコード（ワーカープロセス）→文字起こし」の段に流す（結果はindex順に並べ直す）
+        # 段の間は上限付きキューでつなぎ、区間Nの文字起こし中に区間N+1以降のエンコードを進める
+        buffers = set()
+        failed = []
 
-        print(f"🚀 [SEGMENTATION] セグメント処理開始 ({num_segments}個)")
+        # 実測の進捗（文字起こし済みの音声秒数）と直近の処理速度から残り時間を見積もる
+        tracker = TranscriptionProgress(
+            session_id, progress_manager, backend.name, total_duration / 1000.0,
+            total_chunks=num_segments, parallelism=self.max_concurrency, start_percent=18, end_percent=78
+        )
+        for window in windows:
+            if window.index in reused:
+                tracker.skip((window.cut_end_ms - window.cut_start_ms) / 1000.0)
+
+        async def encode_stage(window):
+            return await self._encode_segment(audio_file_path, window, num_segments, buffers, segment_encoder)
+
+        async def transcribe_stage(encoded):
+            return await self._transcribe_segment(
+                encoded, chunk_keys[encoded["window"].index], num_segments, buffers, tracker, backend
+            )
+
+        async def on_segment_error(stage_name, item, segment_error):
+            window = item["window"] if isinstance(item, dict) else item
+            logger.error(f"Error processing segment {window.index+1} ({stage_name}): {segment_error}")
+            print(f"❌ Error in segment {window.index+1} ({stage_name}): {segment_error}")
+            # セグメントエラーでも処理を続行（再実行時はこの区間だけ再計算される）
+            failed.append(window.index)
+            if isinstance(item, dict):
+                self._release_buffer(item["audio"], buffers)
+
+        pipeline = ChunkPipeline(
+            [
+                PipelineStage("encode", encode_stage, self.encode_concurrency, self.encode_concurrency),
+                PipelineStage("transcribe", transcribe_stage, self.max_concurrency, self.pipeline_queue_size),
+            ],
+            on_error=on_segment_error
+        )
+
+        print(
+            f"🚀 [SEGMENTATION] セグメント処理開始 ({len(pending_windows)}個, "
+            f"エンコード同時実行数: {self.encode_concurrency}, 文字起こし同時実行数: {self.max_concurrency}, "
+            f"待ちキュー: {self.pipeline_queue_size})"
+        )
+        logger.info(
+            f"Transcribing {len(pending_windows)} segments: encode x{self.encode_concurrency}, "
+            f"transcribe x{self.max_concurrency}, queue {self.pipeline_queue_size}"
+        )
 
         try:
-            for i in range(num_segments):
-                segment_index = i  # 明確なインデックス管理
-
-                print(f"🔄 [SEGMENTATION] セグメント {segment_index+1}/{num_segments} 開始")
-
-                try:  # 各セグメントの処理を個別にtry-catch
-                    print(f"🔄 Processing segment {segment_index+1}/{num_segments}")
-
-                    # 分割処理の進捗（10%から15%の範囲）
-                    segment_progress = 10 + int((segment_index / num_segments) * 5)
-                    await progress_manager.update_progress(
-                        session_id,
-                        "splitting",
-                        segment_progress,
-                        f"セグメント {segment_index+1}/{num_segments} を切り出し中... (残り{num_segments-segment_index-1}個)"
-                    )
-
-                    logger.info(f"Processing segment {segment_index+1}/{num_segments} (index: {segment_index})")
-
-                    start_time = segment_index * segment_duration
-                    end_time = min(start_time + segment_duration + overlap_duration, total_duration)
-
-                    print(f"✂️ [SEGMENTATION] セグメント {segment_index+1} 時間: {start_time/1000:.1f}s - {end_time/1000:.1f}s")
-                    logger.info(f"Segment {segment_index+1}: {start_time/1000:.1f}s - {end_time/1000:.1f}s")
-
-                    # セグメントを切り出し
-                    print(f"🎵 [SEGMENTATION] 音声切り出し中...")
-                    segment = audio[start_time:end_time]
-                    print(f"✅ [SEGMENTATION] 音声切り出し完了")
-
-                    # セグメントの長さをチェック
-                    segment_duration_seconds = len(segment) / 1000.0
-                    logger.info(f"Segment {segment_index+1} duration: {segment_duration_seconds:.1f}s")
-
-                    if segment_duration_seconds < 0.1:
-                        logger.warning(f"Segment {segment_index+1} is too short ({segment_duration_seconds:.3f}s), skipping...")
-                        continue
-
-                    # 一時ファイルに番号付きで保存
-                    print(f"💾 [SEGMENTATION] ファイル保存中...")
-                    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=f"_segment_{segment_index:03d}.wav")
-                    segment.export(temp_file.name, format="wav")
-                    temp_files.append(temp_file.name)
-                    print(f"✅ [SEGMENTATION] ファイル保存完了: {temp_file.name}")
-
-                    logger.info(f"Saved segment {segment_index+1} to: {temp_file.name}")
-
-                    # ファイルサイズを確認（25MB制限）
-                    file_size = os.path.getsize(temp_file.name)
-                    max_segment_size = 25 * 1024 * 1024  # 25MB
-                    logger.info(f"Segment {segment_index+1} size: {file_size/1024/1024:.1f}MB")
-
-                    if file_size > max_segment_size:
-                        raise Exception(f"Segment {segment_index} size ({file_size} bytes) exceeds 25MB limit")
-
-                    # 文字起こし進捗（15%から78%の範囲）
-                    base_progress = 15 + int((segment_index / num_segments) * 63)
-                    await progress_manager.update_progress(
-                        session_id,
-                        "transcribing",
-                        base_progress,
-                        f"セグメント {segment_index+1}/{num_segments} を文字起こし中... ({file_size/1024/1024:.1f}MB)"
-                    )
-
-                    # WebSocket送信を確実にするための短い待機
-                    await asyncio.sleep(0.1)
-
-                    # 文字起こし実行（タイムアウト・リトライ付き）
-                    logger.info(f"Transcribing segment {segment_index+1}...")
-                    print(f"🎤 [TRANSCRIPTION] セグメント {segment_index+1} OpenAI API呼び出し開始")
-
-                    transcript = None
-                    max_retries = 3
-
-                    for retry in range(max_retries):
-                        try:
-                            print(f"🔄 [TRANSCRIPTION] API呼び出し試行 {retry+1}/{max_retries}")
-
-                            with open(temp_file.name, "rb") as audio_file:
-                                # タイムアウト付きでAPI呼び出し
-                                transcript = await asyncio.wait_for(
-                                    asyncio.to_thread(
-                                        lambda: self.client.audio.transcriptions.create(
-                                            model="whisper-1",
-                                            file=audio_file,
-                                            response_format="verbose_json"
-                                        )
-                                    ),
-                                    timeout=120.0  # 2分タイムアウト
-                                )
-                            print(f"✅ [TRANSCRIPTION] API呼び出し成功")
-                            break
-
-                        except asyncio.TimeoutError:
-                            print(f"⏰ [TRANSCRIPTION] API呼び出しタイムアウト (試行 {retry+1}/{max_retries})")
-                            if retry == max_retries - 1:
-                                raise Exception(f"OpenAI API timeout after {max_retries} retries")
-                            await asyncio.sleep(5)  # 5秒待機してリトライ
-
-                        except Exception as e:
-                            print(f"❌ [TRANSCRIPTION] API呼び出しエラー: {e} (試行 {retry+1}/{max_retries})")
-                            if retry == max_retries - 1:
-                                raise
-                            await asyncio.sleep(5)  # 5秒待機してリトライ
-
-                    # 文字起こし結果をログ出力
-                    transcript_text = getattr(transcript, 'text', 'No text available')
-                    transcript_duration = getattr(transcript, 'duration', (end_time - start_time) / 1000.0)
-
-                    logger.info(f"Segment {segment_index+1} transcription completed:")
-                    logger.info(f"  Index: {segment_index}")
-                    logger.info(f"  Duration: {transcript_duration:.1f}s")
-                    logger.info(f"  Text length: {len(transcript_text)} characters")
-                    logger.info(f"  Text preview: {transcript_text[:100]}...")
-
-                    print(f"✅ Segment {segment_index+1} completed: {len(transcript_text)} chars")
-
-                    # セグメント完了時の進捗更新
-                    completed_progress = 15 + int(((segment_index + 1) / num_segments) * 63)
-                    await progress_manager.update_progress(
-                        session_id,
-                        "transcribing",
-                        completed_progress,
-                        f"セグメント {segment_index+1}/{num_segments} 完了 ({len(transcript_text)}文字)"
-                    )
-
-                    # WebSocket送信を確実にするための短い待機
-                    await asyncio.sleep(0.1)
-
-                    transcripts.append({
-                        'index': segment_index,  # 順番情報を追加
-                        'transcript': transcript,
-                        'start_offset': start_time / 1000.0,  # 秒に変換
-                        'duration': transcript_duration,
-                        'original_start_time': start_time / 1000.0,
-                        'original_end_time': end_time / 1000.0
-                    })
-
-                except Exception as segment_error:
-                    logger.error(f"Error processing segment {segment_index+1}: {segment_error}")
-                    print(f"❌ Error in segment {segment_index+1}: {segment_error}")
-                    # セグメントエラーでも処理を続行
-                    continue
+            transcripts.extend(await pipeline.run(pending_windows))
+            transcripts.sort(key=lambda x: x['index'])
+            recomputed = sorted(t['index'] for t in transcripts if t['index'] not in reused)
+
+            if failed:
+                await progress_manager.update_progress(
+                    session_id,
+                    "transcribing",
+                    78,
+                    f"{len(failed)}個のセグメントが失敗しました（再実行すると失敗分のみ再処理します）"
+                )
 
             # マージ処理の進捗
             await progress_manager.update_progress(session_id, "merging", 78, "文字起こし結果をマージ中...")
 
             # 文字起こし結果をマージ
             logger.info("Merging transcription results...")
-            result = self._merge_transcripts(transcripts, overlap_duration / 1000.0)
+            with stage_timer("merge"):
+                result = self._merge_transcripts(transcripts)
+            result.chunk_report = ChunkReport.model_construct(
+                total=num_segments,
+                reused=sorted(reused),
+                recomputed=recomputed,
+                failed=sorted(failed),
+                pipeline=pipeline.snapshot()
+            )
+            logger.info(f"Chunk report: {result.chunk_report}")
 
             await progress_manager.update_progress(session_id, "transcription_complete", 78, "音声認識完了")
             logger.info("Large file transcription completed successfully")
             return result
 
         finally:
-            # 一時ファイルを削除
-            for temp_file in temp_files:
-                if os.path.exists(temp_file):
-                    os.unlink(temp_file)
-    
-    def _merge_transcripts(self, transcripts, overlap_duration: float) -> TranscriptionResult:
+            # 残っているバッファ・一時ファイルを解放（中断時など）
+            for audio in list(buffers):
+                self._release_buffer(audio, buffers)
+
+    async def _encode_segment(self, audio_file_path: str, window, num_segments: int, buffers: set,
+                              segment_encoder: SegmentEncoder):
+        """
+        1区間を切り出して圧縮する（パイプラインのエンコード段）
+        """
+        segment_index = window.index
+        start_time = window.start_ms
+        end_time = window.end_ms
+
+        print(f"🔄 [SEGMENTATION] セグメント {segment_index+1}/{num_segments} 開始")
+        logger.info(f"Processing segment {segment_index+1}/{num_segments} (index: {segment_index})")
+
+        print(f"✂️ [SEGMENTATION] セグメント {segment_index+1} 時間: {start_time/1000:.1f}s - {end_time/1000:.1f}s")
+        logger.info(f"Segment {segment_index+1}: {start_time/1000:.1f}s - {end_time/1000:.1f}s")
+
+        # セグメントの長さをチェック
+        segment_duration_seconds = (end_time - start_time) / 1000.0
+        if segment_duration_seconds < 0.1:
+            logger.warning(f"Segment {segment_index+1} is too short ({segment_duration_seconds:.3f}s), skipping...")
+            return None
+
+        # 番号付きの名前でメモリ上に圧縮（モノラル・認識器のサンプルレート、大きい場合のみ一時ファイル）
+        # デコードとエンコードはワーカープロセスで行う
+        filename = f"segment_{segment_index:03d}{segment_encoder.file_suffix}"
+        audio, segment_duration_seconds, timings = await audio_workers.run(
+            encode_chunk_window, audio_file_path, window, segment_encoder, filename
+        )
+        buffers.add(audio)
+        observe_stage("decode", timings["decode"])
+        observe_stage("encode", timings["encode"])
+
+        # サイズを確認（25MB制限）
+        file_size = audio.size
+        logger.info(f"Encoded segment {segment_index+1}: {segment_duration_seconds:.1f}s, {file_size/1024/1024:.1f}MB")
+
+        if file_size > WHISPER_MAX_UPLOAD_SIZE:
+            self._release_buffer(audio, buffers)
+            raise Exception(f"Segment {segment_index} size ({file_size} bytes) exceeds 25MB limit")
+
+        return {
+            "window": window,
+            "audio": audio,
+            "file_size": file_size,
+            "duration": segment_duration_seconds
+        }
+
+    async def _transcribe_segment(self, encoded: dict, chunk_key: str, num_segments: int, buffers: set,
+                                  tracker: TranscriptionProgress, backend):
+        """
+        エンコード済みの1区間を文字起こしする（パイプラインの文字起こし段）
+        """
+        window = encoded["window"]
+        segment_index = window.index
+        file_size = encoded["file_size"]
+
+        # 文字起こし進捗（文字起こし済みの音声秒数ベース）
+        await tracker.chunk_started(
+            f"セグメント {segment_index+1}/{num_segments} を文字起こし中... ({file_size/1024/1024:.1f}MB)"
+        )
+
+        # 文字起こし実行（タイムアウト・リトライ付き）
+        logger.info(f"Transcribing segment {segment_index+1}...")
+        print(f"🎤 [TRANSCRIPTION] セグメント {segment_index+1} 音声認識開始 ({backend.name})")
+
+        started_at = time.monotonic()
+        try:
+            with stage_timer("asr_call"):
+                transcript = await backend.transcribe(
+                    encoded["audio"], f"セグメント {segment_index+1}", timeout=120.0,  # 2分タイムアウト
+                    audio_seconds=encoded["duration"]
+                )
+        except Exception:
+            tracker.chunk_failed()
+            raise
+        finally:
+            # 文字起こしが終わった区間のバッファはすぐに解放する（メモリ使用量を数区間分に抑える）
+            self._release_buffer(encoded["audio"], buffers)
+
+        if not transcript['duration']:
+            transcript['duration'] = (window.end_ms - window.start_ms) / 1000.0
+
+        # 結果を即座に区間キャッシュへ保存（途中で失敗しても再実行時に再利用できる）
+        await asyncio.to_thread(self.chunk_cache.put, chunk_key, transcript)
+
+        # 文字起こし結果をログ出力
+        transcript_text = transcript['text']
+        transcript_duration = transcript['duration']
+
+        logger.info(f"Segment {segment_index+1} transcription completed:")
+        logger.info(f"  Index: {segment_index}")
+        logger.info(f"  Duration: {transcript_duration:.1f}s")
+        logger.info(f"  Text length: {len(transcript_text)} characters")
+
+        print(f"✅ Segment {segment_index+1} completed: {len(transcript_text)} chars")
+
+        # セグメント完了時の進捗更新（担当範囲＝切れ目の間の音声秒数を処理済みにする）
+        await tracker.chunk_finished(
+            (window.cut_end_ms - window.cut_start_ms) / 1000.0,
+            time.monotonic() - started_at,
+            f"セグメント {segment_index+1}/{num_segments} 完了 "
+            f"({tracker.done_chunks + 1}/{num_segments}, {len(transcript_text)}文字)"
+        )
+
+        return self._chunk_entry(window, transcript)
+
+    def _release_buffer(self, audio, buffers: set):
+        buffers.discard(audio)
+        audio.close()
+
+    def _chunk_entry(self, window, transcript: dict) -> dict:
+        """
+        マージ用の区間情報（区間の読み出し範囲と切れ目、文字起こし結果）
+        """
+        return {
+            'index': window.index,  # 順番情報を追加
+            'transcript': transcript,
+            'start_offset': window.start_ms / 1000.0,  # 秒に変換
+            'duration': transcript['duration'],
+            'original_start_time': window.start_ms / 1000.0,
+            'original_end_time': window.end_ms / 1000.0,
+            'cut_start_time': window.cut_start_ms / 1000.0,
+            'cut_end_time': window.cut_end_ms / 1000.0
+        }
+
+    def _merge_transcripts(self, transcripts) -> TranscriptionResult:
         """
         分割された文字起こし結果をマージ
+        各区間の実際の開始時刻で絶対時刻に補正し、重なり部分の発話の対応（なければ分割計画の切れ目）で担当範囲を決める
         """
         logger.info(f"Merging {len(transcripts)} transcript segments")
-        logger.info(f"Overlap duration: {overlap_duration:.1f}s")
 
         if not transcripts:
-            return TranscriptionResult(segments=[], full_text="")
+            return TranscriptionResult.model_construct(segments=SegmentStore.from_segments([]))
 
         # 順番を確実にソート
         transcripts.sort(key=lambda x: x['index'])
         logger.info("Sorted transcripts by index:")
         for i, t in enumerate(transcripts):
-            logger.info(f"  Position {i}: Index {t['index']}, Start: {t['original_start_time']:.1f}s")
-
-        # 改善された重複処理を有効化
-        use_overlap_processing = True  # 重複処理を有効化
-        logger.info(f"Overlap processing: {'enabled' if use_overlap_processing else 'disabled (debug mode)'}")
-
-        # 最初のトランスクリプトを基準とする
-        merged_segments = []
-        cumulative_duration = 0
-
-        for i, transcript_data in enumerate(transcripts):
-            transcript = transcript_data['transcript']
-            start_offset = cumulative_duration
-
-            logger.info(f"Processing transcript {i+1}/{len(transcripts)}")
-            logger.info(f"  Start offset: {start_offset:.1f}s")
-            logger.info(f"  Duration: {transcript_data['duration']:.1f}s")
-
-            segments_added = 0
-            segments_skipped = 0
-
-            if hasattr(transcript, 'segments') and transcript.segments:
-                logger.info(f"  Found {len(transcript.segments)} segments in transcript {i+1}")
-
-                for j, segment in enumerate(transcript.segments):
-                    # segmentの処理
-                    if isinstance(segment, dict):
-                        start = segment.get('start', 0)
-                        end = segment.get('end', 0)
-                        text = segment.get('text', '').strip()
-                    else:
-                        start = getattr(segment, 'start', 0)
-                        end = getattr(segment, 'end', 0)
-                        text = getattr(segment, 'text', '').strip()
-
-                    # 時刻を補正
-                    adjusted_start = start + start_offset
-                    adjusted_end = end + start_offset
-
-                    # 重複部分の処理（最初のセグメント以外）
-                    skip_segment = False
-                    if use_overlap_processing and i > 0:
-                        # 改善された重複処理: セグメント内の相対時間で判定
-                        # 各セグメントは2分(120秒) + 15秒重複 = 135秒
-                        # 重複部分は最初の15秒なので、15秒以降のセグメントのみ保持
-                        if start < overlap_duration:
-                            skip_segment = True
-                            segments_skipped += 1
-                            logger.debug(f"    Skipping segment {j+1} (overlap): {start:.1f}s < {overlap_duration:.1f}s")
-                        else:
-                            logger.debug(f"    Keeping segment {j+1} (beyond overlap): {start:.1f}s >= {overlap_duration:.1f}s")
-                    else:
-                        logger.debug(f"    Keeping segment {j+1} (first segment or overlap disabled): {start:.1f}s")
-
-                    if not skip_segment:
-                        merged_segments.append(TranscriptionSegment(
-                            start=adjusted_start,
-                            end=adjusted_end,
-                            text=text
-                        ))
-                        segments_added += 1
-                        logger.debug(f"    Added segment {j+1}: {adjusted_start:.1f}s-{adjusted_end:.1f}s")
-
-            logger.info(f"  Segments added: {segments_added}, skipped: {segments_skipped}")
-
-            # 累積時間を更新（重複期間を除く）
-            if use_overlap_processing:
-                if i < len(transcripts) - 1:  # 最後以外
-                    cumulative_duration += transcript_data['duration'] - overlap_duration
-                    logger.info(f"  Updated cumulative duration: {cumulative_duration:.1f}s (removed {overlap_duration:.1f}s overlap)")
-                else:  # 最後
-                    cumulative_duration += transcript_data['duration']
-                    logger.info(f"  Final cumulative duration: {cumulative_duration:.1f}s")
-            else:
-                # デバッグモード: 重複を考慮せずに単純に加算
-                if i == 0:
-                    cumulative_duration = transcript_data['duration']
-                else:
-                    # 2分間隔で分割しているので、2分ずつ加算
-                    cumulative_duration += 2 * 60  # 2分 = 120秒
-                logger.info(f"  Debug mode cumulative duration: {cumulative_duration:.1f}s")
+            logger.info(
+                f"  Position {i}: Index {t['index']}, Start: {t['original_start_time']:.2f}s, "
+                f"Cut: {t['cut_start_time']:.2f}s - {t['cut_end_time']:.2f}s"
+            )
+
+        # 重なり部分の同じ発話を対応付けて切れ目を決め、絶対時刻の発話列にする
+        merged_segments = SegmentStore.from_segments(self.transcript_merger.merge(transcripts))
 
         result = self._build_result(merged_segments)
 
         logger.info(f"Merge completed:")
         logger.info(f"  Total segments: {len(merged_segments)}")
-        logger.info(f"  Total text length: {len(result.full_text)} characters")
-        logger.info(f"  Final duration: {cumulative_duration:.1f}s ({cumulative_duration/60:.1f} minutes)")
+        logger.info(f"  Total text length: {len(merged_segments.text)} characters ({merged_segments.nbytes} bytes)")
 
         return result
 
-    def _process_transcript(self, transcript) -> TranscriptionResult:
+    def _process_transcript(self, transcript: dict) -> TranscriptionResult:
         """
         単一のトランスクリプトを処理
         """
-        segments = []
-
-        if hasattr(transcript, 'segments') and transcript.segments:
-            for segment in transcript.segments:
-                if isinstance(segment, dict):
-                    start = segment.get('start', 0)
-                    end = segment.get('end', 0)
-                    text = segment.get('text', '').strip()
-                else:
-                    start = getattr(segment, 'start', 0)
-                    end = getattr(segment, 'end', 0)
-                    text = getattr(segment, 'text', '').strip()
-
-                segments.append(TranscriptionSegment(
-                    start=start,
-                    end=end,
-                    text=text
-                ))
-
-        return self._build_result(segments)
-
-    def _build_result(self, segments) -> TranscriptionResult:
-        """
-        セグメントからTranscriptionResultを構築
-        """
-        full_text_parts = []
-
-        for segment in segments:
-            start_time = self._format_timestamp(segment.start)
-            full_text_parts.append(f"【{start_time}】{segment.text}")
-
-        if not full_text_parts:
-            full_text_parts.append("【00:00:00】音声の文字起こしができませんでした")
-
-        full_text = "\n".join(full_text_parts)
-
-        return TranscriptionResult(
-            segments=segments,
-            full_text=full_text
-        )
+        return self._build_result(SegmentStore.from_segments(transcript["segments"]))
 
-    def _format_timestamp(self, seconds: float) -> str:
+    def _build_result(self, segments: SegmentStore) -> TranscriptionResult:
         """
-        秒数をHH:MM:SS形式に変換
+        セグメントからTranscriptionResultを構築（全文は参照時に組み立てる）
+        自前で組み立てたSegmentStoreなので再検証はしない
         """
-        hours = int(seconds // 3600)
-        minutes = int((seconds % 3600) // 60)
-        seconds = int(seconds % 60)
-        return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+        return TranscriptionResult.model_construct(segments=segments)
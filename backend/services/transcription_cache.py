@@ -0,0 +1,125 @@
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+# ハッシュ計算時の読み込み単位
+HASH_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+
+def hash_file(file_path: str) -> str:
+    """
+    音声ファイルの内容をストリーミングでハッシュ化する（SHA-256）
+    """
+    hasher = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class TranscriptionCache:
+    """
+    音声ハッシュ＋パラメータをキーにした文字起こし結果のディスクキャッシュ
+    合計サイズが上限を超えたら最終アクセスが古いものから削除する（LRU）
+    """
+
+    def __init__(self, namespace: str = "results"):
+        self.enabled = os.getenv("TRANSCRIPTION_CACHE_ENABLED", "true").lower() == "true"
+        base_dir = os.getenv(
+            "TRANSCRIPTION_CACHE_DIR",
+            os.path.join(tempfile.gettempdir(), "n1_transcription_cache")
+        )
+        self.cache_dir = os.path.join(base_dir, namespace)
+        self.max_bytes = int(os.getenv("TRANSCRIPTION_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+        self._lock = threading.Lock()
+
+        if self.enabled:
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def make_key(self, source_hash: str, params: dict) -> str:
+        """
+        音声ハッシュと文字起こしパラメータからキャッシュキーを作る
+        """
+        payload = json.dumps({"source": source_hash, "params": params}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str):
+        """
+        キャッシュを読み込む（なければNone）。ヒット時は最終アクセス時刻を更新する
+        """
+        if not self.enabled:
+            return None
+
+        path = self._entry_path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            os.utime(path, None)
+            return data
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Discarding unreadable cache entry {path}: {e}")
+            self._remove(path)
+            return None
+
+    def put(self, key: str, data: dict):
+        """
+        キャッシュを書き込み（一時ファイル経由で置き換え）、上限を超えたら古いものを削除
+        """
+        if not self.enabled:
+            return
+
+        path = self._entry_path(key)
+        fd, temp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(temp_path, path)
+        except BaseException:
+            self._remove(temp_path)
+            raise
+
+        self._evict()
+
+    def _evict(self):
+        """
+        合計サイズが上限を超えている間、最終アクセスが古いエントリから削除する
+        """
+        with self._lock:
+            entries = []
+            total_size = 0
+            for entry in os.scandir(self.cache_dir):
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_size += stat.st_size
+
+            if total_size <= self.max_bytes:
+                return
+
+            entries.sort()
+            for _, size, path in entries:
+                if total_size <= self.max_bytes:
+                    break
+                self._remove(path)
+                total_size -= size
+                logger.info(f"Evicted cache entry {path} ({size} bytes)")
+
+    def _remove(self, path: str):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,266 @@
+import os
+import time
+import asyncio
+import hashlib
+import tempfile
+import logging
+from typing import Dict, Optional
+from fastapi import Request
+from multipart.multipart import MultipartParser, parse_options_header
+from multipart.exceptions import MultipartParseError
+from services.metrics import observe_stage
+
+logger = logging.getLogger(__name__)
+
+# アップロードをディスクへ書き出す単位（受信したデータをこの大きさまで溜めてから書く）
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # 1MB
+
+# 書き出し済みバイト数を通知する間隔
+UPLOAD_PROGRESS_BYTES = 8 * 1024 * 1024  # 8MB
+
+# ファイル以外のフォーム項目・multipartの区切りやヘッダーに許すバイト数
+# リクエスト全体はファイルの上限＋この値までしか受け付けない（Content-Lengthの事前検査にも使う）
+UPLOAD_FORM_OVERHEAD_BYTES = 64 * 1024  # 64KB
+
+
+class UploadTooLargeError(Exception):
+    """アップロードがサイズ上限を超えた場合の例外"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        super().__init__(f"File size exceeds {max_size} bytes limit")
+
+
+class UploadFormError(Exception):
+    """multipart/form-dataとして読めないアップロードの例外"""
+    pass
+
+
+class StreamedUpload:
+    """
+    ディスクへ書き出したアップロードファイルと、一緒に送られたフォーム項目
+    """
+
+    def __init__(self, path: str, size: int, sha256: str, filename: Optional[str], content_type: Optional[str],
+                 fields: Dict[str, str]):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+        self.filename = filename
+        self.content_type = content_type
+        self.fields = fields
+
+
+def get_upload_suffix(filename: str, default_suffix: str) -> str:
+    """
+    アップロードファイル名から一時ファイルの拡張子を決める
+    """
+    if filename:
+        return os.path.splitext(filename)[1] or default_suffix
+    return default_suffix
+
+
+def get_content_length(request: Request) -> Optional[int]:
+    """
+    リクエストのContent-Length（なければ・不正ならNone）
+    """
+    try:
+        return int(request.headers["content-length"])
+    except (KeyError, ValueError):
+        return None
+
+
+class _Part:
+    def __init__(self):
+        self.header_name = bytearray()
+        self.header_value = bytearray()
+        self.disposition = b""
+        self.content_type = None
+        self.name = None
+        self.filename = None
+        self.data = bytearray()
+
+
+async def receive_multipart_upload(request: Request, file_field: str, max_size: int, default_suffix: str = ".mp3",
+                                   on_file_start=None, on_progress=None) -> StreamedUpload:
+    """
+    multipart/form-dataのリクエスト本文を受信しながら解析し、file_fieldのファイルを一時ファイルへ直接書き出す
+    本文全体をメモリやスプール（UploadFile）に溜めず、受信したバイト数でサイズ上限を検査する
+    Content-Lengthが上限を超えるリクエストは本文を読む前に拒否する
+    書き込みと同時に内容のSHA-256を計算する（文字起こしキャッシュのキー用）
+    on_file_startを渡すと、ファイルのヘッダーを受け取った時点（本文の受信前）に
+    (それまでに届いたフォーム項目, ファイル名, Content-Type)で呼び出す（await可能な関数。例外を出せば受信を中止する）
+    on_progressを渡すと、書き出し済みのバイト数で一定間隔ごとに呼び出す（await可能な関数）
+    受信（upload_read、ネットワークからの読み込み）と書き出し（temp_write）の合計時間をメトリクスに記録する
+    """
+    max_body_size = max_size + UPLOAD_FORM_OVERHEAD_BYTES
+    content_length = get_content_length(request)
+    if content_length is not None and content_length > max_body_size:
+        logger.warning(f"Rejected upload by Content-Length: {content_length} bytes")
+        raise UploadTooLargeError(max_size)
+
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise UploadFormError("Request body must be multipart/form-data")
+
+    fields: Dict[str, str] = {}
+    field_size = 0  # ファイル以外のフォーム項目とパートのヘッダーの合計バイト数（UPLOAD_FORM_OVERHEAD_BYTESまで）
+    events = []  # パーサーのコールバックで溜め、受信ループ側で順に処理する
+    part = _Part()
+
+    # パーサーのコールバック（同期関数）はイベントを溜めるだけにし、書き込みは受信ループでスレッドに渡す
+    def on_part_begin():
+        nonlocal part
+        part = _Part()
+
+    def count_form_bytes(size: int):
+        # ファイル以外はメモリに溜めるため、合計に上限を設ける
+        nonlocal field_size
+        field_size += size
+        if field_size > UPLOAD_FORM_OVERHEAD_BYTES:
+            raise UploadFormError(f"Form fields exceed {UPLOAD_FORM_OVERHEAD_BYTES} bytes")
+
+    def on_header_field(data: bytes, start: int, end: int):
+        count_form_bytes(end - start)
+        part.header_name += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int):
+        count_form_bytes(end - start)
+        part.header_value += data[start:end]
+
+    def on_header_end():
+        name = bytes(part.header_name).lower()
+        if name == b"content-disposition":
+            part.disposition = bytes(part.header_value)
+        elif name == b"content-type":
+            part.content_type = part.header_value.decode("latin-1").strip()
+        part.header_name = bytearray()
+        part.header_value = bytearray()
+
+    def on_headers_finished():
+        _, disposition = parse_options_header(part.disposition)
+        if b"name" not in disposition:
+            raise UploadFormError('Content-Disposition header must include "name"')
+        part.name = disposition[b"name"].decode("utf-8", errors="replace")
+        if b"filename" in disposition:
+            part.filename = disposition[b"filename"].decode("utf-8", errors="replace")
+        events.append(("start", part))
+
+    def on_part_data(data: bytes, start: int, end: int):
+        if part.filename is None:
+            count_form_bytes(end - start)
+            part.data += data[start:end]
+        else:
+            events.append(("data", part, data[start:end]))
+
+    def on_part_end():
+        events.append(("end", part))
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    temp_file = None
+    upload_part = None
+    hasher = hashlib.sha256()
+    pending = bytearray()
+    body_size = 0
+    total_size = 0
+    next_report = UPLOAD_PROGRESS_BYTES
+    read_seconds = 0.0
+    write_seconds = 0.0
+    finished = False
+
+    def write_chunk(chunk: bytes):
+        hasher.update(chunk)
+        temp_file.write(chunk)
+
+    async def flush():
+        # ハッシュ計算とディスク書き込みでイベントループを止めない
+        nonlocal write_seconds
+        if not pending:
+            return
+        chunk = bytes(pending)
+        pending.clear()
+        started_at = time.perf_counter()
+        await asyncio.to_thread(write_chunk, chunk)
+        write_seconds += time.perf_counter() - started_at
+
+    stream = request.stream().__aiter__()
+    try:
+        while True:
+            started_at = time.perf_counter()
+            try:
+                chunk = await stream.__anext__()
+            except StopAsyncIteration:
+                break
+            read_seconds += time.perf_counter() - started_at
+            if not chunk:
+                continue
+
+            body_size += len(chunk)
+            if body_size > max_body_size:
+                raise UploadTooLargeError(max_size)
+            try:
+                parser.write(chunk)
+            except MultipartParseError as e:
+                raise UploadFormError(f"Invalid multipart body: {e}")
+
+            for event in events:
+                kind, event_part = event[0], event[1]
+                if kind == "start":
+                    if event_part.filename is None:
+                        continue
+                    if event_part.name != file_field or upload_part is not None:
+                        raise UploadFormError(f"Unexpected file field: {event_part.name}")
+                    upload_part = event_part
+                    if on_file_start is not None:
+                        await on_file_start(dict(fields), event_part.filename, event_part.content_type)
+                    suffix = get_upload_suffix(event_part.filename, default_suffix)
+                    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
+                elif kind == "data":
+                    total_size += len(event[2])
+                    if total_size > max_size:
+                        raise UploadTooLargeError(max_size)
+                    pending += event[2]
+                    if len(pending) >= UPLOAD_CHUNK_SIZE:
+                        await flush()
+                    if on_progress is not None and total_size >= next_report:
+                        next_report = total_size + UPLOAD_PROGRESS_BYTES
+                        await on_progress(total_size)
+                elif event_part.filename is None:
+                    fields[event_part.name] = bytes(event_part.data).decode("utf-8", errors="replace")
+                else:
+                    await flush()
+            events.clear()
+
+        try:
+            parser.finalize()
+        except MultipartParseError as e:
+            raise UploadFormError(f"Invalid multipart body: {e}")
+        if upload_part is None:
+            raise UploadFormError(f"Missing file field: {file_field}")
+
+        await flush()
+        started_at = time.perf_counter()
+        await asyncio.to_thread(temp_file.close)
+        write_seconds += time.perf_counter() - started_at
+        finished = True
+    finally:
+        if not finished and temp_file is not None:
+            temp_file.close()
+            if os.path.exists(temp_file.name):
+                os.unlink(temp_file.name)
+
+    observe_stage("upload_read", read_seconds)
+    observe_stage("temp_write", write_seconds)
+    logger.info(f"Saved upload to {temp_file.name}: {total_size} bytes")
+    return StreamedUpload(temp_file.name, total_size, hasher.hexdigest(), upload_part.filename,
+                          upload_part.content_type, fields)
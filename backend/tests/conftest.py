@@ -0,0 +1,3 @@
+def pytest_configure(config):
+    # 時間のかかるベンチマーク（pytest -m "not benchmark" で除外できる）
+    config.addinivalue_line("markers", "benchmark: slow benchmark tests")
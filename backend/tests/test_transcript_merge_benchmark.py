@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+区間マージ（TranscriptMerger）の正確さと速度のベンチマーク
+正解の発話列から重なり付きの区間ごとの文字起こしを合成し、マージ結果の重複・欠落・途切れを数える
+APIキーやサーバーは不要
+benchmarkマーカー付き（pytest -m "not benchmark" で除外できる）
+"""
+import os
+import sys
+import time
+import random
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+import numpy as np
+from services.transcript_merge import TranscriptMerger
+
+SYLLABLES = list("あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをん")
+CHARS_PER_SECOND = 7.0
+
+
+def generate_ground_truth(num_segments: int, rng: random.Random):
+    """
+    正解の発話列（重なりなし、発話間に短い無音）を作る
+    """
+    segments = []
+    t = 0.0
+    for _ in range(num_segments):
+        t += rng.uniform(0.1, 1.0)
+        duration = rng.uniform(1.5, 8.0)
+        length = max(3, int(duration * CHARS_PER_SECOND))
+        text = "".join(rng.choice(SYLLABLES) for _ in range(length))
+        segments.append({"start": t, "end": t + duration, "text": text})
+        t += duration
+    return segments
+
+
+def plan_cuts(truth, chunk_seconds: float, pause_ratio: float, rng: random.Random):
+    """
+    切れ目を決める（pause_ratioの割合で無音位置、それ以外は発話の途中で切る）
+    """
+    total = truth[-1]["end"] + 1.0
+    starts = np.array([s["start"] for s in truth])
+    cuts = [0.0]
+    while cuts[-1] + chunk_seconds < total:
+        target = cuts[-1] + chunk_seconds
+        if rng.random() < pause_ratio:
+            # 目標の直前の発話の終わりと次の発話の始まりの間（無音）で切る
+            index = max(1, int(np.searchsorted(starts, target)))
+            cut = (truth[index - 1]["end"] + truth[index]["start"]) / 2 if index < len(truth) else target
+        else:
+            cut = target
+        cuts.append(cut)
+    cuts.append(total)
+    return cuts
+
+
+def build_chunks(truth, cuts, padding: float, noise: float, jitter: float, rng: random.Random):
+    """
+    区間ごとの文字起こし結果を合成する
+    区間の端にかかった発話は見えている長さに応じてテキストも途切れさせ、文字の誤り・時刻の揺れを加える
+    """
+    chunks = []
+    for index in range(len(cuts) - 1):
+        window_start = max(0.0, cuts[index] - padding)
+        window_end = min(cuts[-1], cuts[index + 1] + padding)
+        segments = []
+        for seg in truth:
+            if seg["end"] <= window_start or seg["start"] >= window_end:
+                continue
+            start = max(seg["start"], window_start)
+            end = min(seg["end"], window_end)
+            if end - start < 0.3:
+                continue  # 短すぎる断片は認識されない
+
+            text = seg["text"]
+            duration = seg["end"] - seg["start"]
+            if seg["start"] < window_start:
+                text = text[int(len(text) * (window_start - seg["start"]) / duration):]
+            if seg["end"] > window_end:
+                text = text[:len(text) - int(len(text) * (seg["end"] - window_end) / duration)]
+            text = "".join(rng.choice(SYLLABLES) if rng.random() < noise else c for c in text)
+
+            segments.append({
+                "start": max(0.0, start - window_start + rng.uniform(-jitter, jitter)),
+                "end": end - window_start + rng.uniform(-jitter, jitter),
+                "text": text
+            })
+
+        chunks.append({
+            "index": index,
+            "transcript": {"text": "", "duration": window_end - window_start, "segments": segments},
+            "original_start_time": window_start,
+            "original_end_time": window_end,
+            "cut_start_time": cuts[index],
+            "cut_end_time": cuts[index + 1],
+        })
+    return chunks
+
+
+def evaluate(truth, merged):
+    """
+    マージ結果を正解と突き合わせる（発話の中央時刻で正解の発話に対応付ける）
+    """
+    starts = np.array([s["start"] for s in truth])
+    covered = np.zeros(len(truth))
+    counts = np.zeros(len(truth), dtype=int)
+    for seg in merged:
+        midpoint = (seg["start"] + seg["end"]) / 2
+        index = max(0, int(np.searchsorted(starts, midpoint, side="right")) - 1)
+        counts[index] += 1
+        covered[index] += len(seg["text"])
+
+    lengths = np.array([len(s["text"]) for s in truth])
+    return {
+        "duplicated": int(np.sum(np.maximum(counts - 1, 0))),
+        "lost": int(np.sum(counts == 0)),
+        "truncated": int(np.sum((counts > 0) & (covered < lengths * 0.9))),
+    }
+
+
+def make_merger(align: bool) -> TranscriptMerger:
+    merger = TranscriptMerger()
+    if not align:
+        # 対応付けを無効にし、分割計画の切れ目だけで振り分ける（従来の方式）
+        merger.min_similarity = 2.0
+        merger.min_stitch_chars = 10 ** 9
+    return merger
+
+
+def run_correctness(num_segments: int = 3000, seed: int = 1):
+    print("📊 正確さ（重複・欠落・途切れた発話の数、少ないほど良い）")
+    print(f"  {'条件':<34}{'方式':<10}{'重複':>6}{'欠落':>6}{'途切れ':>6}")
+
+    scenarios = [
+        ("無音で分割・パディング0.5秒", 120.0, 1.0, 0.5),
+        ("70%無音で分割・パディング0.5秒", 120.0, 0.7, 0.5),
+        ("発話途中で分割・パディング0.5秒", 120.0, 0.0, 0.5),
+        ("発話途中で分割・パディング3秒", 120.0, 0.0, 3.0),
+    ]
+    results = {}
+    for name, chunk_seconds, pause_ratio, padding in scenarios:
+        rng = random.Random(seed)
+        truth = generate_ground_truth(num_segments, rng)
+        cuts = plan_cuts(truth, chunk_seconds, pause_ratio, rng)
+        chunks = build_chunks(truth, cuts, padding, noise=0.03, jitter=0.15, rng=rng)
+
+        for label, align in (("切れ目のみ", False), ("対応付け", True)):
+            stats = evaluate(truth, make_merger(align).merge(chunks))
+            results[(name, align)] = stats
+            print(f"  {name:<30}{label:<10}{stats['duplicated']:>6}{stats['lost']:>6}{stats['truncated']:>6}")
+    return results
+
+
+def run_scaling(sizes=(5000, 20000, 50000), seed: int = 2):
+    print("\n⏱️ 速度（発話数に対して線形に増えること）")
+    timings = []
+    for size in sizes:
+        rng = random.Random(seed)
+        truth = generate_ground_truth(size, rng)
+        cuts = plan_cuts(truth, 600.0, 0.7, rng)
+        chunks = build_chunks_fast(truth, cuts, 0.5)
+
+        merger = make_merger(True)
+        started = time.perf_counter()
+        merged = merger.merge(chunks)
+        elapsed = time.perf_counter() - started
+        timings.append(elapsed)
+        print(f"  {size:>6}発話 / {len(chunks):>4}区間: {elapsed*1000:8.1f}ms ({elapsed/size*1e6:.1f}µs/発話, 出力{len(merged)}発話)")
+    return timings
+
+
+def build_chunks_fast(truth, cuts, padding: float):
+    """
+    速度計測用に区間を合成する（二分探索で区間にかかる発話だけを取り出す）
+    """
+    starts = np.array([s["start"] for s in truth])
+    ends = np.array([s["end"] for s in truth])
+    chunks = []
+    for index in range(len(cuts) - 1):
+        window_start = max(0.0, cuts[index] - padding)
+        window_end = min(cuts[-1], cuts[index + 1] + padding)
+        first = int(np.searchsorted(ends, window_start, side="right"))
+        last = int(np.searchsorted(starts, window_end, side="left"))
+        segments = [
+            {
+                "start": max(0.0, s["start"] - window_start),
+                "end": min(s["end"], window_end) - window_start,
+                "text": s["text"]
+            }
+            for s in truth[first:last]
+        ]
+        chunks.append({
+            "index": index,
+            "transcript": {"text": "", "duration": window_end - window_start, "segments": segments},
+            "original_start_time": window_start,
+            "original_end_time": window_end,
+            "cut_start_time": cuts[index],
+            "cut_end_time": cuts[index + 1],
+        })
+    return chunks
+
+
+@pytest.mark.benchmark
+def test_transcript_merge():
+    """
+    対応付けありのマージが切れ目のみの方式より重複・欠落が少なく、発話数に対して線形に動くことを確認
+    """
+    results = run_correctness()
+    for (name, align), stats in results.items():
+        if not align:
+            continue
+        baseline = results[(name, False)]
+        assert stats["duplicated"] + stats["lost"] <= baseline["duplicated"] + baseline["lost"], name
+    # 無音で分割した場合は重複・欠落なし
+    clean = results[("無音で分割・パディング0.5秒", True)]
+    assert clean["duplicated"] == 0 and clean["lost"] == 0
+
+    timings = run_scaling()
+    # 10倍の発話数で処理時間が20倍未満（二乗なら100倍）
+    assert timings[-1] < timings[0] * 20
+    print("\n✅ マージのベンチマーク完了")
+
+
+if __name__ == "__main__":
+    print("🧪 区間マージのベンチマーク開始")
+    print("=" * 60)
+    test_transcript_merge()
+    print("\n🧪 テスト完了")
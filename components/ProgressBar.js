@@ -4,6 +4,7 @@ export default function ProgressBar({ sessionId, isAnalyzing, onComplete }) {
   const [progress, setProgress] = useState(0)
   const [stage, setStage] = useState('')
   const [message, setMessage] = useState('')
+  const [streamedAnalysis, setStreamedAnalysis] = useState('')
   const [websocket, setWebsocket] = useState(null)
 
   useEffect(() => {
@@ -24,6 +25,11 @@ export default function ProgressBar({ sessionId, isAnalyzing, onComplete }) {
           setStage(data.stage)
           setMessage(data.message)
 
+          // 生成中の分析テキストを追記
+          if (data.type === 'analysis_delta') {
+            setStreamedAnalysis((prev) => prev + data.delta)
+          }
+
           // 完了時の処理
           if (data.stage === 'completed' && data.progress === 100) {
             setTimeout(() => {
@@ -59,6 +65,7 @@ export default function ProgressBar({ sessionId, isAnalyzing, onComplete }) {
       setProgress(0)
       setStage('')
       setMessage('')
+      setStreamedAnalysis('')
     }
   }, [isAnalyzing, sessionId])
 
@@ -117,6 +124,9 @@ export default function ProgressBar({ sessionId, isAnalyzing, onComplete }) {
             音声認識処理中... しばらくお待ちください
           </div>
         )}
+        {streamedAnalysis && (
+          <pre className="analysis-stream">{streamedAnalysis}</pre>
+        )}
       </div>
     </div>
   )
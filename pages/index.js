@@ -27,17 +27,23 @@ export default function Home() {
     setAnalysisResult(null)
     setTranscriptionResult(null)
 
-    // セッションIDを生成
-    const newSessionId = `session_${Date.now()}_${Math.random().toString(36).substr(2, 9)}`
-    setSessionId(newSessionId)
+    // 直接バックエンドに送信
+    const backendUrl = process.env.NEXT_PUBLIC_BACKEND_URL || 'http://localhost:8000'
 
     try {
+      // 進捗配信用のセッションIDをバックエンドで発行してもらう
+      const sessionResponse = await fetch(`${backendUrl}/sessions`, { method: 'POST' })
+      if (!sessionResponse.ok) {
+        throw new Error(`セッションの作成に失敗しました: ${sessionResponse.status}`)
+      }
+      const { session_id: newSessionId } = await sessionResponse.json()
+      setSessionId(newSessionId)
+
       const formData = new FormData()
-      formData.append('audio_file', uploadedFile)
+      // session_idはファイルより前に送る（バックエンドはファイルを受信しながら進捗を配信する）
       formData.append('session_id', newSessionId)
+      formData.append('audio_file', uploadedFile)
 
-      // 直接バックエンドに送信
-      const backendUrl = process.env.NEXT_PUBLIC_BACKEND_URL || 'http://localhost:8000'
       const response = await fetch(`${backendUrl}/analyze`, {
         method: 'POST',
         body: formData,
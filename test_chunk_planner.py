@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+分割点の決定（ChunkBoundaryPlanner）のテスト
+最も静かな位置が探索範囲の末尾にあっても、最後の区間がごく短くならないことを確認する
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from pydub import AudioSegment
+from pydub.generators import Sine
+from services.chunk_planner import ChunkBoundaryPlanner
+
+SEGMENT_MS = 60 * 1000
+
+
+class FakeSplitter:
+    """AudioSplitterのうち、分割点の決定に使う部分だけを持つ"""
+
+    def __init__(self, audio: AudioSegment):
+        self.audio = audio
+        self.duration_ms = len(audio)
+
+    def read_window(self, start_ms: int, end_ms: int) -> AudioSegment:
+        return self.audio[start_ms:end_ms]
+
+
+def create_audio(duration_ms: int, pause_at_ms: int) -> AudioSegment:
+    """話し声の代わりの正弦波に、pause_at_msの位置だけ1秒の間を入れる"""
+    tone = Sine(440).to_audio_segment(duration=duration_ms).set_frame_rate(16000).set_channels(1)
+    pause = AudioSegment.silent(duration=1000, frame_rate=16000)
+    return tone[:pause_at_ms - 500] + pause + tone[pause_at_ms + 500:]
+
+
+def test_last_chunk_is_not_tiny():
+    """
+    目標+探索幅のすぐ先で音声が終わる場合も、最後の区間は最小長以上になる
+    """
+    planner = ChunkBoundaryPlanner()
+    planner.tolerance_ms = 15000
+    planner.min_chunk_ms = 10000
+
+    # 目標（60秒）+探索幅（15秒）の位置に間があり、その1.16秒後に音声が終わる
+    pause_at_ms = SEGMENT_MS + planner.tolerance_ms - 500
+    duration_ms = SEGMENT_MS + planner.tolerance_ms + 1160
+    windows = planner.plan(FakeSplitter(create_audio(duration_ms, pause_at_ms)), SEGMENT_MS)
+
+    lengths = [w.cut_end_ms - w.cut_start_ms for w in windows]
+    print(f"📊 区間の長さ: {[round(length / 1000, 2) for length in lengths]}秒")
+    assert len(windows) == 2
+    assert lengths[-1] >= planner.min_chunk_ms, lengths
+    assert lengths[0] <= SEGMENT_MS + planner.tolerance_ms
+    print("✅ 最後の区間は最小長以上です")
+
+
+if __name__ == "__main__":
+    print("🧪 分割点の決定テスト開始")
+    print("=" * 60)
+    test_last_chunk_is_not_tiny()
+    print("\n🧪 テスト完了")
@@ -18,8 +18,8 @@ def test_debug_transcription():
     print(f"📁 テストファイル: {audio_file_path}")
     print(f"📊 ファイルサイズ: {file_size:,} bytes ({file_size/1024/1024:.1f} MB)")
     
-    # セッションIDを生成
-    session_id = f"debug_test_{int(time.time())}"
+    # セッションIDをサーバーで発行（発行していないIDは受け付けられない）
+    session_id = requests.post("http://localhost:8000/sessions").json()["session_id"]
     print(f"🔑 セッションID: {session_id}")
     
     try:
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+文字起こし中にイベントループが止まらないことを確認するテスト
+単一ファイルの経路と、分割・エンコードする大きなファイルの経路（AUDIO_WORKERS=0 / 2）を確認する
+Whisper APIはモックのトランスポートで置き換えるため、APIキーやサーバーは不要
+"""
+import os
+import sys
+import time
+import wave
+import asyncio
+import tempfile
+
+# 同時に実行するWhisper呼び出し数の上限（テスト用に小さくする）
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ["WHISPER_MAX_CONCURRENCY"] = "2"
+os.environ["TRANSCRIPTION_CACHE_ENABLED"] = "false"
+# 大きなファイルの経路: 30秒ごとに分割し、WAVのまま送る（ffmpeg不要）
+os.environ["TRANSCRIPTION_MAX_CHUNK_SECONDS"] = "30"
+os.environ["TRANSCRIPTION_CUT_TOLERANCE_SECONDS"] = "5"
+os.environ["TRANSCRIPTION_SEGMENT_FORMAT"] = "wav"
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+import httpx
+from services.http_clients import http_clients
+from services import asr_backends
+from services.audio_workers import audio_workers
+from services.transcription import TranscriptionService
+
+API_LATENCY = 1.0        # モックAPIの応答時間（秒）
+MAX_ALLOWED_LAG = 0.2    # 許容するイベントループの遅延（秒）
+NUM_REQUESTS = 4         # 同時に投げる文字起こし数
+LARGE_API_LATENCY = 0.3  # 大きなファイルの経路でのモックAPIの応答時間（区間ごと、秒）
+LARGE_NUM_REQUESTS = 2   # 大きなファイルの経路で同時に投げる文字起こし数
+LARGE_FILE_THRESHOLD = 1024 * 1024  # これより大きいファイルを分割させる（テスト用に小さくする）
+
+
+def create_test_wav(path: str, duration_seconds: int = 60):
+    """
+    無音のテスト用WAVファイルを作成（16kHz・モノラル）
+    """
+    with wave.open(path, "wb") as f:
+        f.setnchannels(1)
+        f.setsampwidth(2)
+        f.setframerate(16000)
+        f.writeframes(b"\x00\x00" * 16000 * duration_seconds)
+
+
+async def measure_loop_lag(stop_event: asyncio.Event, lags: list, interval: float = 0.01):
+    """
+    一定間隔でsleepし、予定より遅れて起きた時間（＝ループが止まっていた時間）を記録する
+    """
+    while not stop_event.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - started - interval)
+
+
+async def run_test(audio_file_path: str, num_requests: int = NUM_REQUESTS, api_latency: float = API_LATENCY):
+    state = {"in_flight": 0, "peak": 0}
+
+    async def handler(request):
+        # ネットワーク待ちを模擬する（ループを止めずに待つ）
+        state["in_flight"] += 1
+        state["peak"] = max(state["peak"], state["in_flight"])
+        try:
+            await asyncio.sleep(api_latency)
+            return httpx.Response(200, json={
+                "text": "テスト",
+                "duration": 60.0,
+                "segments": [{"start": 0.0, "end": 1.0, "text": "テスト"}]
+            })
+        finally:
+            state["in_flight"] -= 1
+
+    # 共有HTTPクライアントをモックのトランスポートに差し替える
+    http_clients._http_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    service = TranscriptionService()
+    stop_event = asyncio.Event()
+    lags = []
+    monitor = asyncio.create_task(measure_loop_lag(stop_event, lags))
+
+    started = time.perf_counter()
+    try:
+        results = await asyncio.gather(*[
+            service.transcribe(audio_file_path, f"loop_test_{i}", source_hash=f"hash_{i}")
+            for i in range(num_requests)
+        ])
+    finally:
+        stop_event.set()
+        await monitor
+        await http_clients.shutdown()
+    elapsed = time.perf_counter() - started
+
+    return results, lags, state["peak"], elapsed
+
+
+def test_event_loop_responsiveness():
+    """
+    文字起こし中もイベントループが応答し続け、Whisper呼び出し数が上限内に収まることを確認
+    """
+    with tempfile.TemporaryDirectory() as temp_dir:
+        audio_file_path = os.path.join(temp_dir, "loop_test.wav")
+        create_test_wav(audio_file_path)
+
+        results, lags, peak, elapsed = asyncio.run(run_test(audio_file_path))
+
+    max_lag = max(lags)
+    print(f"📊 文字起こし数: {len(results)}, 所要時間: {elapsed:.2f}秒")
+    print(f"📊 ループ遅延: 最大 {max_lag*1000:.1f}ms ({len(lags)}回計測)")
+    print(f"📊 Whisper同時呼び出し数: 最大 {peak}")
+
+    assert all(r.full_text == "【00:00:00】テスト" for r in results)
+    assert max_lag < MAX_ALLOWED_LAG, f"event loop blocked for {max_lag:.3f}s"
+    assert peak <= 2, f"too many concurrent Whisper calls: {peak}"
+    # 上限2で4件 → 少なくとも2回分の待ち時間がかかる
+    assert elapsed >= API_LATENCY * 2 * 0.9
+    print("✅ イベントループは文字起こし中も応答しています")
+
+
+def run_large_file_test(audio_workers_count: int):
+    """
+    大きなファイルの経路（無音位置での分割→区間のデコード・エンコード→文字起こし）を実行する
+    AUDIO_WORKERS=0ならスレッド、1以上ならワーカープロセスで分割・エンコードする
+    """
+    default_workers = audio_workers.num_workers
+    audio_workers.shutdown()
+    audio_workers.num_workers = audio_workers_count
+    # エンジンのセマフォは最初に待たせたイベントループに結び付くため、asyncio.runごとに作り直す
+    asr_backends._backend_instances.clear()
+    backend = asr_backends.get_asr_backend("openai")
+    backend.max_single_file_size = LARGE_FILE_THRESHOLD
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            audio_file_path = os.path.join(temp_dir, "loop_test_large.wav")
+            create_test_wav(audio_file_path, duration_seconds=120)
+            assert os.path.getsize(audio_file_path) > LARGE_FILE_THRESHOLD
+
+            results, lags, peak, elapsed = asyncio.run(
+                run_test(audio_file_path, LARGE_NUM_REQUESTS, LARGE_API_LATENCY)
+            )
+    finally:
+        asr_backends._backend_instances.clear()
+        audio_workers.shutdown()
+        audio_workers.num_workers = default_workers
+
+    max_lag = max(lags)
+    print(f"📊 [AUDIO_WORKERS={audio_workers_count}] 文字起こし数: {len(results)}, 所要時間: {elapsed:.2f}秒")
+    print(f"📊 [AUDIO_WORKERS={audio_workers_count}] 区間数: {[r.chunk_report.total for r in results]}")
+    print(f"📊 [AUDIO_WORKERS={audio_workers_count}] ループ遅延: 最大 {max_lag*1000:.1f}ms ({len(lags)}回計測)")
+
+    for result in results:
+        # 分割して処理され、全区間が成功している
+        assert result.chunk_report is not None and result.chunk_report.total > 1
+        assert not result.chunk_report.failed
+        assert len(result.segments) > 0
+    assert max_lag < MAX_ALLOWED_LAG, f"event loop blocked for {max_lag:.3f}s"
+    assert peak <= 2, f"too many concurrent Whisper calls: {peak}"
+
+
+def test_event_loop_responsiveness_large_file_threads():
+    """
+    分割・エンコードをスレッドで行う場合（AUDIO_WORKERS=0）もループが応答し続けることを確認
+    """
+    run_large_file_test(0)
+    print("✅ 分割・エンコード中（スレッド）もイベントループは応答しています")
+
+
+def test_event_loop_responsiveness_large_file_processes():
+    """
+    分割・エンコードをワーカープロセスで行う場合（AUDIO_WORKERS=2）もループが応答し続けることを確認
+    """
+    run_large_file_test(2)
+    print("✅ 分割・エンコード中（ワーカープロセス）もイベントループは応答しています")
+
+
+if __name__ == "__main__":
+    print("🧪 イベントループ応答性テスト開始")
+    print("=" * 60)
+    test_event_loop_responsiveness()
+    test_event_loop_responsiveness_large_file_threads()
+    test_event_loop_responsiveness_large_file_processes()
+    print("\n🧪 テスト完了")
@@ -20,8 +20,8 @@ def test_progress_tracking():
     print(f"📁 テストファイル: {audio_file_path}")
     print(f"📊 ファイルサイズ: {os.path.getsize(audio_file_path)} bytes")
     
-    # セッションIDを生成
-    session_id = f"test_session_{int(time.time())}"
+    # セッションIDをサーバーで発行（発行していないIDは受け付けられない）
+    session_id = requests.post("http://localhost:8000/sessions").json()["session_id"]
     print(f"🔑 セッションID: {session_id}")
     
     # WebSocket接続でプログレスを監視
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+進捗の配信バス（プロセス間の配信）のテスト
+Redisの代わりにプロセス内のブローカー（InMemoryBroker）を共有し、2つのProgressManagerを別プロセスに見立てる
+Redisサーバーやredisパッケージは不要
+"""
+import os
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+import orjson
+from services.progress_manager import ProgressManager
+from services.progress_bus import BrokerBus
+from services.job_manager import JobManager
+from models.schemas import AnalysisResponse, TranscriptionResult
+
+
+class InMemoryBroker:
+    """
+    Redisの代わりに使うプロセス内のブローカー
+    BrokerBusが使う操作（TTL付きのset・get・exists・publish・pubsub）だけをRedisと同じ形で持つ
+    """
+
+    def __init__(self):
+        self._values = {}  # キー → (bytes, 期限のmonotonic時刻 or None)
+        self._subscribers = {}  # チャンネル → 購読中のpubsub
+
+    def pubsub(self) -> "_InMemoryPubSub":
+        return _InMemoryPubSub(self)
+
+    def _live_value(self, key: str):
+        entry = self._values.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and time.monotonic() >= expires_at:
+            del self._values[key]
+            return None
+        return value
+
+    async def set(self, key: str, value, ex: int = None):
+        if isinstance(value, str):
+            value = value.encode()
+        self._values[key] = (value, time.monotonic() + ex if ex else None)
+
+    async def get(self, key: str):
+        return self._live_value(key)
+
+    async def exists(self, *keys) -> int:
+        return sum(1 for key in keys if self._live_value(key) is not None)
+
+    async def publish(self, channel: str, message) -> int:
+        subscribers = list(self._subscribers.get(channel, ()))
+        for pubsub in subscribers:
+            pubsub.messages.put_nowait({"type": "message", "channel": channel, "data": message})
+        return len(subscribers)
+
+    async def aclose(self):
+        pass
+
+
+class _InMemoryPubSub:
+    def __init__(self, broker: InMemoryBroker):
+        self.broker = broker
+        self.messages = asyncio.Queue()
+
+    async def subscribe(self, channel: str):
+        self.broker._subscribers.setdefault(channel, set()).add(self)
+        self.messages.put_nowait({"type": "subscribe", "channel": channel, "data": 1})
+
+    async def unsubscribe(self, channel: str):
+        self.broker._subscribers.get(channel, set()).discard(self)
+
+    async def listen(self):
+        while True:
+            yield await self.messages.get()
+
+    async def aclose(self):
+        pass
+
+
+class InMemoryBrokerBus(BrokerBus):
+    """
+    InMemoryBrokerを共有するバス（同じプロセス内の複数のProgressManagerを別プロセスに見立てる）
+    """
+
+    name = "in_memory_broker"
+
+    def __init__(self, broker: InMemoryBroker, **kwargs):
+        super().__init__(**kwargs)
+        self.broker = broker
+
+    async def _connect(self):
+        return self.broker
+
+
+class FakeWebSocket:
+    """送信されたフレームを記録するWebSocket"""
+
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, text: str):
+        self.sent.append(orjson.loads(text))
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+async def settle():
+    # 送信タスク・受信タスク・接続ごとの送信タスクを一巡させる
+    for _ in range(5):
+        await asyncio.sleep(0.01)
+
+
+async def run_test():
+    broker = InMemoryBroker()
+    worker_a, worker_b = ProgressManager(), ProgressManager()
+    await worker_a.start(InMemoryBrokerBus(broker))
+    await worker_b.start(InMemoryBrokerBus(broker))
+    late_worker = None
+
+    try:
+        # ワーカーAで発行したセッションIDは、発行直後からワーカーBでも発行済みとして扱われる
+        session_id = await worker_a.create_session()
+        assert await worker_b.has_session(session_id)
+        assert not await worker_b.has_session("session_1")
+
+        socket_a, socket_b = FakeWebSocket(), FakeWebSocket()
+        await worker_a.add_connection(session_id, socket_a)
+        await worker_b.add_connection(session_id, socket_b)
+
+        # ワーカーAで進めたジョブの進捗と差分が、ワーカーBの接続にも届く
+        await worker_a.update_progress(session_id, "transcribing", 40, "文字起こし中")
+        await worker_a.send_analysis_delta(session_id, "分析")
+        await settle()
+
+        # 自分が送ったメッセージはブローカーから受け取り直さない（ワーカーAの接続には1回ずつだけ届く）
+        assert [f.get("type", f["stage"]) for f in socket_a.sent] == ["transcribing", "analysis_delta"], socket_a.sent
+        assert [f.get("type", f["stage"]) for f in socket_b.sent] == ["transcribing", "analysis_delta"], socket_b.sent
+        assert socket_b.sent[0]["progress"] == 40
+        assert socket_b.sent[1]["delta"] == "分析"
+        # 他のワーカーの進捗は最新状態としても保持される
+        assert worker_b.get_progress(session_id)["progress"] == 40
+
+        await worker_a.update_progress(session_id, "analysis", 80, "AI分析を開始...")
+        await settle()
+
+        # 後から起動したワーカーに接続したクライアントにも、最新の進捗がすぐに届く
+        late_worker = ProgressManager()
+        await late_worker.start(InMemoryBrokerBus(broker))
+        assert await late_worker.has_session(session_id)
+        late_socket = FakeWebSocket()
+        await late_worker.add_connection(session_id, late_socket)
+        await settle()
+        assert [f["progress"] for f in late_socket.sent] == [80], late_socket.sent
+
+        return socket_a.sent, socket_b.sent, late_socket.sent
+    finally:
+        for manager in (worker_a, worker_b, late_worker):
+            if manager is not None:
+                await manager.stop()
+
+
+async def run_job_test():
+    broker = InMemoryBroker()
+    bus_a, bus_b = InMemoryBrokerBus(broker), InMemoryBrokerBus(broker)
+    await bus_a.start(lambda *args: None)
+    await bus_b.start(lambda *args: None)
+
+    async def pipeline(audio_file_path, session_id, source_hash, asr_backend=None):
+        return AnalysisResponse(
+            success=True, analysis="分析結果",
+            transcription=TranscriptionResult(segments=[{"start": 0.0, "end": 1.5, "text": "こんにちは"}]),
+            full_transcription="こんにちは"
+        )
+
+    # ワーカーAで受け付けたジョブの状態と結果を、ワーカーBから取得する
+    jobs_a, jobs_b = JobManager(pipeline), JobManager(pipeline)
+    await jobs_a.start(bus_a)
+    await jobs_b.start(bus_b)
+    try:
+        job = await jobs_a.submit(None, "hash", "a.mp3")
+        queued = await jobs_b.get(job.job_id)
+        assert queued is not None and queued.status in ("queued", "running"), queued
+
+        await jobs_a.queue.join()
+        await settle()
+        finished = await jobs_b.get(job.job_id)
+        assert finished.status == "completed", finished.status
+        assert finished.result.analysis == "分析結果"
+        assert finished.result.transcription.segments.to_list() == [{"start": 0.0, "end": 1.5, "text": "こんにちは"}]
+        assert await jobs_b.get("unknown") is None
+        return finished
+    finally:
+        await jobs_a.stop()
+        await jobs_b.stop()
+        await bus_a.stop()
+        await bus_b.stop()
+
+
+def test_progress_bus_cross_worker_delivery():
+    """
+    別のワーカーへの配信・自分のメッセージの除外・後から接続したクライアントへの最新状態の送信を確認
+    """
+    sent_a, sent_b, sent_late = asyncio.run(run_test())
+    print(f"📊 ワーカーAの接続: {len(sent_a)}フレーム, ワーカーBの接続: {len(sent_b)}フレーム")
+    print(f"📊 後から接続したクライアント: {sent_late[0]['stage']} {sent_late[0]['progress']}%")
+    print("✅ 進捗は全ワーカーの接続に1回ずつ届いています")
+
+
+def test_job_state_shared_across_workers():
+    """
+    別のワーカーで受け付けたジョブの状態と結果を取得できることを確認
+    """
+    job = asyncio.run(run_job_test())
+    print(f"📊 別のワーカーから取得したジョブ: {job.job_id} ({job.status})")
+    print("✅ ジョブの状態と結果は全ワーカーで共有されています")
+
+
+if __name__ == "__main__":
+    print("🧪 進捗配信バステスト開始")
+    print("=" * 60)
+    test_progress_bus_cross_worker_delivery()
+    test_job_state_shared_across_workers()
+    print("\n🧪 テスト完了")